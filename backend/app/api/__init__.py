@@ -1,8 +1,10 @@
 from fastapi import APIRouter
-from app.api.endpoints import stock_data, ai_analysis
+from app.api.endpoints import stock_data, ai_analysis, screening, market
 
 router = APIRouter()
 
 # 注册路由
 router.include_router(stock_data.router, prefix="/stock", tags=["stock"])
 router.include_router(ai_analysis.router, prefix="/ai", tags=["ai"])
+router.include_router(screening.router, prefix="/screening", tags=["screening"])
+router.include_router(market.router, prefix="/market", tags=["market"])
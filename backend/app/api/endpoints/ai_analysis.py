@@ -62,12 +62,12 @@ def analyze_stock(
             # 获取股票历史数据
             try:
                 logger.info("步骤3: 开始获取股票历史数据")
-                stock_history = stock_data_service.get_stock_history(
+                history_data, _ = stock_data_service.get_stock_ohlcv(
                     symbol=request.symbol,
                     start_date=request.start_date,
                     end_date=request.end_date
                 )
-                logger.info(f"步骤3: 股票历史数据获取成功，共{len(stock_history.get('data', []))}条")
+                logger.info(f"步骤3: 股票历史数据获取成功，共{len(history_data)}条")
             except ValueError as e:
                 # 处理股票数据不存在的情况
                 logger.error(f"步骤3: 股票数据不存在: {e}")
@@ -78,8 +78,7 @@ def analyze_stock(
                 raise HTTPException(status_code=500, detail=f"获取股票数据失败: {str(e)}")
 
             # 获取股票特征
-            features = stock_history.get("features", {})
-            history_data = stock_history.get("data", [])
+            features = stock_data_service.get_latest_features(request.symbol, history_data) if len(history_data) else {}
         
         # 步骤4: AI分析股票
         try:
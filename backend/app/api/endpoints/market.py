@@ -0,0 +1,55 @@
+from fastapi import APIRouter, HTTPException, Query
+from app.services.market_analytics_service import MarketAnalyticsService
+from app.services.symbol_universe import MARKETS
+
+router = APIRouter()
+analytics_service = MarketAnalyticsService()
+
+def _check_market(market: str):
+    if market not in MARKETS:
+        raise HTTPException(status_code=400, detail=f"market 仅支持 {'、'.join(MARKETS)}")
+
+@router.get("/panel")
+def get_panel_info(
+    market: str = Query("cn", description="市场类型：cn（A股）、hk（港股）、us（美股）")
+):
+    """获取全市场面板（股票×交易日）的版本、规模与日期范围"""
+    _check_market(market)
+    try:
+        return analytics_service.panel_info(market)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@router.post("/panel/build", status_code=202)
+def build_panel(
+    market: str = Query("cn", description="市场类型：cn（A股）、hk（港股）、us（美股）")
+):
+    """在后台构建全市场面板（逐只读取本地历史数据并补齐缺口）"""
+    _check_market(market)
+    return {"market": market, "started": analytics_service.build_panel(market)}
+
+@router.get("/returns")
+def get_market_returns(
+    market: str = Query("cn", description="市场类型：cn（A股）、hk（港股）、us（美股）"),
+    days: int = Query(20, ge=1, le=250, description="统计最近多少个交易日的涨跌幅"),
+    top: int = Query(20, ge=1, le=500, description="涨幅、跌幅各返回多少只股票"),
+    end_date: str = Query(None, description="截止日期，格式：YYYY-MM-DD，默认为面板最后一个交易日"),
+):
+    """全市场涨跌幅排行"""
+    _check_market(market)
+    try:
+        return analytics_service.returns(market, days, top, end_date)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@router.get("/breadth")
+def get_market_breadth(
+    market: str = Query("cn", description="市场类型：cn（A股）、hk（港股）、us（美股）"),
+    days: int = Query(20, ge=1, le=250, description="最近多少个交易日"),
+):
+    """每日上涨/下跌家数及站上20日均线的股票比例"""
+    _check_market(market)
+    try:
+        return analytics_service.breadth(market, days)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
@@ -13,6 +13,8 @@ def rule_screening(
     try:
         result = screening_service.rule_based_screening(request)
         return result
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
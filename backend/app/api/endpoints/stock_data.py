@@ -1,33 +1,122 @@
-from fastapi import APIRouter, HTTPException, Query
+import json
+from fastapi import APIRouter, Body, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from app.core.config import settings
 from app.services.stock_data_service import StockDataService
-from app.schemas.stock import StockHistoryResponse, StockBasicResponse
+from app.services.history_downsample import RESOLUTIONS
+from app.services.symbol_universe import MARKETS
+from app.services.provider_health import ProviderUnavailable
+from app.services.adjustment import normalize_adjust
+from app.services.history_formats import (
+    ARROW_STREAM_MEDIA_TYPE, META_FIELDS, MSGPACK_MEDIA_TYPES,
+    UnsupportedFormat, encode_arrow, encode_msgpack, json_safe, negotiate_binary_format
+)
+from app.schemas.stock import StockHistoryResponse, StockHistoryBatchRequest, StockBasicResponse
 
 router = APIRouter()
 stock_service = StockDataService()
 
 @router.get("/history", response_model=StockHistoryResponse)
 def get_stock_history(
+    request: Request,
     symbol: str = Query(..., description="股票代码，如：sh600000"),
     start_date: str = Query(None, description="开始日期，格式：YYYY-MM-DD"),
     end_date: str = Query(None, description="结束日期，格式：YYYY-MM-DD"),
-    adjust: str = Query("qfq", description="复权类型：qfq（前复权）、hfq（后复权）、None（不复权）")
+    adjust: str = Query("qfq", description="复权类型：qfq（前复权）、hfq（后复权）、None（不复权）"),
+    include_feature_series: bool = Query(False, description="是否返回完整的特征时间序列"),
+    format: str = Query("records", description="JSON数据格式：records（每根K线一个对象）、columnar（每个字段一个数组）"),
+    max_points: int = Query(None, ge=2, description="最多返回的K线数量，超出时降采样"),
+    resolution: str = Query("auto", description="K线周期：auto（按 max_points 自动选择）、day、week、month、quarter、year、lttb"),
 ):
-    """获取股票历史K线数据"""
+    """获取股票历史K线数据
+    
+    通过 Accept 请求头可协商二进制格式：application/vnd.apache.arrow.stream（Arrow IPC）、
+    application/msgpack（MessagePack），二者都直接由列数据生成，并包含最新特征及按需返回的特征时间序列。
+    """
+    binary_format = negotiate_binary_format(request.headers.get("accept"))
+    if format not in ("records", "columnar"):
+        raise HTTPException(status_code=400, detail="format 仅支持 records 或 columnar")
+    if resolution not in RESOLUTIONS:
+        raise HTTPException(status_code=400, detail=f"resolution 仅支持 {'、'.join(RESOLUTIONS)}")
+    if resolution == "lttb" and not max_points:
+        raise HTTPException(status_code=400, detail="resolution=lttb 时需要指定 max_points")
+    try:
+        normalize_adjust(adjust)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     try:
         data = stock_service.get_stock_history(
             symbol=symbol,
             start_date=start_date,
             end_date=end_date,
-            adjust=adjust
+            adjust=adjust,
+            include_feature_series=include_feature_series,
+            data_format="frame" if binary_format else format,
+            max_points=max_points,
+            resolution=resolution
         )
+        if binary_format == "arrow":
+            return Response(encode_arrow(data), media_type=ARROW_STREAM_MEDIA_TYPE)
+        if binary_format == "msgpack":
+            return Response(encode_msgpack(data), media_type=MSGPACK_MEDIA_TYPES[0])
+        if format == "columnar":
+            # 列式数据不经过逐条的响应模型校验
+            content = {field: data[field] for field in META_FIELDS}
+            content["data"] = data["data"]
+            if include_feature_series:
+                content["feature_series"] = data["feature_series"]
+            return JSONResponse(content)
         return data
+    except UnsupportedFormat as e:
+        # 二进制格式所需的可选依赖未安装
+        raise HTTPException(status_code=406, detail=str(e))
     except ValueError as e:
         # 处理股票数据不存在的情况，返回404状态码
         raise HTTPException(status_code=404, detail=str(e))
+    except TimeoutError as e:
+        # 数据源超时且没有本地缓存，返回504状态码
+        raise HTTPException(status_code=504, detail=str(e))
+    except ProviderUnavailable as e:
+        # 数据源熔断或限流中且没有本地缓存，返回503状态码
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         # 处理其他异常，返回500状态码
         raise HTTPException(status_code=500, detail=f"获取股票数据失败: {str(e)}")
 
+@router.post("/history/batch")
+def get_stock_history_batch(
+    request: StockHistoryBatchRequest = Body(..., description="批量历史数据请求")
+):
+    """批量获取股票历史K线数据，每只股票就绪后立即以一行NDJSON返回"""
+    if len(request.symbols) > settings.HISTORY_BATCH_MAX_SYMBOLS:
+        raise HTTPException(status_code=400, detail=f"单次最多请求 {settings.HISTORY_BATCH_MAX_SYMBOLS} 只股票")
+    try:
+        normalize_adjust(request.adjust)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    def generate():
+        for symbol, result, error in stock_service.iter_stock_history_batch(
+            request.symbols, request.start_date, request.end_date, request.adjust
+        ):
+            if error is None:
+                line = {"symbol": symbol, "status": "ok", **result}
+            else:
+                # 与单只股票接口保持一致的状态码
+                if isinstance(error, ValueError):
+                    status_code = 404
+                elif isinstance(error, TimeoutError):
+                    status_code = 504
+                elif isinstance(error, ProviderUnavailable):
+                    status_code = 503
+                else:
+                    status_code = 500
+                line = {"symbol": symbol, "status": "error", "status_code": status_code, "detail": str(error)}
+            # 未定义的特征值（NaN）输出为 null，保证每一行都是严格合法的JSON
+            yield json.dumps(json_safe(line), ensure_ascii=False, allow_nan=False, default=str) + "\n"
+    
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
 @router.get("/basic", response_model=StockBasicResponse)
 def get_stock_basic(
     symbol: str = Query(..., description="股票代码，如：sh600000")
@@ -41,11 +130,56 @@ def get_stock_basic(
 
 @router.get("/symbols")
 def get_stock_symbols(
-    market: str = Query("cn", description="市场类型：cn（A股）、hk（港股）、us（美股）")
+    market: str = Query("cn", description="市场类型：cn（A股）、hk（港股）、us（美股）"),
+    exchange: str = Query(None, description="交易所：sh、sz、bj（A股）"),
+    board: str = Query(None, description="板块：main（主板）、star（科创板）、chinext（创业板）、bse（北交所）"),
+    industry: str = Query(None, description="行业名称"),
+    keyword: str = Query(None, description="按代码或名称模糊匹配"),
+    page: int = Query(1, ge=1, description="页码，从1开始"),
+    page_size: int = Query(200, ge=1, le=10000, description="每页数量")
 ):
-    """获取股票代码列表"""
+    """获取股票代码列表（读取本地索引，按条件过滤并分页）"""
+    if market not in MARKETS:
+        raise HTTPException(status_code=400, detail=f"market 仅支持 {'、'.join(MARKETS)}")
     try:
-        symbols = stock_service.get_stock_symbols(market=market)
-        return {"symbols": symbols}
+        result = stock_service.query_stock_symbols(
+            market=market, exchange=exchange, board=board, industry=industry, keyword=keyword,
+            offset=(page - 1) * page_size, limit=page_size
+        )
+        return {
+            "symbols": [item["symbol"] for item in result["items"]],
+            "items": result["items"],
+            "total": result["total"],
+            "page": page,
+            "page_size": page_size,
+            "refreshed_on": result["refreshed_on"],
+        }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/history/gaps")
+def get_stock_history_gaps(
+    symbol: str = Query(..., description="股票代码，如：sh600000"),
+    start_date: str = Query(None, description="开始日期，格式：YYYY-MM-DD"),
+    end_date: str = Query(None, description="结束日期，格式：YYYY-MM-DD"),
+):
+    """按交易日历检查本地K线是否为最新，以及缺少K线的交易日（不请求上游）"""
+    try:
+        return stock_service.get_history_gaps(symbol, start_date, end_date)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@router.get("/cache/stats")
+def get_cache_stats():
+    """获取K线缓存统计信息"""
+    return stock_service.get_cache_stats()
+
+@router.get("/fetch/stats")
+def get_fetch_stats():
+    """获取上游抓取执行器的队列与并发统计"""
+    return stock_service.get_fetch_stats()
+
+@router.get("/providers/health")
+def get_provider_health():
+    """获取各数据源最近的延迟、错误率与熔断状态"""
+    return stock_service.get_provider_health()
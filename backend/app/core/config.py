@@ -1,4 +1,5 @@
-from typing import List, Union
+import os
+from typing import Dict, List, Union
 from pydantic_settings import BaseSettings
 from pydantic import validator
 
@@ -25,6 +26,74 @@ class Settings(BaseSettings):
     DEFAULT_STOCK_SYMBOLS: List[str] = ["sh600000", "sh600036", "sz000001", "sz000858"]
     DEFAULT_HISTORY_DAYS: int = 180
     
+    # 本地数据目录（历史K线存储等）
+    DATA_DIR: str = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "data")
+    # 当天K线可能尚未收盘，超过该秒数后重新获取尾部数据
+    HISTORY_TAIL_REFRESH_SECONDS: int = 300
+    # 各市场收盘时间（交易所所在时区）；最后一根K线在收盘（加上数据源结算延迟）之前获取时视为未收盘
+    MARKET_CLOSE_TIMES: Dict[str, str] = {"cn": "15:00", "hk": "16:10", "us": "16:00"}
+    MARKET_CLOSE_SETTLE_SECONDS: int = 900
+    # 进程内K线缓存的内存预算（字节）与有效期（秒）
+    HISTORY_CACHE_MAX_BYTES: int = 256 * 1024 * 1024
+    HISTORY_CACHE_TTL_SECONDS: int = 3600
+    # 代码解析结果（数据源+规范代码）的有效期，过期后重新遍历回退链
+    SYMBOL_RESOLUTION_TTL_SECONDS: int = 7 * 24 * 3600
+    # 股票列表索引是否按行业板块成分股补充行业（每个交易日刷新一次）
+    SYMBOL_UNIVERSE_INDUSTRY_ENABLED: bool = True
+    # 股票基本信息表的定时刷新间隔（秒）及包含的市场
+    STOCK_METADATA_REFRESH_SECONDS: int = 24 * 3600
+    STOCK_METADATA_MARKETS: List[str] = ["cn", "hk", "us"]
+    # 交易日历（A股为新浪交易日历，港股/美股需安装 exchange_calendars）的更新间隔（天）
+    TRADING_CALENDAR_REFRESH_DAYS: int = 30
+    # 全市场行情快照的复用时间（秒），规则筛选只依赖最新K线时使用快照
+    SPOT_SNAPSHOT_TTL_SECONDS: int = 60
+    
+    # 上游抓取配置：单次请求截止时间、后台刷新截止时间、共享线程池大小、各数据源最大并发
+    HISTORY_FETCH_TIMEOUT: float = 15.0
+    HISTORY_REFRESH_TIMEOUT: float = 60.0
+    FETCH_EXECUTOR_WORKERS: int = 16
+    FETCH_SOURCE_CONCURRENCY: Dict[str, int] = {"efinance": 4, "akshare": 4, "yfinance": 2}
+    # A股对冲请求：主数据源超过该秒数（约为其p95延迟）未返回时，同时请求备用数据源
+    HISTORY_HEDGE_ENABLED: bool = False
+    HISTORY_HEDGE_DELAY: float = 3.0
+    # 各数据源的限流（每秒请求数）与突发容量；连续失败达到阈值后熔断，冷却秒数后放行一次试探
+    PROVIDER_RATE_LIMITS: Dict[str, float] = {"efinance": 5.0, "akshare": 3.0, "yfinance": 2.0}
+    PROVIDER_RATE_BURST: float = 5.0
+    PROVIDER_BREAKER_FAILURE_THRESHOLD: int = 5
+    PROVIDER_BREAKER_OPEN_SECONDS: float = 60.0
+    # 数据源健康统计保留的最近请求数
+    PROVIDER_HEALTH_WINDOW: int = 100
+    # 按“数据源+市场”统计延迟与成功率的时间窗口（秒），以及参与动态排序所需的最少样本数
+    PROVIDER_STATS_WINDOW_SECONDS: float = 1800.0
+    PROVIDER_RANK_MIN_SAMPLES: int = 5
+    # 数据源模式：live（真实上游）、record（请求上游并录制响应）、replay（回放录制的响应）、synthetic（按种子生成模拟数据）
+    DATA_PROVIDER_MODE: str = "live"
+    # 录制文件目录，默认为 DATA_DIR/recordings
+    PROVIDER_RECORDINGS_DIR: str = ""
+    # 回放/模拟模式的随机种子，以及按数据源注入的延迟（秒，中位数）与失败率
+    PROVIDER_SEED: int = 0
+    PROVIDER_INJECTED_LATENCY: Dict[str, float] = {}
+    PROVIDER_INJECTED_FAILURE_RATE: Dict[str, float] = {}
+    # 模拟模式：每个市场的股票数量与K线起始日期
+    SYNTHETIC_UNIVERSE_SIZE: int = 500
+    SYNTHETIC_HISTORY_START: str = "2010-01-04"
+    # 批量历史数据接口：并行获取的股票数与单次请求的股票数上限
+    HISTORY_BATCH_CONCURRENCY: int = 8
+    HISTORY_BATCH_MAX_SYMBOLS: int = 500
+    # 筛选时并行获取历史数据的股票数（各数据源的并发与限流仍由 FETCH_SOURCE_CONCURRENCY、PROVIDER_RATE_LIMITS 控制）
+    SCREENING_FETCH_CONCURRENCY: int = 8
+    # 规则筛选逐只读取历史数据时单次请求的股票数上限（全市场请用面板）
+    SCREENING_HISTORY_MAX_SYMBOLS: int = 300
+    
+    # 全市场面板（股票×交易日，前复权）：回看交易日数、当天收盘后（该时间之后）才包含当天
+    PANEL_LOOKBACK_DAYS: int = 250
+    PANEL_BUILD_AFTER: str = "15:30"
+    # 是否在启动后定时构建面板（需要逐只获取全市场历史数据）、包含的市场、检查间隔与构建锁超时（秒）
+    PANEL_SCHEDULE_ENABLED: bool = False
+    PANEL_MARKETS: List[str] = ["cn"]
+    PANEL_CHECK_INTERVAL_SECONDS: int = 600
+    PANEL_BUILD_TIMEOUT_SECONDS: int = 6 * 3600
+    
     # 服务器配置
     PORT: int = 8000
     HOST: str = "0.0.0.0"
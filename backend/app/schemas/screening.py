@@ -3,8 +3,8 @@ from typing import List, Optional
 
 class ScreeningRule(BaseModel):
     """筛选规则"""
-    indicator: str = Field(..., description="指标名称: close|volume|turnover|high|low|open")
-    operator: str = Field(..., description="操作符: >|<|>=|<=|==")
+    indicator: str = Field(..., description="指标：K线字段（close|volume|turnover|high|low|open）、特征名（如 volume_ratio、consolidation_days）或数值表达式（如 ma(close, 5)、ret(20)）")
+    operator: str = Field(..., description="操作符: >|<|>=|<=|==|!=")
     value: float = Field(..., description="指标值")
 
 class RuleScreeningRequest(BaseModel):
@@ -12,7 +12,8 @@ class RuleScreeningRequest(BaseModel):
     symbols: Optional[List[str]] = Field(None, description="股票代码列表，为空则使用默认列表")
     start_date: str = Field(..., description="开始日期，格式：YYYY-MM-DD")
     end_date: str = Field(..., description="结束日期，格式：YYYY-MM-DD")
-    rules: List[ScreeningRule] = Field(..., description="筛选规则列表")
+    rules: List[ScreeningRule] = Field(default_factory=list, description="筛选规则列表，各规则同时成立")
+    expression: Optional[str] = Field(None, description="条件表达式，与规则同时成立，支持 and/or/not 分组，如：cross_above(ma(close, 5), ma(close, 20)) and (ret(20) > 10 or volume_ratio > 2)")
     market: str = Field(..., description="股票市场，如：cn, hk, us")
     exchange: Optional[str] = Field(None, description="证券交易所，如：sh, sz, hkex, nasdaq")
 
@@ -28,6 +29,8 @@ class RuleScreeningResponse(BaseModel):
     total: int
     stocks: List[MatchedStock]
     request: dict
+    mode: str = Field("history", description="数据来源：snapshot（全市场行情快照）、panel（全市场面板）、history（逐只历史数据）")
+    stats: Optional[dict] = Field(None, description="筛选统计：股票池数量、匹配数量及数据读取、规则计算耗时（毫秒）")
 
 class AIScreeningRequest(BaseModel):
     """AI筛选请求"""
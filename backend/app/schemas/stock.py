@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 
 class StockDataItem(BaseModel):
     """股票数据项"""
@@ -17,7 +17,17 @@ class StockHistoryResponse(BaseModel):
     start_date: Optional[str] = None
     end_date: Optional[str] = None
     adjust: str
+    resolution: str = Field("day", description="K线周期：day、week、month、quarter、year，或 lttb（按收盘价选点的日K线）")
     data: List[StockDataItem]
+    stale: bool = Field(False, description="上游超时时返回的本地缓存数据，正在后台刷新")
+    feature_series: Optional[Dict[str, List[Any]]] = Field(None, description="特征时间序列（列式），按需返回")
+
+class StockHistoryBatchRequest(BaseModel):
+    """批量股票历史数据请求"""
+    symbols: List[str] = Field(..., description="股票代码列表")
+    start_date: Optional[str] = Field(None, description="开始日期，格式：YYYY-MM-DD")
+    end_date: Optional[str] = Field(None, description="结束日期，格式：YYYY-MM-DD")
+    adjust: str = Field("qfq", description="复权类型：qfq（前复权）、hfq（后复权）、None（不复权）")
 
 class StockBasicResponse(BaseModel):
     """股票基本信息响应"""
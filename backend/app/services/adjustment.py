@@ -0,0 +1,93 @@
+from typing import Optional
+
+import numpy as np
+
+from app.services.ohlcv import OHLCVSeries
+
+# 支持的复权类型：qfq（前复权）、hfq（后复权）、空字符串（不复权）
+ADJUST_TYPES = ("qfq", "hfq", "")
+# 数据源提供的“前收盘”参考价（除权除息日为除权后的参考价），用于识别除权除息
+PREV_CLOSE_COLUMN = "前收盘"
+# 参考价与上一交易日收盘价相差超过该值（元）时视为除权除息，低于报价精度的差异忽略
+EVENT_TOLERANCE = 0.005
+
+
+def normalize_adjust(adjust: Optional[str]) -> str:
+    """统一复权类型写法：None、空字符串、none 均表示不复权"""
+    value = (adjust or "").strip().lower()
+    if value in ("", "none"):
+        return ""
+    if value not in ADJUST_TYPES:
+        raise ValueError(f"不支持的复权类型: {adjust}，可选 qfq、hfq、None")
+    return value
+
+
+class AdjustmentFactors:
+    """除权除息事件表：每个除权除息日一个比例（当日前收盘参考价 / 上一交易日实际收盘价）
+
+    本地只保存不复权K线，前复权与后复权价格在读取时由该表按日期向量化计算。
+    """
+    __slots__ = ("dates", "ratios")
+
+    def __init__(self, dates, ratios):
+        self.dates = np.asarray(dates, dtype=np.int32)
+        self.ratios = np.asarray(ratios, dtype=np.float64)
+
+    @classmethod
+    def empty(cls) -> "AdjustmentFactors":
+        return cls([], [])
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    @classmethod
+    def detect(cls, series: OHLCVSeries, dates: np.ndarray, prev_close: np.ndarray) -> "AdjustmentFactors":
+        """根据新获取K线的前收盘参考价识别除权除息
+
+        series 为合并后的完整不复权K线，dates/prev_close 为新获取K线的日期及其前收盘参考价。
+        """
+        positions = np.searchsorted(series.dates, dates)
+        valid = (positions > 0) & (positions < len(series)) & ~np.isnan(prev_close)
+        valid[valid] &= series.dates[positions[valid]] == dates[valid]
+        positions, prev_close = positions[valid], prev_close[valid]
+        actual = series.close[positions - 1]
+        changed = (np.abs(prev_close - actual) > EVENT_TOLERANCE) & (actual > 0) & (prev_close > 0)
+        return cls(series.dates[positions[changed]], prev_close[changed] / actual[changed])
+
+    @staticmethod
+    def merge(old: "AdjustmentFactors", new: "AdjustmentFactors", start_date: int, end_date: int) -> "AdjustmentFactors":
+        """合并事件表：新获取区间 [start_date, end_date] 内以新识别的事件为准"""
+        keep = (old.dates < start_date) | (old.dates > end_date)
+        dates = np.concatenate([old.dates[keep], new.dates])
+        ratios = np.concatenate([old.ratios[keep], new.ratios])
+        order = np.argsort(dates, kind="stable")
+        return AdjustmentFactors(dates[order], ratios[order])
+
+    def multipliers(self, dates: np.ndarray, adjust: str) -> Optional[np.ndarray]:
+        """各K线价格的复权乘数，不需要调整时返回None
+
+        前复权：乘以该K线之后所有事件比例之积（最新价格不变）；
+        后复权：除以该K线及之前所有事件比例之积（最早价格不变）。
+        """
+        if not adjust or not len(self):
+            return None
+        cumulative = np.concatenate(([1.0], np.cumprod(self.ratios)))
+        applied = cumulative[np.searchsorted(self.dates, dates, side="right")]
+        if adjust == "qfq":
+            return cumulative[-1] / applied
+        return 1.0 / applied
+
+    def apply(self, series: OHLCVSeries, adjust: str) -> OHLCVSeries:
+        """返回复权后的K线；成交量与换手率不调整"""
+        factor = self.multipliers(series.dates, adjust)
+        if factor is None:
+            return series
+        return OHLCVSeries(
+            series.dates,
+            np.round(series.open * factor, 4),
+            np.round(series.high * factor, 4),
+            np.round(series.low * factor, 4),
+            np.round(series.close * factor, 4),
+            series.volume,
+            series.turnover,
+        )
@@ -1,9 +1,10 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Union
 import json
 import os
 import logging
 from langchain_openai import ChatOpenAI
 from app.core.config import settings
+from app.services.ohlcv import OHLCVSeries
 
 # 配置日志记录
 logging.basicConfig(level=logging.DEBUG, 
@@ -202,10 +203,10 @@ class AIAnalysisService:
             traceback.print_exc()
             return f"AI模型调用失败: {str(llm_error)}. 无法获取完整分析结果。"
     
-    def analyze_stock(self, symbol: str, features: Dict[str, Any], history_data: List[Dict[str, Any]], user_conditions: str, ai_config: Dict[str, Any] = None) -> Dict[str, Any]:
+    def analyze_stock(self, symbol: str, features: Dict[str, Any], history_data: Union[OHLCVSeries, List[Dict[str, Any]]], user_conditions: str, ai_config: Dict[str, Any] = None) -> Dict[str, Any]:
         """AI分析单只股票，基于特征和历史数据"""
         # 获取最近10天的历史数据，避免数据量过大
-        recent_history = history_data[-10:] if len(history_data) > 10 else history_data
+        recent_history = OHLCVSeries.coerce(history_data).tail(10).to_records()
         
         # 使用传入的AI配置或默认配置
         current_ai_config = ai_config or self.ai_config
@@ -283,10 +284,10 @@ class AIAnalysisService:
                 "risk_warning": "无法获取有效分析结果"
             }
     
-    def analyze_stock_with_strategy(self, symbol: str, features: Dict[str, Any], history_data: List[Dict[str, Any]], strategy: Dict[str, Any], ai_config: Dict[str, Any] = None) -> Dict[str, Any]:
+    def analyze_stock_with_strategy(self, symbol: str, features: Dict[str, Any], history_data: Union[OHLCVSeries, List[Dict[str, Any]]], strategy: Dict[str, Any], ai_config: Dict[str, Any] = None) -> Dict[str, Any]:
         """AI分析单只股票，基于策略化趋势判断"""
         # 获取最近30天的历史数据，用于趋势分析
-        recent_history = history_data[-30:] if len(history_data) > 30 else history_data
+        recent_history = OHLCVSeries.coerce(history_data).tail(30).to_records()
         
         # 获取风险偏好描述
         risk_preference = strategy.get("risk_preference", "medium")
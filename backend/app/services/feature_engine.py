@@ -0,0 +1,104 @@
+from typing import Any, Dict
+
+import numpy as np
+import pandas as pd
+
+# 特征名称与描述（顺序即接口返回顺序）
+FEATURE_DESCRIPTIONS = {
+    "avg_volume_short": "短期(5日)平均成交量",
+    "avg_volume_long": "中期(20日)平均成交量",
+    "volume_ratio": "短期与中期量能比值",
+    "turnover_mean": "平均换手率",
+    "price_range": "价格振幅、波动性",
+    "kline_shadow_ratio": "上影线/下影线比例",
+    "consolidation_days": "横盘整理天数",
+    "volatility_trend": "波动趋势",
+}
+
+# 横盘判定：10日收盘价变异系数低于3%
+CONSOLIDATION_WINDOW = 10
+CONSOLIDATION_THRESHOLD = 3
+# 计算末尾特征时先截取的K线数，横盘区间超出截取范围时倍增
+TAIL_ROWS = 64
+
+
+def consolidation_run_lengths(is_consolidating: np.ndarray) -> np.ndarray:
+    """连续横盘天数：每个位置到上一个非横盘位置的距离，非横盘位置为0"""
+    idx = np.arange(len(is_consolidating))
+    last_break = np.maximum.accumulate(np.where(is_consolidating, -1, idx))
+    return idx - last_break
+
+
+def _is_consolidating(close: pd.Series) -> np.ndarray:
+    std = close.rolling(window=CONSOLIDATION_WINDOW).std()
+    mean = close.rolling(window=CONSOLIDATION_WINDOW).mean()
+    # 窗口不足时为NaN，比较结果为False，即视为非横盘
+    return ((std / mean * 100) < CONSOLIDATION_THRESHOLD).to_numpy()
+
+
+def compute_feature_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """计算完整时间序列上的全部特征，df 需按日期升序并包含中文K线列"""
+    volume = df["成交量"].astype(float)
+    open_ = df["开盘"].astype(float)
+    close = df["收盘"].astype(float)
+    high = df["最高"].astype(float)
+    low = df["最低"].astype(float)
+
+    features = pd.DataFrame(index=df.index)
+    # 短期与中期量能比较（5日/20日）
+    features["avg_volume_short"] = volume.rolling(window=5).mean()
+    features["avg_volume_long"] = volume.rolling(window=20).mean()
+    features["volume_ratio"] = features["avg_volume_short"] / (features["avg_volume_long"] + 0.01)
+    # 平均换手率
+    features["turnover_mean"] = df["换手率"].astype(float).rolling(window=10).mean()
+    # 价格振幅、波动性
+    features["price_range"] = (high - low) / open_ * 100
+    # 上影线/下影线比例（避免除以零）
+    upper_shadow = high - np.maximum(open_, close)
+    lower_shadow = np.minimum(open_, close) - low
+    features["kline_shadow_ratio"] = upper_shadow / (lower_shadow + 0.01)
+    # 横盘整理天数
+    features["consolidation_days"] = consolidation_run_lengths(_is_consolidating(close))
+    features["volatility_trend"] = features["price_range"].rolling(window=5).mean()
+    return features[list(FEATURE_DESCRIPTIONS)]
+
+
+def latest_feature_values(df: pd.DataFrame) -> Dict[str, Any]:
+    """只计算最近一个交易日的特征
+
+    滚动窗口只依赖末尾少量K线，先截取末尾部分计算；
+    若末尾截取范围内全部处于横盘（连续天数可能更长），则倍增截取范围直至覆盖整段横盘。
+    """
+    rows = TAIL_ROWS
+    while True:
+        tail = df.iloc[-rows:]
+        features = compute_feature_frame(tail)
+        latest = features.iloc[-1].to_dict()
+        if rows >= len(df):
+            break
+        # 截取范围开头的窗口不足导致的“非横盘”不是真实中断，需要在有效区间内出现中断
+        if latest["consolidation_days"] < rows - (CONSOLIDATION_WINDOW - 1):
+            break
+        rows *= 4
+    latest["consolidation_days"] = int(latest["consolidation_days"])
+    return latest
+
+
+def describe_features(values: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """为特征值附加描述"""
+    return {
+        name: {
+            "value": int(values[name]) if name == "consolidation_days" else float(values[name]),
+            "description": description,
+        }
+        for name, description in FEATURE_DESCRIPTIONS.items()
+    }
+
+
+def feature_series_payload(df: pd.DataFrame, features: pd.DataFrame) -> Dict[str, list]:
+    """特征时间序列的列式表示（每个特征一个数组，缺失值为None）"""
+    payload = {"date": df["日期"].astype(str).tolist()}
+    for name in FEATURE_DESCRIPTIONS:
+        column = features[name].astype(object)
+        payload[name] = column.where(features[name].notna(), None).tolist()
+    return payload
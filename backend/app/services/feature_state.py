@@ -0,0 +1,254 @@
+import json
+import math
+import os
+import threading
+from collections import deque
+from typing import Any, Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from app.core.config import settings
+from app.services.adjustment import AdjustmentFactors
+from app.services.feature_engine import CONSOLIDATION_THRESHOLD, CONSOLIDATION_WINDOW, compute_feature_frame
+from app.services.ohlcv import OHLCVSeries, date_to_ordinal
+
+# 各滚动和对应的 (序列, 窗口)
+ROLLING_SUMS = {
+    "volume_5": ("volume", 5),
+    "volume_20": ("volume", 20),
+    "turnover_10": ("turnover", 10),
+    "close_10": ("close", CONSOLIDATION_WINDOW),
+    "close_sq_10": ("close_sq", CONSOLIDATION_WINDOW),
+    "price_range_5": ("price_range", 5),
+}
+# 缓冲区比最长窗口多保留一根K线，用于替换最后一根K线时仍能找到移出窗口的值
+BUFFER_SIZE = 21
+BAR_FIELDS = ("开盘", "最高", "最低", "收盘", "成交量", "换手率")
+
+
+def _bar_values(row) -> Dict[str, float]:
+    bar = {field: float(row[field]) for field in BAR_FIELDS}
+    bar["price_range"] = (bar["最高"] - bar["最低"]) / bar["开盘"] * 100
+    return bar
+
+
+class RollingFeatureState:
+    """单只股票的滚动特征状态：保存滚动和、平方和、窗口缓冲区及当前横盘天数
+
+    追加一根K线或替换最后一根（盘中刷新）都只需常数时间。
+    """
+
+    def __init__(self):
+        self.last_date = None
+        self.last_bar = None
+        self.prev_close = None
+        self.count = 0
+        self.run = 0
+        self.prev_run = 0
+        self.buffers = {name: deque(maxlen=BUFFER_SIZE) for name in ("volume", "turnover", "close", "close_sq", "price_range")}
+        self.sums = {name: 0.0 for name in ROLLING_SUMS}
+
+    def _series_values(self, bar: Dict[str, float]) -> Dict[str, float]:
+        return {
+            "volume": bar["成交量"],
+            "turnover": bar["换手率"],
+            "close": bar["收盘"],
+            "close_sq": bar["收盘"] ** 2,
+            "price_range": bar["price_range"],
+        }
+
+    def _is_consolidating(self) -> bool:
+        if self.count < CONSOLIDATION_WINDOW:
+            return False
+        n = CONSOLIDATION_WINDOW
+        mean = self.sums["close_10"] / n
+        variance = max(0.0, (self.sums["close_sq_10"] - self.sums["close_10"] ** 2 / n) / (n - 1))
+        return math.sqrt(variance) / mean * 100 < CONSOLIDATION_THRESHOLD
+
+    def append(self, date: str, row):
+        """追加一根新K线"""
+        bar = _bar_values(row)
+        for name, value in self._series_values(bar).items():
+            self.buffers[name].append(value)
+        self.count += 1
+        for sum_name, (series, window) in ROLLING_SUMS.items():
+            buffer = self.buffers[series]
+            dropped = buffer[-window - 1] if len(buffer) > window else 0.0
+            self.sums[sum_name] += buffer[-1] - dropped
+        self.prev_run = self.run
+        self.prev_close = self.last_bar["收盘"] if self.last_bar else None
+        self.run = self.prev_run + 1 if self._is_consolidating() else 0
+        self.last_date = date
+        self.last_bar = bar
+
+    def replace_last(self, row):
+        """替换最后一根K线（当天K线盘中更新）"""
+        bar = _bar_values(row)
+        for name, value in self._series_values(bar).items():
+            old = self.buffers[name][-1]
+            self.buffers[name][-1] = value
+            for sum_name, (series, _) in ROLLING_SUMS.items():
+                if series == name:
+                    self.sums[sum_name] += value - old
+        self.run = self.prev_run + 1 if self._is_consolidating() else 0
+        self.last_bar = bar
+
+    @classmethod
+    def rebuild(cls, frame: pd.DataFrame) -> "RollingFeatureState":
+        """基于完整历史重建状态（仅在复权价格变化等情况下使用）"""
+        state = cls()
+        if frame.empty:
+            return state
+        runs = compute_feature_frame(frame)["consolidation_days"].to_numpy()
+        tail = frame.iloc[-BUFFER_SIZE:]
+        for _, row in tail.iterrows():
+            bar = _bar_values(row)
+            for name, value in state._series_values(bar).items():
+                state.buffers[name].append(value)
+            state.prev_close = state.last_bar["收盘"] if state.last_bar else None
+            state.last_bar = bar
+        state.count = len(frame)
+        for sum_name, (series, window) in ROLLING_SUMS.items():
+            state.sums[sum_name] = float(sum(list(state.buffers[series])[-window:]))
+        state.run = int(runs[-1])
+        state.prev_run = int(runs[-2]) if len(runs) > 1 else 0
+        state.last_date = str(frame["日期"].iloc[-1])
+        return state
+
+    def features(self) -> Dict[str, Any]:
+        """当前最新一个交易日的特征值，与 compute_feature_frame 的最后一行一致"""
+        def window_mean(sum_name: str, window: int) -> float:
+            return self.sums[sum_name] / window if self.count >= window else float("nan")
+
+        bar = self.last_bar
+        avg_volume_short = window_mean("volume_5", 5)
+        avg_volume_long = window_mean("volume_20", 20)
+        upper_shadow = bar["最高"] - max(bar["开盘"], bar["收盘"])
+        lower_shadow = min(bar["开盘"], bar["收盘"]) - bar["最低"]
+        return {
+            "avg_volume_short": avg_volume_short,
+            "avg_volume_long": avg_volume_long,
+            "volume_ratio": avg_volume_short / (avg_volume_long + 0.01),
+            "turnover_mean": window_mean("turnover_10", 10),
+            "price_range": bar["price_range"],
+            "kline_shadow_ratio": upper_shadow / (lower_shadow + 0.01),
+            "consolidation_days": self.run,
+            "volatility_trend": window_mean("price_range_5", 5),
+        }
+
+    def covers(self, series: OHLCVSeries) -> bool:
+        """请求区间的末尾特征能否直接使用该状态：末尾日期一致，且区间足够包含全部窗口和整段横盘"""
+        if self.last_date is None or not len(series) or series.last_date != self.last_date:
+            return False
+        return len(series) == self.count or len(series) >= max(BUFFER_SIZE, self.run + CONSOLIDATION_WINDOW)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "last_date": self.last_date,
+            "last_bar": self.last_bar,
+            "prev_close": self.prev_close,
+            "count": self.count,
+            "run": self.run,
+            "prev_run": self.prev_run,
+            "buffers": {name: list(values) for name, values in self.buffers.items()},
+            "sums": self.sums,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "RollingFeatureState":
+        state = cls()
+        state.last_date = data["last_date"]
+        state.last_bar = data["last_bar"]
+        state.prev_close = data["prev_close"]
+        state.count = data["count"]
+        state.run = data["run"]
+        state.prev_run = data["prev_run"]
+        for name, values in data["buffers"].items():
+            state.buffers[name].extend(values)
+        state.sums.update(data["sums"])
+        return state
+
+
+class FeatureStateStore:
+    """按“股票代码+复权类型”持久化的滚动特征状态"""
+
+    def __init__(self, base_dir: str = None):
+        self.base_dir = base_dir or os.path.join(settings.DATA_DIR, "feature_state")
+        os.makedirs(self.base_dir, exist_ok=True)
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def _path(self, symbol: str, adjust: str) -> str:
+        return os.path.join(self.base_dir, f"{symbol}_{adjust or 'none'}.json")
+
+    def get(self, symbol: str, adjust: str) -> Optional[RollingFeatureState]:
+        key = (symbol, adjust)
+        with self._lock:
+            if key in self._states:
+                return self._states[key]
+        path = self._path(symbol, adjust)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                state = RollingFeatureState.from_dict(json.load(f))
+        except Exception as e:
+            print(f"读取滚动特征状态失败，忽略文件 {path}: {e}")
+            return None
+        with self._lock:
+            self._states[key] = state
+        return state
+
+    def update(self, symbol: str, adjust: str, series: OHLCVSeries, factors: AdjustmentFactors) -> RollingFeatureState:
+        """根据合并后的不复权K线及除权除息事件表更新状态
+
+        只对状态最后一根K线的前一根起的尾部做复权：新K线逐根追加，当天K线原位替换，
+        前一根K线的复权收盘价变化（出现新的除权除息）或状态对不上时才对完整历史复权并重建。
+        """
+        state = self.get(symbol, adjust)
+        start = len(series)
+        if state is not None and state.last_date is not None:
+            last = date_to_ordinal(state.last_date)
+            pos = int(np.searchsorted(series.dates, last))
+            if pos < len(series) and series.dates[pos] == last:
+                start = max(pos - 1, 0)
+
+        changed = True
+        if start == len(series):
+            state = RollingFeatureState.rebuild(factors.apply(series, adjust).to_frame())
+        else:
+            frame = factors.apply(series.tail(len(series) - start), adjust).to_frame()
+            pos = 1 if start > 0 else 0
+            prev_close = float(frame["收盘"].iloc[0]) if pos else None
+            if (state.prev_close is None) != (prev_close is None) or \
+                    (prev_close is not None and not math.isclose(prev_close, state.prev_close, rel_tol=1e-9)):
+                state = RollingFeatureState.rebuild(factors.apply(series, adjust).to_frame())
+            else:
+                last_row = frame.iloc[pos]
+                replace = _bar_values(last_row) != state.last_bar
+                if not replace and len(frame) == pos + 1:
+                    changed = False
+                else:
+                    new_state = RollingFeatureState.from_dict(state.to_dict())
+                    if replace:
+                        new_state.replace_last(last_row)
+                    dates = frame["日期"].to_numpy()
+                    for i in range(pos + 1, len(frame)):
+                        new_state.append(str(dates[i]), frame.iloc[i])
+                    state = new_state
+
+        if not changed:
+            return state
+        with self._lock:
+            self._states[(symbol, adjust)] = state
+        path = self._path(symbol, adjust)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state.to_dict(), f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        return state
+
+
+# 全局共享的滚动特征状态
+feature_state_store = FeatureStateStore()
@@ -0,0 +1,277 @@
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, TimeoutError as FutureTimeoutError, wait as wait_futures
+from contextlib import contextmanager
+from typing import Any, Callable, Dict
+
+from app.core.config import settings
+
+
+class FetchCancelled(Exception):
+    """抓取任务已被取消或已超过截止时间"""
+
+
+class CancelToken:
+    """协作式取消令牌：任务在每次访问数据源前检查，超时或被取消后不再继续请求上游
+
+    子令牌（如对冲请求的每一路）在父令牌取消时同样视为已取消。
+    """
+    __slots__ = ("deadline", "parent", "_event")
+
+    def __init__(self, deadline: float, parent: "CancelToken" = None):
+        self.deadline = deadline
+        self.parent = parent
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    def child(self) -> "CancelToken":
+        return CancelToken(self.deadline, parent=self)
+
+    @property
+    def cancelled(self) -> bool:
+        if self.parent is not None and self.parent.cancelled:
+            return True
+        return self._event.is_set() or time.monotonic() >= self.deadline
+
+    def remaining(self) -> float:
+        return max(0.0, self.deadline - time.monotonic())
+
+    def raise_if_cancelled(self):
+        if self.cancelled:
+            raise FetchCancelled("抓取任务已取消或超时")
+
+
+class FetchTask:
+    """已提交到抓取执行器的任务"""
+
+    def __init__(self, future, token: CancelToken):
+        self.future = future
+        self.token = token
+        # 正在等待该任务结果的调用方数量（合并请求时大于1）
+        self.waiters = 1
+
+    def result(self, timeout: float = None) -> Any:
+        """等待任务结果，超时抛出 TimeoutError（任务不会自动取消）"""
+        try:
+            return self.future.result(timeout=timeout)
+        except FutureTimeoutError:
+            raise TimeoutError("抓取任务等待超时")
+
+    def cancel(self):
+        """取消任务：尚未开始的任务直接移出队列，执行中的任务在下一次检查点退出"""
+        self.token.cancel()
+        self.future.cancel()
+
+    def done(self) -> bool:
+        return self.future.done()
+
+
+class FetchExecutor:
+    """共享的有界抓取执行器
+
+    所有上游请求都在固定大小的线程池中执行，每个数据源再用信号量限制并发，
+    任务携带截止时间，被取消或超过截止时间后不再继续请求上游。
+    """
+
+    def __init__(self, max_workers: int, source_limits: Dict[str, int], default_source_limit: int = 4):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="fetch")
+        # 对冲请求的各路在独立线程池中执行，避免任务等待同一线程池中的子任务造成饥饿
+        self._leg_pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="fetch-hedge")
+        self.max_workers = max_workers
+        self._source_limits = dict(source_limits)
+        self._default_source_limit = default_source_limit
+        self._semaphores = {}
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._source_active = {}
+        self._source_waiting = {}
+        self._counters = {"submitted": 0, "completed": 0, "failed": 0, "cancelled": 0, "timed_out": 0, "coalesced": 0,
+                          "hedged": 0, "hedge_wins": 0}
+        # 进行中的可合并任务：相同键的并发请求共享同一个任务
+        self._in_flight = {}
+        self._flight_lock = threading.Lock()
+
+    def _semaphore(self, source: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            if source not in self._semaphores:
+                limit = self._source_limits.get(source, self._default_source_limit)
+                self._semaphores[source] = threading.BoundedSemaphore(limit)
+                self._source_active[source] = 0
+                self._source_waiting[source] = 0
+            return self._semaphores[source]
+
+    def _count(self, name: str, delta: int = 1):
+        with self._lock:
+            self._counters[name] += delta
+
+    def submit(self, fn: Callable, timeout: float, *args, **kwargs) -> FetchTask:
+        """提交任务，fn 的第一个参数为取消令牌"""
+        token = CancelToken(time.monotonic() + timeout)
+
+        def run():
+            with self._lock:
+                self._queued -= 1
+                self._running += 1
+            try:
+                # 排队期间已超时的任务直接丢弃
+                token.raise_if_cancelled()
+                value = fn(token, *args, **kwargs)
+                self._count("completed")
+                return value
+            except FetchCancelled:
+                self._count("cancelled")
+                raise
+            except Exception:
+                self._count("failed")
+                raise
+            finally:
+                with self._lock:
+                    self._running -= 1
+
+        with self._lock:
+            self._queued += 1
+            self._counters["submitted"] += 1
+        future = self._pool.submit(run)
+
+        def on_done(f):
+            # 排队时被取消的任务不会执行 run，需要在这里修正计数
+            if f.cancelled():
+                with self._lock:
+                    self._queued -= 1
+                    self._counters["cancelled"] += 1
+
+        future.add_done_callback(on_done)
+        return FetchTask(future, token)
+
+    def submit_shared(self, key, fn: Callable, timeout: float, *args, **kwargs) -> FetchTask:
+        """提交可合并的任务：相同键已有进行中的任务时直接加入等待，共享同一份结果"""
+        with self._flight_lock:
+            task = self._in_flight.get(key)
+            if task is not None and not task.done():
+                with self._lock:
+                    task.waiters += 1
+                    self._counters["coalesced"] += 1
+                return task
+
+            task = self.submit(fn, timeout, *args, **kwargs)
+            self._in_flight[key] = task
+
+        def on_done(_):
+            with self._flight_lock:
+                if self._in_flight.get(key) is task:
+                    del self._in_flight[key]
+
+        task.future.add_done_callback(on_done)
+        return task
+
+    def wait(self, task: FetchTask, timeout: float, cancel_on_timeout: bool = True) -> Any:
+        """在截止时间内等待任务结果，超时抛出 TimeoutError
+
+        cancel_on_timeout 为 False 时任务继续在后台运行至其自身的截止时间（用于后台刷新缓存）；
+        合并的任务只有在最后一个等待方也超时离开时才会被取消。
+        """
+        try:
+            value = task.result(timeout=timeout)
+        except TimeoutError:
+            with self._lock:
+                task.waiters -= 1
+                last_waiter = task.waiters <= 0
+                self._counters["timed_out"] += 1
+            if cancel_on_timeout and last_waiter:
+                task.cancel()
+            raise
+        except BaseException:
+            with self._lock:
+                task.waiters -= 1
+            raise
+        with self._lock:
+            task.waiters -= 1
+        return value
+
+    def hedge(self, token: CancelToken, primary: Callable, secondary: Callable, delay: float) -> Any:
+        """对冲请求：主请求在 delay 秒内未返回时向备用数据源发出同样的请求，取先成功者并取消另一路
+
+        primary/secondary 的参数为各自的子取消令牌；两路都失败时抛出最后一个异常。
+        """
+        legs = {}
+        primary_token = token.child()
+        legs[self._leg_pool.submit(primary, primary_token)] = primary_token
+        done, _ = wait_futures(list(legs), timeout=min(delay, token.remaining()))
+
+        if not done or next(iter(done)).exception() is not None:
+            token.raise_if_cancelled()
+            secondary_token = token.child()
+            secondary_future = self._leg_pool.submit(secondary, secondary_token)
+            legs[secondary_future] = secondary_token
+            self._count("hedged")
+        else:
+            secondary_future = None
+
+        pending = set(legs)
+        error = None
+        try:
+            while pending:
+                done, pending = wait_futures(pending, timeout=token.remaining(), return_when=FIRST_COMPLETED)
+                if not done:
+                    raise FetchCancelled("对冲请求超过截止时间")
+                for future in done:
+                    if future.exception() is None:
+                        if future is secondary_future:
+                            self._count("hedge_wins")
+                        return future.result()
+                    error = future.exception()
+            raise error
+        finally:
+            # 取消尚未完成的一路
+            for future, leg_token in legs.items():
+                if not future.done():
+                    leg_token.cancel()
+                    future.cancel()
+
+    @contextmanager
+    def source_slot(self, source: str, token: CancelToken):
+        """占用某个数据源的一个并发名额，等待时间不超过任务剩余时间"""
+        semaphore = self._semaphore(source)
+        token.raise_if_cancelled()
+        with self._lock:
+            self._source_waiting[source] += 1
+        acquired = semaphore.acquire(timeout=token.remaining())
+        with self._lock:
+            self._source_waiting[source] -= 1
+            if acquired:
+                self._source_active[source] += 1
+        if not acquired:
+            raise FetchCancelled(f"等待数据源 {source} 并发名额超时")
+        try:
+            token.raise_if_cancelled()
+            yield
+        finally:
+            with self._lock:
+                self._source_active[source] -= 1
+            semaphore.release()
+
+    def stats(self) -> Dict[str, Any]:
+        """队列深度、执行中任务数及各数据源并发情况"""
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "queued": self._queued,
+                "running": self._running,
+                "in_flight": len(self._in_flight),
+                "sources": {
+                    source: {
+                        "limit": self._source_limits.get(source, self._default_source_limit),
+                        "active": self._source_active[source],
+                        "waiting": self._source_waiting[source],
+                    }
+                    for source in self._semaphores
+                },
+                **self._counters,
+            }
+
+
+# 全局共享抓取执行器
+fetch_executor = FetchExecutor(settings.FETCH_EXECUTOR_WORKERS, settings.FETCH_SOURCE_CONCURRENCY)
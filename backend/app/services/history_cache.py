@@ -0,0 +1,93 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from app.core.config import settings
+from app.services.history_store import HistoryEntry
+
+
+class HistoryCache:
+    """进程内K线缓存：按“规范化代码+复权类型”缓存完整历史，LRU淘汰并受内存预算约束
+
+    缓存的是已覆盖区间内的完整数据，任何更窄的日期区间都直接切片返回，无需重新获取。
+    """
+
+    def __init__(self, max_bytes: int, ttl_seconds: int):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # key -> (entry, nbytes, cached_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+
+    @staticmethod
+    def _entry_bytes(entry: HistoryEntry) -> int:
+        return entry.series.nbytes
+
+    def get(self, symbol: str, adjust: str) -> Optional[HistoryEntry]:
+        """读取缓存，过期条目视为未命中"""
+        key = (symbol, adjust)
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                self._misses += 1
+                return None
+            entry, nbytes, cached_at = item
+            if time.time() - cached_at > self.ttl_seconds:
+                self._remove(key)
+                self._expirations += 1
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry
+
+    def put(self, symbol: str, adjust: str, entry: HistoryEntry):
+        """写入缓存，超出内存预算时淘汰最久未使用的条目"""
+        key = (symbol, adjust)
+        nbytes = self._entry_bytes(entry)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            # 单个条目超过预算时不缓存
+            if nbytes > self.max_bytes:
+                return
+            self._entries[key] = (entry, nbytes, time.time())
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self._evictions += 1
+
+    def invalidate(self, symbol: str, adjust: str):
+        """移除某只股票的缓存"""
+        with self._lock:
+            if (symbol, adjust) in self._entries:
+                self._remove((symbol, adjust))
+
+    def _remove(self, key):
+        _, nbytes, _ = self._entries.pop(key)
+        self._bytes -= nbytes
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存命中、未命中、淘汰等统计信息"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+            }
+
+
+# 全局共享缓存，图表接口、AI分析与筛选服务共用
+history_cache = HistoryCache(settings.HISTORY_CACHE_MAX_BYTES, settings.HISTORY_CACHE_TTL_SECONDS)
@@ -0,0 +1,105 @@
+from typing import Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# 自动选择时由细到粗依次尝试的K线周期
+RESOLUTION_LADDER = ("day", "week", "month", "quarter", "year")
+RESOLUTIONS = ("auto",) + RESOLUTION_LADDER + ("lttb",)
+# 各周期对应的 pandas Period 频率
+_PERIOD_FREQ = {"week": "W", "month": "M", "quarter": "Q", "year": "Y"}
+
+
+def _period_ends(dates: pd.Series, resolution: str) -> np.ndarray:
+    """每个周期最后一根K线的位置（数据已按日期升序）"""
+    if resolution == "day":
+        return np.arange(len(dates))
+    codes = pd.to_datetime(dates).dt.to_period(_PERIOD_FREQ[resolution]).astype("int64").to_numpy()
+    return np.flatnonzero(np.append(codes[1:] != codes[:-1], True))
+
+
+def aggregate_ohlc(frame: pd.DataFrame, ends: np.ndarray) -> pd.DataFrame:
+    """按周期聚合K线：开盘取首根、收盘取末根、最高/最低取极值，成交量与换手率求和
+
+    日期取周期内最后一个交易日。
+    """
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    volume = np.add.reduceat(frame["volume"].to_numpy(), starts)
+    turnover = np.add.reduceat(frame["turnover"].to_numpy(), starts)
+    return pd.DataFrame({
+        "date": frame["date"].to_numpy()[ends],
+        "open": frame["open"].to_numpy()[starts],
+        "close": frame["close"].to_numpy()[ends],
+        "high": np.maximum.reduceat(frame["high"].to_numpy(), starts),
+        "low": np.minimum.reduceat(frame["low"].to_numpy(), starts),
+        "volume": volume,
+        "turnover": turnover,
+        "volume_turnover_product": volume * turnover,
+    })
+
+
+def lttb_indices(values: np.ndarray, max_points: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets 降采样，返回保留点的位置（保留首尾点）"""
+    n = len(values)
+    if max_points >= n:
+        return np.arange(n)
+    if max_points < 3:
+        return np.array([0, n - 1])
+
+    x = np.arange(n, dtype=float)
+    y = values.astype(float)
+    # 首尾之外的点均分为 max_points-2 个桶
+    edges = np.linspace(1, n - 1, max_points - 1).astype(int)
+    selected = np.empty(max_points, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i in range(max_points - 2):
+        start, end = edges[i], edges[i + 1]
+        # 下一个桶的平均点（最后一个桶以末尾点为准）
+        if i + 2 < len(edges):
+            next_start, next_end = edges[i + 1], edges[i + 2]
+            avg_x, avg_y = x[next_start:next_end].mean(), y[next_start:next_end].mean()
+        else:
+            avg_x, avg_y = x[n - 1], y[n - 1]
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def downsample_history(
+    frame: pd.DataFrame, max_points: Optional[int] = None, resolution: str = "auto"
+) -> Tuple[pd.DataFrame, np.ndarray, str]:
+    """按目标点数或周期降采样K线
+
+    auto：按 日→周→月→季→年 选择点数不超过 max_points 的最细周期，年K线仍超出时再按 LTTB 从年K线中选点；
+    lttb：按收盘价做 LTTB 选点，返回原始日K线的子集（用于折线图）。
+    返回 (降采样后的数据, 每个点对应原始数据的位置, 实际使用的周期)，位置用于对齐特征序列。
+    """
+    if frame.empty:
+        return frame, np.arange(0), "day"
+
+    if resolution == "lttb":
+        positions = lttb_indices(frame["close"].to_numpy(), max_points)
+        return frame.iloc[positions].reset_index(drop=True), positions, "lttb"
+
+    if resolution == "auto":
+        if not max_points or len(frame) <= max_points:
+            return frame, np.arange(len(frame)), "day"
+        for level in RESOLUTION_LADDER[1:]:
+            ends = _period_ends(frame["date"], level)
+            if len(ends) <= max_points:
+                break
+        resolution = level
+        if len(ends) > max_points:
+            # 年K线仍超出上限：在年K线上做 LTTB，保证不超过 max_points
+            yearly = aggregate_ohlc(frame, ends)
+            selected = lttb_indices(yearly["close"].to_numpy(), max_points)
+            return yearly.iloc[selected].reset_index(drop=True), ends[selected], resolution
+    elif resolution == "day":
+        return frame, np.arange(len(frame)), "day"
+    else:
+        ends = _period_ends(frame["date"], resolution)
+
+    return aggregate_ohlc(frame, ends), ends, resolution
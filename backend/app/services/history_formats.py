@@ -0,0 +1,139 @@
+import json
+from typing import Any, Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from app.services.ohlcv import OHLCVSeries
+
+# 历史K线响应的字段顺序
+HISTORY_FIELDS = ["date", "open", "close", "high", "low", "volume", "turnover", "volume_turnover_product"]
+
+# 二进制响应格式（通过 Accept 请求头协商）
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack")
+ARROW_STREAM_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+# 除 data 以外随数据一起返回的元信息字段
+META_FIELDS = ("symbol", "start_date", "end_date", "adjust", "resolution", "stale")
+
+
+class UnsupportedFormat(Exception):
+    """请求的二进制格式所需的可选依赖未安装"""
+
+
+def history_columns(series: OHLCVSeries) -> pd.DataFrame:
+    """由K线序列构建响应所需的英文列"""
+    return pd.DataFrame({
+        "date": series.date_strings(),
+        "open": series.open,
+        "close": series.close,
+        "high": series.high,
+        "low": series.low,
+        "volume": series.volume,
+        "turnover": series.turnover,
+        # 成交量与换手率的乘积，作为流动性指标
+        "volume_turnover_product": series.volume * series.turnover,
+    })
+
+
+def columnar_payload(frame: pd.DataFrame) -> Dict[str, list]:
+    """列式数据：每个字段一个数组，不为每根K线创建字典"""
+    return {field: frame[field].tolist() for field in HISTORY_FIELDS}
+
+
+def json_safe(value: Any) -> Any:
+    """递归转换为严格JSON可表示的值：NaN/inf 转为None，numpy 标量转为 Python 类型"""
+    if isinstance(value, dict):
+        return {key: json_safe(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [json_safe(item) for item in value]
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not np.isfinite(value):
+        return None
+    return value
+
+
+def negotiate_binary_format(accept: Optional[str]) -> Optional[str]:
+    """根据 Accept 请求头选择二进制格式：msgpack、arrow，未请求时返回None"""
+    if not accept:
+        return None
+    accept = accept.lower()
+    if ARROW_STREAM_MEDIA_TYPE in accept:
+        return "arrow"
+    if any(media_type in accept for media_type in MSGPACK_MEDIA_TYPES):
+        return "msgpack"
+    return None
+
+
+def _date_ordinals(frame: pd.DataFrame) -> np.ndarray:
+    """日期转换为自1970-01-01起的天数（int32）"""
+    return pd.to_datetime(frame["date"]).values.astype("datetime64[D]").astype(np.int32)
+
+
+def _feature_columns(result: Dict[str, Any]) -> Dict[str, np.ndarray]:
+    """特征时间序列（与 data 逐行对齐）转换为 float64 列，缺失值为NaN；未请求时为空"""
+    feature_series = result.get("feature_series") or {}
+    return {
+        name: np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+        for name, values in feature_series.items()
+        if name != "date"
+    }
+
+
+def encode_msgpack(result: Dict[str, Any]) -> bytes:
+    """MessagePack 编码：每列为小端序原始字节，附带 dtype，日期为自1970-01-01起的天数
+
+    最新特征放在 features（缺失值为None），特征时间序列按需放在 feature_columns，编码方式与K线列相同。
+    """
+    try:
+        import msgpack
+    except ImportError:
+        raise UnsupportedFormat("未安装 msgpack，无法返回 MessagePack 格式")
+
+    frame = result["data"]
+    columns = {"date": _date_ordinals(frame)}
+    for field in HISTORY_FIELDS[1:]:
+        columns[field] = frame[field].to_numpy()
+    payload = {field: result.get(field) for field in META_FIELDS}
+    payload["length"] = len(frame)
+
+    def encode_columns(arrays: Dict[str, np.ndarray]) -> Dict[str, Dict[str, Any]]:
+        return {
+            field: {"dtype": array.dtype.newbyteorder("<").str, "data": array.astype(array.dtype.newbyteorder("<")).tobytes()}
+            for field, array in arrays.items()
+        }
+
+    payload["columns"] = encode_columns(columns)
+    payload["features"] = json_safe(result.get("features"))
+    feature_columns = _feature_columns(result)
+    if feature_columns:
+        payload["feature_columns"] = encode_columns(feature_columns)
+    return msgpack.packb(payload, use_bin_type=True)
+
+
+def encode_arrow(result: Dict[str, Any]) -> bytes:
+    """Arrow IPC 流编码：日期为 date32 列，元信息及最新特征（JSON）写入 schema metadata
+
+    按需返回的特征时间序列作为额外的 float64 列（列名为 feature.<特征名>）。
+    """
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise UnsupportedFormat("未安装 pyarrow，无法返回 Arrow 格式")
+
+    frame = result["data"]
+    arrays = [pa.array(_date_ordinals(frame), type=pa.date32())]
+    arrays += [pa.array(frame[field].to_numpy()) for field in HISTORY_FIELDS[1:]]
+    names = list(HISTORY_FIELDS)
+    for name, values in _feature_columns(result).items():
+        arrays.append(pa.array(values, from_pandas=True))
+        names.append(f"feature.{name}")
+    metadata = {field: json.dumps(result.get(field), ensure_ascii=False) for field in META_FIELDS}
+    metadata["features"] = json.dumps(json_safe(result.get("features")), ensure_ascii=False)
+    table = pa.Table.from_arrays(arrays, names=names).replace_schema_metadata(metadata)
+
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
@@ -0,0 +1,206 @@
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from app.core.config import settings
+from app.services.adjustment import PREV_CLOSE_COLUMN, AdjustmentFactors
+from app.services.ohlcv import OHLCVSeries, date_to_ordinal
+
+# 本地存储的标准列（与efinance返回的列名保持一致）
+HISTORY_COLUMNS = ["日期", "开盘", "收盘", "最高", "最低", "成交量", "换手率"]
+PRICE_COLUMNS = ["开盘", "收盘", "最高", "最低"]
+
+
+def normalize_history_frame(df: pd.DataFrame, calendar=None) -> pd.DataFrame:
+    """将各数据源返回的K线统一为标准列、标准类型，只保留交易日，按日期升序且日期唯一
+
+    calendar 为该市场的交易日历（TradingCalendar），未指定时按工作日判断；
+    数据源提供前收盘参考价（或涨跌额）时保留“前收盘”列，用于识别除权除息。
+    """
+    frame = df[HISTORY_COLUMNS].copy()
+    if PREV_CLOSE_COLUMN in df.columns:
+        frame[PREV_CLOSE_COLUMN] = pd.to_numeric(df[PREV_CLOSE_COLUMN], errors="coerce")
+    elif "涨跌额" in df.columns:
+        frame[PREV_CLOSE_COLUMN] = frame["收盘"].astype(float) - pd.to_numeric(df["涨跌额"], errors="coerce")
+    frame["日期"] = pd.to_datetime(frame["日期"]).dt.strftime("%Y-%m-%d")
+    for col in PRICE_COLUMNS:
+        frame[col] = frame[col].astype(float)
+    frame["成交量"] = frame["成交量"].astype("int64")
+    frame["换手率"] = frame["换手率"].astype(float)
+    # 过滤非交易日，入库时过滤一次，读取时无需重复处理
+    days = pd.to_datetime(frame["日期"]).values.astype("datetime64[D]")
+    if calendar is not None:
+        frame = frame[calendar.is_session(days.astype(np.int32))]
+    else:
+        frame = frame[np.is_busday(days)]
+    frame = frame.drop_duplicates(subset="日期", keep="last")
+    return frame.sort_values(by="日期").reset_index(drop=True)
+
+
+def _shift_date(date_str: str, days: int) -> str:
+    return (datetime.strptime(date_str, "%Y-%m-%d") + timedelta(days=days)).strftime("%Y-%m-%d")
+
+
+class HistoryEntry:
+    """单只股票的本地不复权历史数据、除权除息事件表及已覆盖的日期区间"""
+    __slots__ = ("series", "factors", "covered_start", "covered_end", "fetched_at")
+
+    def __init__(self, series: OHLCVSeries, covered_start: str, covered_end: str, fetched_at: float,
+                 factors: AdjustmentFactors = None):
+        self.series = series
+        self.factors = factors if factors is not None else AdjustmentFactors.empty()
+        self.covered_start = covered_start
+        self.covered_end = covered_end
+        self.fetched_at = fetched_at
+
+
+class HistoryStore:
+    """按“股票代码+复权类型”一文件的压缩列式K线存储
+
+    每个文件是一个 npz 压缩包，每列一个数组（日期存为自1970-01-01起的天数），
+    同时记录已向上游请求过的日期区间，用于判断只需补齐首尾缺口。
+    服务只保存不复权数据及除权除息事件表，复权价格在读取时计算。
+    """
+
+    def __init__(self, base_dir: str = None):
+        self.base_dir = base_dir or os.path.join(settings.DATA_DIR, "history")
+        os.makedirs(self.base_dir, exist_ok=True)
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+
+    def _path(self, symbol: str, adjust: str) -> str:
+        return os.path.join(self.base_dir, f"{symbol}_{adjust or 'none'}.npz")
+
+    def lock(self, symbol: str, adjust: str) -> threading.Lock:
+        """获取某只股票存储文件的读写锁"""
+        key = (symbol, adjust)
+        with self._locks_guard:
+            if key not in self._locks:
+                self._locks[key] = threading.Lock()
+            return self._locks[key]
+
+    def load(self, symbol: str, adjust: str) -> Optional[HistoryEntry]:
+        """读取本地历史数据，文件不存在或损坏时返回None"""
+        path = self._path(symbol, adjust)
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as archive:
+                series = OHLCVSeries(
+                    archive["date"], archive["open"], archive["high"], archive["low"],
+                    archive["close"], archive["volume"], archive["turnover"],
+                )
+                if "adj_dates" in archive:
+                    factors = AdjustmentFactors(archive["adj_dates"], archive["adj_ratios"])
+                else:
+                    factors = AdjustmentFactors.empty()
+                return HistoryEntry(
+                    series,
+                    str(archive["covered_start"]),
+                    str(archive["covered_end"]),
+                    float(archive["fetched_at"]),
+                    factors,
+                )
+        except Exception as e:
+            print(f"读取本地历史数据失败，忽略文件 {path}: {e}")
+            return None
+
+    def save(self, symbol: str, adjust: str, entry: HistoryEntry):
+        """写入本地历史数据（先写临时文件再原子替换）"""
+        path = self._path(symbol, adjust)
+        tmp_path = f"{path}.tmp"
+        series = entry.series
+        with open(tmp_path, "wb") as f:
+            np.savez_compressed(
+                f,
+                date=series.dates,
+                open=series.open,
+                close=series.close,
+                high=series.high,
+                low=series.low,
+                volume=series.volume,
+                turnover=series.turnover,
+                adj_dates=entry.factors.dates,
+                adj_ratios=entry.factors.ratios,
+                covered_start=np.array(entry.covered_start),
+                covered_end=np.array(entry.covered_end),
+                fetched_at=np.array(entry.fetched_at),
+            )
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def missing_ranges(entry: Optional[HistoryEntry], start_date: str, end_date: str, calendar=None) -> List[Tuple[str, str]]:
+        """计算请求区间中需要向上游补齐的首尾缺口
+
+        指定交易日历时只有缺口内存在交易日才需要补齐，例如周末、节假日请求到今天时直接使用本地数据。
+        """
+        if entry is None:
+            return [(start_date, end_date)]
+
+        def has_sessions(start: str, end: str) -> bool:
+            return calendar.has_sessions(start, end) if calendar is not None else start <= end
+
+        ranges = []
+        head_end = _shift_date(entry.covered_start, -1)
+        if start_date < entry.covered_start and has_sessions(start_date, head_end):
+            # 头部补到已有的第一根K线（含），取得其前收盘参考价，以识别新旧数据交界处的除权除息
+            ranges.append((start_date, entry.series.first_date if len(entry.series) else head_end))
+
+        # 尾部从最后一根K线开始重新获取，以覆盖盘中未收盘的K线
+        tail_start = entry.series.last_date if len(entry.series) else entry.covered_end
+        today = datetime.now().strftime("%Y-%m-%d")
+        if end_date > entry.covered_end and has_sessions(_shift_date(entry.covered_end, 1), min(end_date, today)):
+            ranges.append((tail_start, end_date))
+        elif calendar is not None:
+            if HistoryStore.tail_pending(entry, calendar) and end_date >= calendar.last_session(min(entry.covered_end, today)):
+                ranges.append((tail_start, end_date))
+        elif entry.covered_end >= today and has_sessions(today, today) and \
+                time.time() - entry.fetched_at > settings.HISTORY_TAIL_REFRESH_SECONDS:
+            ranges.append((tail_start, end_date))
+        return ranges
+
+    @staticmethod
+    def tail_pending(entry: HistoryEntry, calendar) -> bool:
+        """已覆盖的最后一个交易日的K线是否在收盘前获取、需要重新获取
+
+        与今天是否为交易日无关：盘中获取的K线到周末、节假日仍会在下次请求时刷新一次；
+        仍在交易时段内时按 HISTORY_TAIL_REFRESH_SECONDS 限制刷新频率。
+        """
+        today = datetime.now().strftime("%Y-%m-%d")
+        close = calendar.session_close(calendar.last_session(min(entry.covered_end, today)))
+        if entry.fetched_at >= close:
+            return False
+        now = time.time()
+        return now >= close or now - entry.fetched_at > settings.HISTORY_TAIL_REFRESH_SECONDS
+
+    @staticmethod
+    def merge(entry: Optional[HistoryEntry], series: OHLCVSeries, start_date: str, end_date: str,
+              prev_close: np.ndarray = None) -> HistoryEntry:
+        """将新获取的区间合并到已有数据中，同一日期以新数据为准
+
+        prev_close 为新K线的前收盘参考价（与 series 按位置对应），据此更新该区间的除权除息事件。
+        """
+        fetched_at = time.time()
+        merged = series if entry is None else OHLCVSeries.merge(entry.series, series)
+        factors = AdjustmentFactors.empty() if entry is None else entry.factors
+        if prev_close is not None:
+            detected = AdjustmentFactors.detect(merged, series.dates, prev_close)
+            factors = AdjustmentFactors.merge(factors, detected, date_to_ordinal(start_date), date_to_ordinal(end_date))
+        if entry is None:
+            return HistoryEntry(merged, start_date, end_date, fetched_at, factors)
+
+        return HistoryEntry(
+            merged,
+            min(entry.covered_start, start_date),
+            max(entry.covered_end, end_date),
+            fetched_at if end_date >= entry.covered_end else entry.fetched_at,
+            factors,
+        )
+
+
+# 全局共享存储，保证同一文件的读写锁在各服务实例间共用
+history_store = HistoryStore()
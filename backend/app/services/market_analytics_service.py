@@ -0,0 +1,109 @@
+from typing import Any, Dict
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.stock_data_service import StockDataService
+from app.services.stock_metadata import stock_metadata
+from app.services.universe_panel import universe_panels
+
+
+class MarketAnalyticsService:
+    """基于全市场面板的横截面统计，所有计算都是对 股票×交易日 数组的整体运算"""
+
+    def __init__(self):
+        self.stock_data_service = StockDataService()
+        self.universe_panels = universe_panels
+
+    def _load_series(self, symbol: str, start_date: str, end_date: str):
+        series, _ = self.stock_data_service.get_stock_ohlcv(symbol, start_date, end_date, "qfq")
+        return series
+
+    def start_panel_scheduler(self):
+        """启动面板的每日定时构建"""
+        self.universe_panels.start_scheduler(settings.PANEL_MARKETS, self._load_series)
+
+    def build_panel(self, market: str) -> bool:
+        """在后台构建面板，已在构建时返回False"""
+        return self.universe_panels.build_in_background(market, self._load_series)
+
+    def get_panel(self, market: str):
+        panel = self.universe_panels.get(market)
+        if panel is None:
+            raise ValueError(f"市场 {market} 的面板尚未构建")
+        return panel
+
+    def panel_info(self, market: str) -> Dict[str, Any]:
+        info = self.get_panel(market).info()
+        info["stale"] = self.universe_panels.is_stale(market)
+        return info
+
+    def returns(self, market: str, days: int, top: int, end_date: str = None) -> Dict[str, Any]:
+        """截至 end_date 最近 days 个交易日的涨跌幅排行"""
+        panel = self.get_panel(market)
+        end = panel.columns_until(end_date)
+        if end <= days:
+            raise ValueError(f"面板中截至 {end_date or '最新'} 的交易日不足 {days + 1} 个")
+        close = panel["close"]
+        change = (close[:, end - 1] / close[:, end - 1 - days] - 1) * 100
+        valid = np.flatnonzero(~np.isnan(change))
+        order = valid[np.argsort(change[valid], kind="stable")]
+
+        def items(rows):
+            return [
+                {
+                    "symbol": str(panel.symbols[row]),
+                    "name": stock_metadata.get_basic(str(panel.symbols[row]))["name"],
+                    "change_pct": round(float(change[row]), 2),
+                    "close": float(close[row, end - 1]),
+                }
+                for row in rows
+            ]
+
+        dates = panel.date_strings()
+        return {
+            "market": market,
+            "start_date": str(dates[end - 1 - days]),
+            "end_date": str(dates[end - 1]),
+            "count": len(valid),
+            "median_change_pct": round(float(np.median(change[valid])), 2) if len(valid) else None,
+            "gainers": items(order[::-1][:top]),
+            "losers": items(order[:top]),
+        }
+
+    def breadth(self, market: str, days: int) -> Dict[str, Any]:
+        """最近 days 个交易日每天的上涨、下跌、平盘家数及站上20日均线的比例"""
+        panel = self.get_panel(market)
+        close = np.asarray(panel["close"])
+        if close.shape[1] < 2:
+            raise ValueError("面板中的交易日不足 2 个，无法计算涨跌家数")
+        days = max(1, min(days, close.shape[1] - 1))
+        diff = close[:, -days:] - close[:, -days - 1:-1]
+        traded = ~np.isnan(diff)
+        # 20日均线：前缀和求滑动平均，窗口内有缺失的股票不计入
+        window = 20
+        zeros = np.zeros((close.shape[0], 1))
+        cumulative = np.concatenate([zeros, np.cumsum(np.nan_to_num(close), axis=1)], axis=1)
+        counts = np.concatenate([zeros, np.cumsum(~np.isnan(close), axis=1)], axis=1)
+        ma = np.full(close.shape, np.nan)
+        if close.shape[1] >= window:
+            full = counts[:, window:] - counts[:, :-window] == window
+            ma[:, window - 1:] = np.where(full, (cumulative[:, window:] - cumulative[:, :-window]) / window, np.nan)
+        ma = ma[:, -days:]
+        last = close[:, -days:]
+        above = np.sum(last > ma, axis=0)
+        with_ma = np.sum(~np.isnan(ma) & ~np.isnan(last), axis=0)
+        dates = panel.date_strings()[-days:]
+        return {
+            "market": market,
+            "items": [
+                {
+                    "date": str(dates[j]),
+                    "advancers": int(np.sum(diff[:, j] > 0)),
+                    "decliners": int(np.sum(diff[:, j] < 0)),
+                    "unchanged": int(np.sum(traded[:, j] & (diff[:, j] == 0))),
+                    "above_ma20_pct": round(float(above[j]) / with_ma[j] * 100, 2) if with_ma[j] else None,
+                }
+                for j in range(days)
+            ],
+        }
@@ -0,0 +1,96 @@
+import threading
+import time
+from typing import Dict
+
+import akshare as ak
+import numpy as np
+import pandas as pd
+
+from app.core.config import settings
+from app.services.offline_provider import data_provider, synthetic_spot
+
+# 快照中可直接用于筛选的最新K线字段（英文指标名 → 行情快照列名）
+SNAPSHOT_FIELDS = {
+    "close": "最新价",
+    "open": "今开",
+    "high": "最高",
+    "low": "最低",
+    "volume": "成交量",
+    "turnover": "换手率",
+}
+
+
+class SpotSnapshot:
+    """某个市场的全市场行情快照，每个字段一个数组，与 symbols 按位置对应"""
+    __slots__ = ("market", "symbols", "columns", "fetched_at")
+
+    def __init__(self, market: str, symbols: np.ndarray, columns: Dict[str, np.ndarray], fetched_at: float):
+        self.market = market
+        self.symbols = symbols
+        self.columns = columns
+        self.fetched_at = fetched_at
+
+    def __len__(self) -> int:
+        return len(self.symbols)
+
+
+def _download_spot(market: str) -> pd.DataFrame:
+    if data_provider.mode == "synthetic":
+        return synthetic_spot(market, settings.SYNTHETIC_UNIVERSE_SIZE, settings.PROVIDER_SEED, settings.SYNTHETIC_HISTORY_START)
+    if market == "cn":
+        return ak.stock_zh_a_spot_em()
+    if market == "hk":
+        return ak.stock_hk_spot_em()
+    if market == "us":
+        return ak.stock_us_spot_em()
+    raise ValueError(f"不支持的市场类型: {market}")
+
+
+class MarketSnapshotCache:
+    """全市场行情快照缓存：一次请求取得所有股票的最新价、开高低、成交量与换手率，短时间内复用"""
+
+    def __init__(self, ttl_seconds: int):
+        self.ttl_seconds = ttl_seconds
+        self._snapshots = {}
+        self._lock = threading.Lock()
+        # 每个市场一把下载锁：同一市场只下载一次，下载期间不阻塞其他市场的读取
+        self._market_locks = {}
+
+    def _fresh(self, market: str):
+        with self._lock:
+            snapshot = self._snapshots.get(market)
+        if snapshot is not None and time.time() - snapshot.fetched_at <= self.ttl_seconds:
+            return snapshot
+        return None
+
+    def get(self, market: str) -> SpotSnapshot:
+        """获取行情快照，超过有效期时重新下载"""
+        snapshot = self._fresh(market)
+        if snapshot is not None:
+            return snapshot
+        with self._lock:
+            market_lock = self._market_locks.setdefault(market, threading.Lock())
+        with market_lock:
+            # 等待期间可能已由其他请求下载完成
+            snapshot = self._fresh(market)
+            if snapshot is not None:
+                return snapshot
+            spot_df = _download_spot(market)
+            codes = spot_df["代码"].astype(str)
+            if market == "hk":
+                codes = "hk" + codes
+            columns = {}
+            for field, column in SNAPSHOT_FIELDS.items():
+                if column in spot_df.columns:
+                    columns[field] = pd.to_numeric(spot_df[column], errors="coerce").to_numpy(dtype=np.float64)
+                else:
+                    # 缺少的字段（如港股无换手率）视为未知，相关规则不匹配
+                    columns[field] = np.full(len(spot_df), np.nan)
+            snapshot = SpotSnapshot(market, codes.to_numpy(), columns, time.time())
+            with self._lock:
+                self._snapshots[market] = snapshot
+            return snapshot
+
+
+# 全局共享行情快照缓存
+market_snapshot_cache = MarketSnapshotCache(settings.SPOT_SNAPSHOT_TTL_SECONDS)
@@ -0,0 +1,284 @@
+import os
+import threading
+import time
+import zlib
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+import pandas as pd
+
+from app.core.config import settings
+from app.services.adjustment import PREV_CLOSE_COLUMN
+from app.services.history_store import normalize_history_frame
+from app.services.ohlcv import OHLCVSeries, date_to_ordinal
+
+# 数据源模式：live（真实上游）、record（真实上游并录制响应）、replay（回放录制的响应）、synthetic（按种子生成模拟数据）
+PROVIDER_MODES = ("live", "record", "replay", "synthetic")
+# 模拟A股代码的板块前缀，每个前缀后接4位序号
+_SYNTHETIC_CN_PREFIXES = ("60", "00", "30", "68")
+_SYNTHETIC_INDUSTRIES = ("银行", "证券", "白酒", "半导体", "医药", "光伏", "汽车", "房地产", "电力", "软件开发")
+
+
+class InjectedFailure(ConnectionError):
+    """回放/模拟模式下按配置的失败率注入的数据源故障"""
+
+
+def _symbol_seed(seed: int, symbol: str) -> List[int]:
+    return [seed, zlib.crc32(symbol.encode("utf-8"))]
+
+
+def synthetic_key(code: str) -> str:
+    """模拟数据的生成键：去掉交易所前缀，同一只股票的不同写法生成相同的K线"""
+    key = code.strip().lower()
+    if key[:2] in ("sh", "sz", "bj", "hk") and key[2:].isdigit():
+        return key[2:]
+    return key
+
+
+def synthetic_dates(start_date: str, end_date: str) -> np.ndarray:
+    """区间内的工作日（自1970-01-01起的天数）"""
+    days = np.arange(date_to_ordinal(start_date), date_to_ordinal(end_date) + 1, dtype=np.int64)
+    return days[np.is_busday(days.astype("datetime64[D]"))].astype(np.int32)
+
+
+def synthetic_bars(symbols: List[str], dates: np.ndarray, seed: int) -> Dict[str, np.ndarray]:
+    """按种子生成多只股票的日K线，每个字段为 (股票数, 交易日数) 的数组
+
+    收盘价为几何随机游走，开高低围绕收盘价波动；每只股票的随机数只由种子和代码决定，
+    与股票数量和顺序无关，因此同一只股票单独生成与在全集中生成的结果一致。
+    """
+    n, m = len(symbols), len(dates)
+    close = np.empty((n, m))
+    open_ = np.empty((n, m))
+    high = np.empty((n, m))
+    low = np.empty((n, m))
+    volume = np.empty((n, m), dtype=np.int64)
+    turnover = np.empty((n, m))
+    for i, symbol in enumerate(symbols):
+        rng = np.random.default_rng(_symbol_seed(seed, synthetic_key(symbol)))
+        base_price = rng.uniform(5.0, 100.0)
+        sigma = rng.uniform(0.01, 0.03)
+        shares = rng.uniform(1e8, 5e9)
+        noise = rng.standard_normal((5, m), dtype=np.float32)
+        close[i] = base_price * np.exp(np.cumsum(noise[0] * sigma))
+        prev_close = np.concatenate(([base_price], close[i, :-1]))
+        open_[i] = prev_close * np.exp(noise[1] * sigma / 3)
+        high[i] = np.maximum(open_[i], close[i]) * np.exp(np.abs(noise[2]) * sigma / 2)
+        low[i] = np.minimum(open_[i], close[i]) * np.exp(-np.abs(noise[3]) * sigma / 2)
+        # 日换手约1%，对数正态波动
+        volume[i] = (shares * 0.01 * np.exp(noise[4] * 0.5)).astype(np.int64) // 100 * 100
+        turnover[i] = volume[i] / shares * 100
+    return {
+        "open": np.round(open_, 2),
+        "high": np.round(high, 2),
+        "low": np.round(low, 2),
+        "close": np.round(close, 2),
+        "volume": volume,
+        "turnover": np.round(turnover, 2),
+    }
+
+
+def synthetic_series(code: str, start_date: str, end_date: str, seed: int, history_start: str) -> OHLCVSeries:
+    """单只股票的模拟K线：始终从 history_start 生成，再截取请求区间，保证不同区间的数据一致"""
+    dates = synthetic_dates(history_start, end_date)
+    bars = synthetic_bars([code], dates, seed)
+    series = OHLCVSeries(dates, *(bars[name][0] for name in ("open", "high", "low", "close", "volume", "turnover")))
+    return series.slice(start_date, end_date)
+
+
+def synthetic_universe(market: str, size: int, seed: int) -> List[Dict[str, Any]]:
+    """生成某个市场的模拟股票列表（字段与股票列表索引一致）"""
+    from app.services.symbol_universe import classify_a_share
+
+    rng = np.random.default_rng([seed, zlib.crc32(market.encode("utf-8"))])
+    records = []
+    if market == "cn":
+        if size > len(_SYNTHETIC_CN_PREFIXES) * 10000:
+            raise ValueError(f"模拟A股数量不能超过 {len(_SYNTHETIC_CN_PREFIXES) * 10000}")
+        industries = rng.choice(_SYNTHETIC_INDUSTRIES, size)
+        for i in range(size):
+            code = f"{_SYNTHETIC_CN_PREFIXES[i % len(_SYNTHETIC_CN_PREFIXES)]}{i // len(_SYNTHETIC_CN_PREFIXES):04d}"
+            exchange, board = classify_a_share(code)
+            records.append({
+                "symbol": code, "name": f"模拟{code}", "market": "cn", "exchange": exchange,
+                "board": board, "industry": str(industries[i]),
+            })
+    elif market == "hk":
+        records = [
+            {"symbol": f"hk{i + 1:05d}", "name": f"模拟港股{i + 1:05d}", "market": "hk", "exchange": "hk", "board": "main", "industry": ""}
+            for i in range(size)
+        ]
+    elif market == "us":
+        letters = np.array(list("ABCDEFGHIJKLMNOPQRSTUVWXYZ"))
+        for i in range(size):
+            digits = [(i // 26 ** k) % 26 for k in range(3, -1, -1)]
+            code = "Z" + "".join(letters[digits])
+            records.append({"symbol": code, "name": f"Synthetic {code}", "market": "us", "exchange": "us", "board": "main", "industry": ""})
+    else:
+        raise ValueError(f"不支持的市场类型: {market}")
+    return records
+
+
+def synthetic_spot(market: str, size: int, seed: int, history_start: str) -> pd.DataFrame:
+    """模拟全市场行情快照（列名与东方财富行情快照一致），数据为各股票模拟K线的最新一根"""
+    # 缓存的 DataFrame 可变，返回副本避免调用方修改缓存
+    return _synthetic_spot(market, size, seed, history_start, datetime.now().strftime("%Y-%m-%d")).copy()
+
+
+@lru_cache(maxsize=8)
+def _synthetic_spot(market: str, size: int, seed: int, history_start: str, today: str) -> pd.DataFrame:
+    # 同一天内结果不变，快照过期重新获取时直接复用（调用方拿到的是副本，见 synthetic_spot）
+    records = synthetic_universe(market, size, seed)
+    symbols = [record["symbol"] for record in records]
+    dates = synthetic_dates(history_start, today)
+    bars = synthetic_bars(symbols, dates, seed)
+    return pd.DataFrame({
+        # 港股快照代码不带 hk 前缀
+        "代码": [synthetic_key(symbol) if market == "hk" else symbol for symbol in symbols],
+        "名称": [record["name"] for record in records],
+        "最新价": bars["close"][:, -1],
+        "今开": bars["open"][:, -1],
+        "最高": bars["high"][:, -1],
+        "最低": bars["low"][:, -1],
+        "成交量": bars["volume"][:, -1],
+        "换手率": bars["turnover"][:, -1],
+    })
+
+
+class ProviderRecordings:
+    """录制的数据源响应：按“数据源+代码+复权类型”一个 npz 文件，多次录制的区间合并保存
+
+    没有数据的响应也会录制（空文件），回放时同样返回“无数据”，保证回退链的走向与录制时一致。
+    数据源提供的前收盘参考价（prev_close，与K线按日期对齐，没有时为NaN）一并录制，回放时据此识别除权除息。
+    """
+
+    def __init__(self, base_dir: str):
+        self.base_dir = base_dir
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def _path(self, provider: str, code: str, adjust: str) -> str:
+        return os.path.join(self.base_dir, provider, f"{code.lower()}_{adjust or 'none'}.npz")
+
+    def _read(self, provider: str, code: str, adjust: str):
+        key = (provider, code.lower(), adjust)
+        if key not in self._cache:
+            series = None
+            path = self._path(provider, code, adjust)
+            if os.path.exists(path):
+                with np.load(path, allow_pickle=False) as archive:
+                    series = OHLCVSeries(*(archive[name] for name in OHLCVSeries.__slots__))
+                    # 早期录制没有前收盘
+                    prev_close = archive["prev_close"] if "prev_close" in archive.files else np.full(len(series), np.nan)
+                series = (series, prev_close)
+            self._cache[key] = series
+        return self._cache[key]
+
+    def load(self, provider: str, code: str, adjust: str):
+        """读取录制的 (K线, 前收盘)，未录制过时返回None"""
+        with self._lock:
+            return self._read(provider, code, adjust)
+
+    def save(self, provider: str, code: str, adjust: str, series: OHLCVSeries, prev_close: np.ndarray = None):
+        """录制一次响应，与已录制的数据合并（同一日期以新数据为准）"""
+        path = self._path(provider, code, adjust)
+        prev_close = np.full(len(series), np.nan) if prev_close is None else np.asarray(prev_close, dtype=np.float64)
+        with self._lock:
+            old = self._read(provider, code, adjust)
+            if old is not None:
+                old_series, old_prev_close = old
+                merged = OHLCVSeries.merge(old_series, series)
+                merged_prev_close = np.full(len(merged), np.nan)
+                merged_prev_close[np.searchsorted(merged.dates, old_series.dates)] = old_prev_close
+                merged_prev_close[np.searchsorted(merged.dates, series.dates)] = prev_close
+                series, prev_close = merged, merged_prev_close
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "wb") as f:
+                np.savez_compressed(f, prev_close=prev_close, **{name: getattr(series, name) for name in OHLCVSeries.__slots__})
+            os.replace(tmp_path, path)
+            self._cache[(provider, code.lower(), adjust)] = (series, prev_close)
+
+
+class DataProvider:
+    """可替换的数据源层：真实请求上游，或录制/回放/生成模拟数据用于离线压测与基准测试
+
+    回放和模拟模式按 (种子, 数据源, 代码, 第几次请求) 确定注入的延迟与失败，结果可复现。
+    """
+
+    def __init__(self, mode: str, recordings_dir: str, seed: int, injected_latency: Dict[str, float],
+                 injected_failure_rate: Dict[str, float], history_start: str):
+        if mode not in PROVIDER_MODES:
+            raise ValueError(f"不支持的数据源模式: {mode}，可选 {PROVIDER_MODES}")
+        self.mode = mode
+        self.seed = seed
+        self.injected_latency = dict(injected_latency)
+        self.injected_failure_rate = dict(injected_failure_rate)
+        self.history_start = history_start
+        self.recordings = ProviderRecordings(recordings_dir)
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    @property
+    def offline(self) -> bool:
+        return self.mode in ("replay", "synthetic")
+
+    def _inject(self, provider: str, code: str):
+        """按配置注入延迟（对数正态分布，配置值为中位数）和失败"""
+        with self._lock:
+            n = self._calls.get((provider, code), 0)
+            self._calls[(provider, code)] = n + 1
+        rng = np.random.default_rng(_symbol_seed(self.seed, f"{provider}:{code}") + [n])
+        latency = self.injected_latency.get(provider, 0.0)
+        if latency > 0:
+            time.sleep(latency * rng.lognormal(0.0, 0.5))
+        if rng.random() < self.injected_failure_rate.get(provider, 0.0):
+            raise InjectedFailure(f"注入的数据源故障: {provider} {code}")
+
+    def fetch(self, provider: str, code: str, start_date: str, end_date: str, adjust: str,
+              live_call: Callable[[], pd.DataFrame]) -> pd.DataFrame:
+        """获取K线（标准中文列）；没有数据时与真实数据源一样抛出 ValueError"""
+        if self.mode == "live":
+            return live_call()
+        if self.mode == "record":
+            return self._record(provider, code, start_date, end_date, adjust, live_call)
+
+        self._inject(provider, code)
+        prev_close = None
+        if self.mode == "synthetic":
+            series = synthetic_series(code, start_date, end_date, self.seed, self.history_start)
+        else:
+            recorded = self.recordings.load(provider, code, adjust)
+            series = recorded[0].slice(start_date, end_date) if recorded is not None else OHLCVSeries.empty()
+            if recorded is not None:
+                prev_close = recorded[1][np.searchsorted(recorded[0].dates, series.dates)]
+        if not len(series):
+            raise ValueError(f"股票 {code} 在指定日期范围内没有数据")
+        frame = series.to_frame()
+        if prev_close is not None and not np.isnan(prev_close).all():
+            frame[PREV_CLOSE_COLUMN] = prev_close
+        return frame
+
+    def _record(self, provider, code, start_date, end_date, adjust, live_call) -> pd.DataFrame:
+        try:
+            stock_data_df = live_call()
+        except ValueError:
+            self.recordings.save(provider, code, adjust, OHLCVSeries.empty())
+            raise
+        frame = normalize_history_frame(stock_data_df)
+        prev_close = frame[PREV_CLOSE_COLUMN].to_numpy(dtype=np.float64) if PREV_CLOSE_COLUMN in frame.columns else None
+        self.recordings.save(provider, code, adjust, OHLCVSeries.from_frame(frame), prev_close)
+        return stock_data_df
+
+
+# 全局共享数据源层
+data_provider = DataProvider(
+    settings.DATA_PROVIDER_MODE,
+    settings.PROVIDER_RECORDINGS_DIR or os.path.join(settings.DATA_DIR, "recordings"),
+    settings.PROVIDER_SEED,
+    settings.PROVIDER_INJECTED_LATENCY,
+    settings.PROVIDER_INJECTED_FAILURE_RATE,
+    settings.SYNTHETIC_HISTORY_START,
+)
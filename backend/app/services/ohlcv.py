@@ -0,0 +1,151 @@
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+
+# 日期以自1970-01-01起的天数保存
+_EPOCH = np.datetime64("1970-01-01", "D")
+
+
+def date_to_ordinal(date_str: str) -> int:
+    """YYYY-MM-DD 转换为自1970-01-01起的天数"""
+    return int((np.datetime64(date_str, "D") - _EPOCH).astype(np.int64))
+
+
+def ordinals_to_strings(ordinals: np.ndarray) -> np.ndarray:
+    """天数数组转换为 YYYY-MM-DD 字符串数组"""
+    return ordinals.astype("datetime64[D]").astype(str)
+
+
+class OHLCVSeries:
+    """紧凑的K线序列：每列一个 numpy 数组，按日期升序且日期唯一
+
+    日期为 int32 天数，价格与换手率为 float64，成交量为 int64；
+    按日期区间切片返回共享底层数组的视图，不复制数据。
+    """
+    __slots__ = ("dates", "open", "high", "low", "close", "volume", "turnover")
+
+    def __init__(self, dates, open, high, low, close, volume, turnover):
+        self.dates = np.asarray(dates, dtype=np.int32)
+        self.open = np.asarray(open, dtype=np.float64)
+        self.high = np.asarray(high, dtype=np.float64)
+        self.low = np.asarray(low, dtype=np.float64)
+        self.close = np.asarray(close, dtype=np.float64)
+        self.volume = np.asarray(volume, dtype=np.int64)
+        self.turnover = np.asarray(turnover, dtype=np.float64)
+
+    @classmethod
+    def empty(cls) -> "OHLCVSeries":
+        return cls(*([[]] * 7))
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "OHLCVSeries":
+        """由标准中文列的 DataFrame 构建（见 normalize_history_frame）"""
+        return cls(
+            pd.to_datetime(df["日期"]).values.astype("datetime64[D]").astype(np.int32),
+            df["开盘"].to_numpy(),
+            df["最高"].to_numpy(),
+            df["最低"].to_numpy(),
+            df["收盘"].to_numpy(),
+            df["成交量"].to_numpy(),
+            df["换手率"].to_numpy(),
+        )
+
+    @classmethod
+    def from_records(cls, records: List[Dict[str, Any]]) -> "OHLCVSeries":
+        """由英文字段的K线字典列表构建（如前端传入的历史数据），按日期排序去重"""
+        if not records:
+            return cls.empty()
+        df = pd.DataFrame(records)
+        if "turnover" not in df.columns:
+            df["turnover"] = 0.0
+        df = df.drop_duplicates(subset="date", keep="last").sort_values(by="date")
+        return cls(
+            pd.to_datetime(df["date"]).values.astype("datetime64[D]").astype(np.int32),
+            df["open"].to_numpy(),
+            df["high"].to_numpy(),
+            df["low"].to_numpy(),
+            df["close"].to_numpy(),
+            df["volume"].to_numpy(),
+            df["turnover"].to_numpy(),
+        )
+
+    @classmethod
+    def coerce(cls, history) -> "OHLCVSeries":
+        """接受 OHLCVSeries 或K线字典列表"""
+        return history if isinstance(history, cls) else cls.from_records(history or [])
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    def _take(self, index) -> "OHLCVSeries":
+        series = OHLCVSeries.__new__(OHLCVSeries)
+        for name in self.__slots__:
+            setattr(series, name, getattr(self, name)[index])
+        return series
+
+    def slice(self, start_date: str, end_date: str) -> "OHLCVSeries":
+        """按日期区间（含首尾）截取，返回视图"""
+        lo = int(np.searchsorted(self.dates, date_to_ordinal(start_date), side="left"))
+        hi = int(np.searchsorted(self.dates, date_to_ordinal(end_date), side="right"))
+        return self._take(slice(lo, hi))
+
+    def tail(self, n: int) -> "OHLCVSeries":
+        """最近 n 根K线，返回视图"""
+        return self._take(slice(max(0, len(self) - n), None))
+
+    @staticmethod
+    def merge(old: "OHLCVSeries", new: "OHLCVSeries") -> "OHLCVSeries":
+        """合并两段K线，同一日期以新数据为准"""
+        combined = OHLCVSeries(*(np.concatenate([getattr(old, name), getattr(new, name)]) for name in OHLCVSeries.__slots__))
+        # 稳定排序保证相同日期中新数据排在最后，再保留每个日期的最后一条
+        order = np.argsort(combined.dates, kind="stable")
+        dates = combined.dates[order]
+        keep = order[np.append(dates[1:] != dates[:-1], True)] if len(dates) else order
+        return combined._take(keep)
+
+    @property
+    def first_date(self) -> str:
+        return str(ordinals_to_strings(self.dates[:1])[0])
+
+    @property
+    def last_date(self) -> str:
+        return str(ordinals_to_strings(self.dates[-1:])[0])
+
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self, name).nbytes for name in self.__slots__)
+
+    def date_strings(self) -> np.ndarray:
+        return ordinals_to_strings(self.dates)
+
+    def latest(self) -> Dict[str, Any]:
+        """最近一根K线"""
+        return self.tail(1).to_records()[0]
+
+    def to_records(self) -> List[Dict[str, Any]]:
+        """英文字段的K线字典列表（用于生成AI提示等少量数据的场景）"""
+        dates = self.date_strings().tolist()
+        volume = self.volume.tolist()
+        turnover = self.turnover.tolist()
+        return [
+            {
+                "date": date, "open": o, "close": c, "high": h, "low": l, "volume": v, "turnover": t,
+                "volume_turnover_product": v * t,
+            }
+            for date, o, c, h, l, v, t in zip(
+                dates, self.open.tolist(), self.close.tolist(), self.high.tolist(), self.low.tolist(), volume, turnover
+            )
+        ]
+
+    def to_frame(self) -> pd.DataFrame:
+        """标准中文列的 DataFrame（特征计算使用）"""
+        return pd.DataFrame({
+            "日期": self.date_strings(),
+            "开盘": self.open,
+            "收盘": self.close,
+            "最高": self.high,
+            "最低": self.low,
+            "成交量": self.volume,
+            "换手率": self.turnover,
+        })
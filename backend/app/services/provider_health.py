@@ -0,0 +1,286 @@
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+
+
+class ProviderUnavailable(Exception):
+    """数据源熔断中或限流等待超时，暂不可用"""
+
+
+class TokenBucket:
+    """令牌桶限流：按固定速率补充令牌，允许不超过容量的突发请求"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, timeout: float) -> bool:
+        """取得一个令牌，最多等待 timeout 秒"""
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    @property
+    def tokens(self) -> float:
+        with self._lock:
+            self._refill(time.monotonic())
+            return self._tokens
+
+
+class CircuitBreaker:
+    """熔断器：连续失败达到阈值后打开，打开期间直接跳过；冷却后放行一次试探请求，成功则关闭"""
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, open_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+
+    def available(self) -> bool:
+        """是否可能放行请求（不改变状态，用于在回退链中跳过熔断的数据源）"""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            return time.monotonic() - self.opened_at >= self.open_seconds
+        return not self._probing
+
+    def allow(self) -> bool:
+        """请求前调用：冷却结束时转为半开并只放行一次试探"""
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.open_seconds:
+            self.state = self.HALF_OPEN
+            self._probing = False
+        if self.state == self.HALF_OPEN:
+            if self._probing:
+                return False
+            self._probing = True
+            return True
+        return self.state == self.CLOSED
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self._probing = False
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+        self._probing = False
+
+    def release(self):
+        """试探请求未得出结果（如被取消）时释放试探名额"""
+        self._probing = False
+
+
+class ProviderHealth:
+    """单个数据源的限流器、熔断器及最近请求的延迟与结果"""
+
+    def __init__(self, name: str, rate: float, burst: float, window: int):
+        self.name = name
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker(settings.PROVIDER_BREAKER_FAILURE_THRESHOLD, settings.PROVIDER_BREAKER_OPEN_SECONDS)
+        # 最近 window 次请求的 (延迟秒数, 是否出错)
+        self.recent = deque(maxlen=window)
+        self.total_calls = 0
+        self.total_errors = 0
+        self.rejected = 0
+        self.last_error = None
+
+
+class MarketStats:
+    """某个数据源在某个市场上最近一段时间内的请求结果，用于动态排序"""
+    # 请求结果：返回了数据、正常返回但无数据、出错
+    OK = "ok"
+    EMPTY = "empty"
+    ERROR = "error"
+
+    def __init__(self, window: int, window_seconds: float):
+        self.window_seconds = window_seconds
+        # (时间戳, 延迟秒数, 结果)
+        self.samples = deque(maxlen=window)
+
+    def add(self, latency: float, outcome: str):
+        self.samples.append((time.time(), latency, outcome))
+
+    def recent(self) -> List[Tuple[float, str]]:
+        """只统计时间窗口内的样本（数据源延迟随时段变化较大）"""
+        cutoff = time.time() - self.window_seconds
+        return [(latency, outcome) for ts, latency, outcome in self.samples if ts >= cutoff]
+
+    def summary(self) -> Dict[str, Any]:
+        samples = self.recent()
+        if not samples:
+            return {"samples": 0, "success_rate": None, "latency_p50": None, "latency_p95": None}
+        latencies = sorted(latency for latency, _ in samples)
+        successes = sum(1 for _, outcome in samples if outcome == self.OK)
+        return {
+            "samples": len(samples),
+            "success_rate": successes / len(samples),
+            "latency_p50": _percentile(latencies, 0.5),
+            "latency_p95": _percentile(latencies, 0.95),
+        }
+
+
+def _percentile(sorted_values: List[float], p: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(p * len(sorted_values)))]
+
+
+class ProviderHealthRegistry:
+    """各数据源的健康登记表：请求前限流并检查熔断，请求后记录延迟与结果
+
+    同时按“数据源+市场”统计最近的延迟与成功率，据此动态调整回退链顺序。
+    """
+
+    def __init__(self, rate_limits: Dict[str, float], burst: float, window: int):
+        self._rate_limits = dict(rate_limits)
+        self._burst = burst
+        self._window = window
+        self._providers = {}
+        self._market_stats = {}
+        self._lock = threading.Lock()
+
+    def _get(self, provider: str) -> ProviderHealth:
+        with self._lock:
+            if provider not in self._providers:
+                rate = self._rate_limits.get(provider, min(self._rate_limits.values(), default=1.0))
+                self._providers[provider] = ProviderHealth(provider, rate, self._burst, self._window)
+            return self._providers[provider]
+
+    def available(self, provider: str) -> bool:
+        """数据源当前是否可用（熔断打开且未到冷却时间时为False）"""
+        health = self._get(provider)
+        with self._lock:
+            return health.breaker.available()
+
+    def acquire(self, provider: str, timeout: float):
+        """请求前调用：检查熔断并取得限流令牌，不可用时抛出 ProviderUnavailable"""
+        health = self._get(provider)
+        with self._lock:
+            allowed = health.breaker.allow()
+            if not allowed:
+                health.rejected += 1
+        if not allowed:
+            raise ProviderUnavailable(f"数据源 {provider} 熔断中，暂时跳过")
+        if not health.bucket.acquire(timeout):
+            with self._lock:
+                health.breaker.release()
+                health.rejected += 1
+            raise ProviderUnavailable(f"等待数据源 {provider} 限流令牌超时")
+
+    def record(self, provider: str, latency: float, error: Exception = None, market: str = None, empty: bool = False):
+        """记录一次请求结果；error 为None表示成功（包括数据源正常返回“无数据”，此时 empty 为True）
+
+        指定 market 时同时计入该市场的排序统计，“无数据”在排序统计中不算成功。
+        """
+        health = self._get(provider)
+        if market is not None:
+            outcome = MarketStats.ERROR if error is not None else (MarketStats.EMPTY if empty else MarketStats.OK)
+            self.record_market(provider, market, latency, outcome)
+        with self._lock:
+            health.recent.append((latency, error is not None))
+            health.total_calls += 1
+            if error is None:
+                health.breaker.record_success()
+            else:
+                health.total_errors += 1
+                health.last_error = str(error)
+                health.breaker.record_failure()
+
+    def record_market(self, provider: str, market: str, latency: float, outcome: str):
+        """记录数据源在某个市场上的一次请求结果（MarketStats.OK / EMPTY / ERROR）"""
+        with self._lock:
+            key = (provider, market)
+            if key not in self._market_stats:
+                self._market_stats[key] = MarketStats(self._window, settings.PROVIDER_STATS_WINDOW_SECONDS)
+            self._market_stats[key].add(latency, outcome)
+
+    def market_summary(self, provider: str, market: str) -> Dict[str, Any]:
+        with self._lock:
+            stats = self._market_stats.get((provider, market))
+            return stats.summary() if stats else MarketStats(1, 0).summary()
+
+    def _expected_cost(self, provider: str, market: str) -> float:
+        """预期获取成本：中位延迟 / 成功率；样本不足的数据源视为0，优先尝试以积累样本"""
+        summary = self.market_summary(provider, market)
+        if summary["samples"] < settings.PROVIDER_RANK_MIN_SAMPLES:
+            return 0.0
+        return summary["latency_p50"] / max(summary["success_rate"], 0.05)
+
+    def rank(self, market: str, candidates: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+        """按各数据源在该市场上的预期成本重新排序 (数据源, 代码) 候选，同一数据源内保持原顺序"""
+        costs = {provider: self._expected_cost(provider, market) for provider in dict.fromkeys(p for p, _ in candidates)}
+        return sorted(candidates, key=lambda candidate: costs[candidate[0]])
+
+    def hedge_delay(self, provider: str, market: str, default: float) -> float:
+        """对冲等待时间：取主数据源在该市场上的p95延迟（不超过配置值），样本不足时使用配置值"""
+        summary = self.market_summary(provider, market)
+        if summary["samples"] < settings.PROVIDER_RANK_MIN_SAMPLES:
+            return default
+        return min(default, max(summary["latency_p95"], 0.1))
+
+    def release(self, provider: str):
+        """请求被取消、未得出结果时调用"""
+        health = self._get(provider)
+        with self._lock:
+            health.breaker.release()
+
+    def stats(self) -> Dict[str, Any]:
+        """各数据源最近的延迟分位数、错误率、熔断状态、剩余令牌及分市场统计"""
+        with self._lock:
+            providers = list(self._providers.values())
+            result = {}
+            for health in providers:
+                latencies = sorted(latency for latency, _ in health.recent)
+                errors = sum(1 for _, failed in health.recent if failed)
+                result[health.name] = {
+                    "state": health.breaker.state,
+                    "consecutive_failures": health.breaker.consecutive_failures,
+                    "recent_calls": len(health.recent),
+                    "error_rate": errors / len(health.recent) if health.recent else 0.0,
+                    "latency_p50": _percentile(latencies, 0.5),
+                    "latency_p95": _percentile(latencies, 0.95),
+                    "rate_limit": health.bucket.rate,
+                    "tokens": round(health.bucket.tokens, 2),
+                    "total_calls": health.total_calls,
+                    "total_errors": health.total_errors,
+                    "rejected": health.rejected,
+                    "last_error": health.last_error,
+                    "markets": {
+                        market: stats.summary()
+                        for (provider, market), stats in self._market_stats.items() if provider == health.name
+                    },
+                }
+            return result
+
+
+# 全局共享数据源健康登记表
+provider_registry = ProviderHealthRegistry(
+    settings.PROVIDER_RATE_LIMITS, settings.PROVIDER_RATE_BURST, settings.PROVIDER_HEALTH_WINDOW
+)
@@ -0,0 +1,112 @@
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from app.services.ohlcv import OHLCVSeries, date_to_ordinal
+from app.services.screening_expression import (
+    COMPARE_OPERATORS, CONDITION, SERIES_FIELDS, VALUE, ExpressionCompiler, ScreeningProgram,
+)
+
+# 规则可用的K线字段（规则指标也可以是特征名或数值表达式，见 screening_expression）
+RULE_FIELDS = SERIES_FIELDS
+
+
+class ScreeningTable:
+    """待筛选的股票及其最近若干根K线：每个字段一个 股票×K线 的二维数组
+
+    各行按K线右对齐（最后一列为该股票区间内最新的K线，停牌日不占位），历史不足的部分在左侧补NaN。
+    """
+    __slots__ = ("symbols", "columns")
+
+    def __init__(self, symbols: np.ndarray, columns: Dict[str, np.ndarray]):
+        self.symbols = np.asarray(symbols, dtype=object)
+        self.columns = columns
+
+    def __len__(self) -> int:
+        return len(self.symbols)
+
+    @property
+    def width(self) -> int:
+        return next(iter(self.columns.values())).shape[1] if self.columns else 0
+
+    @classmethod
+    def from_latest(cls, symbols: np.ndarray, columns: Dict[str, np.ndarray], fields) -> "ScreeningTable":
+        """由只有最新K线的列数据（如行情快照）构建，每个字段为单列"""
+        return cls(symbols, {field: np.asarray(columns[field], dtype=np.float64)[:, None] for field in fields})
+
+    def take(self, index) -> "ScreeningTable":
+        return ScreeningTable(self.symbols[index], {field: values[index] for field, values in self.columns.items()})
+
+    @staticmethod
+    def concat(tables: List["ScreeningTable"]) -> "ScreeningTable":
+        """纵向拼接，K线数不同时在左侧补NaN"""
+        width = max(table.width for table in tables)
+
+        def pad(values: np.ndarray) -> np.ndarray:
+            if values.shape[1] == width:
+                return values
+            return np.concatenate([np.full((len(values), width - values.shape[1]), np.nan), values], axis=1)
+
+        fields = tables[0].columns.keys()
+        return ScreeningTable(
+            np.concatenate([table.symbols for table in tables]),
+            {field: np.concatenate([pad(table.columns[field]) for table in tables]) for field in fields},
+        )
+
+    @classmethod
+    def from_series(cls, symbols: List[str], series_list: List[Optional[OHLCVSeries]], fields,
+                    window: Optional[int]) -> "ScreeningTable":
+        """由各股票的K线序列取最近 window 根（None 为全部），没有数据的股票各字段为NaN"""
+        if window is None:
+            window = max([len(series) for series in series_list if series is not None], default=1) or 1
+        columns = {field: np.full((len(symbols), window), np.nan) for field in fields}
+        for i, series in enumerate(series_list):
+            if series is None or not len(series):
+                continue
+            k = min(window, len(series))
+            for field in fields:
+                columns[field][i, window - k:] = getattr(series, field)[-k:]
+        return cls(np.array(symbols, dtype=object), columns)
+
+    @classmethod
+    def from_panel(cls, panel, start_date: str, end_date: str, fields, window: Optional[int]) -> "ScreeningTable":
+        """取面板 [start_date, end_date] 内每只股票最近 window 根有数据的K线（None 为区间内全部）
+
+        停牌（收盘价为NaN）的交易日被剔除，各行有数据的K线整体移到右侧，与逐只读取历史数据的结果一致。
+        """
+        end = panel.columns_until(end_date)
+        start = min(int(np.searchsorted(panel.dates, date_to_ordinal(start_date), side="left")), end)
+        width = end - start
+        window = width if window is None else window
+        columns = {field: np.full((len(panel.symbols), max(window, 1)), np.nan) for field in fields}
+        if width:
+            traded = ~np.isnan(np.asarray(panel["close"][:, start:end]))
+            # 每行第 j 个有数据的K线放到 (window - 该行K线数 + j) 列，超出窗口的（负列号）丢弃
+            dest = np.cumsum(traded, axis=1) - 1 + (window - traded.sum(axis=1))[:, None]
+            rows, cols = np.nonzero(traded)
+            keep = dest[rows, cols] >= 0
+            rows, cols = rows[keep], cols[keep]
+            for field in fields:
+                columns[field][rows, dest[rows, cols]] = np.asarray(panel[field][:, start:end])[rows, cols]
+        return cls(panel.symbols.astype(object), columns)
+
+
+def compile_rules(rules: List[Dict[str, Any]], expression: Optional[str] = None) -> ScreeningProgram:
+    """把规则列表及条件表达式编译为一个筛选程序，全部成立时匹配
+
+    规则的指标可以是K线字段、特征名或数值表达式（如 ma(close, 5)）；表达式支持 and/or/not 分组。
+    不支持的指标、函数或操作符在编译时抛出 ValueError。
+    """
+    program = ScreeningProgram()
+    compiler = ExpressionCompiler(program)
+    for rule in rules:
+        if rule["operator"] not in COMPARE_OPERATORS:
+            raise ValueError(f"不支持的操作符: {rule['operator']}，可选 {' '.join(COMPARE_OPERATORS)}")
+        indicator = compiler.compile(str(rule["indicator"]), VALUE)
+        value = program.add("const", params=(float(rule["value"]),))
+        program.roots.append(program.add(COMPARE_OPERATORS[rule["operator"]], (indicator, value), kind=CONDITION))
+    if expression and expression.strip():
+        program.roots.append(compiler.compile(expression, CONDITION))
+    if not program.roots:
+        raise ValueError("至少需要一条筛选规则或一个条件表达式")
+    return program
@@ -0,0 +1,355 @@
+import ast
+import re
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.services.feature_engine import CONSOLIDATION_THRESHOLD, CONSOLIDATION_WINDOW
+
+# 表达式可直接引用的K线字段
+SERIES_FIELDS = ("close", "open", "high", "low", "volume", "turnover")
+# 已有特征按表达式展开（与 feature_engine.compute_feature_frame 的计算一致），与用户表达式共享公共子表达式
+FEATURE_EXPRESSIONS = {
+    "avg_volume_short": "ma(volume, 5)",
+    "avg_volume_long": "ma(volume, 20)",
+    "volume_ratio": "avg_volume_short / (avg_volume_long + 0.01)",
+    "turnover_mean": "ma(turnover, 10)",
+    "price_range": "(high - low) / open * 100",
+    "kline_shadow_ratio": "(high - max(open, close)) / (min(open, close) - low + 0.01)",
+    "consolidation_days": f"run_length(std(close, {CONSOLIDATION_WINDOW}) / ma(close, {CONSOLIDATION_WINDOW}) * 100 < {CONSOLIDATION_THRESHOLD})",
+    "volatility_trend": "ma(price_range, 5)",
+}
+# 规则/表达式中的比较操作符
+COMPARE_OPERATORS = {
+    ">": "gt",
+    "<": "lt",
+    ">=": "ge",
+    "<=": "le",
+    "==": "eq",
+    "!=": "ne",
+}
+_AST_COMPARE = {ast.Gt: "gt", ast.Lt: "lt", ast.GtE: "ge", ast.LtE: "le", ast.Eq: "eq", ast.NotEq: "ne"}
+_AST_ARITHMETIC = {ast.Add: "add", ast.Sub: "sub", ast.Mult: "mul", ast.Div: "div"}
+
+# 节点类型：数值序列、条件（布尔）序列
+VALUE, CONDITION = "value", "condition"
+
+
+def _shift(x: np.ndarray, n: int) -> np.ndarray:
+    """沿时间轴后移 n 根K线，前面补NaN"""
+    out = np.full(x.shape, np.nan)
+    if n < x.shape[1]:
+        out[:, n:] = x[:, :x.shape[1] - n]
+    return out
+
+
+def _window_sums(x: np.ndarray, n: int) -> np.ndarray:
+    """沿时间轴的 n 根K线滚动和（前缀和相减），窗口内有缺失或不足 n 根时为NaN（与 pandas rolling 默认一致）"""
+    out = np.full(x.shape, np.nan)
+    if n > x.shape[1]:
+        return out
+    missing = np.isnan(x)
+    total = np.cumsum(np.where(missing, 0.0, x), axis=1)
+    out[:, n - 1:] = total[:, n - 1:]
+    out[:, n:] -= total[:, :-n]
+    if missing.any():
+        count = np.cumsum(missing, axis=1, dtype=np.int32)
+        gaps = count[:, n - 1:].copy()
+        gaps[:, 1:] -= count[:, :-n]
+        out[:, n - 1:][gaps > 0] = np.nan
+    return out
+
+
+def _rolling_mean(x: np.ndarray, n: int) -> np.ndarray:
+    return _window_sums(x, n) / n
+
+
+def _rolling_std(x: np.ndarray, n: int) -> np.ndarray:
+    """滚动样本标准差（ddof=1）；先减去各行均值，避免平方和相减时损失精度"""
+    if n < 2:
+        return np.full(x.shape, np.nan)
+    valid = ~np.isnan(x)
+    center = np.where(valid, x, 0.0).sum(axis=1) / np.maximum(valid.sum(axis=1), 1)
+    x = x - center[:, None]
+    total, squares = _window_sums(x, n), _window_sums(x * x, n)
+    return np.sqrt(np.maximum((squares - total * total / n) / (n - 1), 0.0))
+
+
+def _rolling_extreme(ufunc) -> Callable:
+    """滚动最大/最小值：窗口长度按倍增合并，计算量与窗口长度的对数成正比"""
+    def kernel(x: np.ndarray, n: int) -> np.ndarray:
+        out, span = x, 1
+        while span * 2 <= n:
+            out = ufunc(out, _shift(out, span))
+            span *= 2
+        if span < n:
+            # 两个长度为 span 的窗口重叠覆盖 n 根K线
+            out = ufunc(out, _shift(out, n - span))
+        return out
+    return kernel
+
+
+def _cross(a, b) -> np.ndarray:
+    """a 在当前K线上穿 b：当前 a > b 且上一根K线 a <= b"""
+    diff = np.asarray(a - b, dtype=np.float64)
+    return (diff > 0) & (_shift(diff, 1) <= 0)
+
+
+def _run_length(condition: np.ndarray) -> np.ndarray:
+    """条件连续成立的K线数（与横盘天数的计算方式相同），条件不成立的位置为0"""
+    idx = np.arange(condition.shape[1])
+    last_break = np.maximum.accumulate(np.where(condition, -1, idx), axis=1)
+    return (idx - last_break).astype(np.float64)
+
+
+# 各运算的向量化实现，输入输出均为 股票×K线 的二维数组（常量为标量）
+KERNELS = {
+    "add": np.add,
+    "sub": np.subtract,
+    "mul": np.multiply,
+    "div": np.divide,
+    "neg": np.negative,
+    "gt": np.greater,
+    "lt": np.less,
+    "ge": np.greater_equal,
+    "le": np.less_equal,
+    "eq": np.equal,
+    "ne": np.not_equal,
+    "and": np.logical_and,
+    "or": np.logical_or,
+    "not": np.logical_not,
+    "abs": np.abs,
+    "max": np.maximum,
+    "min": np.minimum,
+    "ma": _rolling_mean,
+    "std": _rolling_std,
+    "sum": _window_sums,
+    "highest": _rolling_extreme(np.maximum),
+    "lowest": _rolling_extreme(np.minimum),
+    "ref": _shift,
+    "cross_above": _cross,
+    "cross_below": lambda a, b: _cross(b, a),
+    "run_length": _run_length,
+}
+# 函数名 -> (序列参数类型, 是否带窗口参数, 返回类型)
+FUNCTIONS = {
+    "ma": ((VALUE,), True, VALUE),
+    "std": ((VALUE,), True, VALUE),
+    "sum": ((VALUE,), True, VALUE),
+    "highest": ((VALUE,), True, VALUE),
+    "lowest": ((VALUE,), True, VALUE),
+    "ref": ((VALUE,), True, VALUE),
+    "abs": ((VALUE,), False, VALUE),
+    "max": ((VALUE, VALUE), False, VALUE),
+    "min": ((VALUE, VALUE), False, VALUE),
+    "cross_above": ((VALUE, VALUE), False, CONDITION),
+    "cross_below": ((VALUE, VALUE), False, CONDITION),
+    "run_length": ((CONDITION,), False, VALUE),
+}
+
+
+class ScreeningProgram:
+    """编译后的筛选程序：去重后的运算节点按依赖顺序排列，相同子表达式（如同一条均线）只计算一次
+
+    所有条件（roots）在各股票最后一根K线上同时成立时匹配，因此每个节点只计算上层节点用到的最后若干列。
+    """
+
+    def __init__(self):
+        # 每个节点为 (运算, 子节点编号, 参数)，运算为 field/const 或 KERNELS 中的名称
+        self.nodes: List[Tuple[str, Tuple[int, ...], tuple]] = []
+        self.kinds: List[str] = []
+        # 计算该节点最后一根K线所需的K线数，None 表示依赖全部历史（如连续天数）；常量为0
+        self.lookbacks: List[Optional[int]] = []
+        # 计算一列结果需要向前多取的输入列数，None 表示需要全部输入列
+        self.extras: List[Optional[int]] = []
+        self.roots: List[int] = []
+        self._index: Dict[tuple, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    @property
+    def fields(self) -> List[str]:
+        """用到的K线字段（至少包含 close，用于确定股票数）"""
+        return [params[0] for op, _, params in self.nodes if op == "field"] or ["close"]
+
+    @property
+    def lookback(self) -> Optional[int]:
+        """各条件所需的最长K线数"""
+        lookbacks = [self.lookbacks[root] for root in self.roots]
+        if any(lookback is None for lookback in lookbacks):
+            return None
+        return max(lookbacks, default=1) or 1
+
+    def add(self, op: str, args: Tuple[int, ...] = (), params: tuple = (), kind: str = VALUE, extra: int = 0) -> int:
+        """添加节点并返回编号；相同运算、相同子节点与参数的节点复用已有编号"""
+        key = (op, args, params)
+        if key in self._index:
+            return self._index[key]
+        if op == "field":
+            lookback = 1
+        elif op == "const":
+            lookback = 0
+        else:
+            child = [self.lookbacks[arg] for arg in args]
+            lookback = None if op == "run_length" or None in child else max(child) + extra
+        self.nodes.append(key)
+        self.kinds.append(kind)
+        self.lookbacks.append(lookback)
+        self.extras.append(None if op == "run_length" else extra)
+        self._index[key] = len(self.nodes) - 1
+        return len(self.nodes) - 1
+
+    def _widths(self, width: int) -> List[int]:
+        """各节点需要计算的列数：从条件（只需最后一列）向下逐层累加窗口，不超过数据的列数"""
+        needs = [1] * len(self.nodes)
+        for i in range(len(self.nodes) - 1, -1, -1):
+            extra = self.extras[i]
+            span = width if extra is None else min(needs[i] + extra, width)
+            for arg in self.nodes[i][1]:
+                needs[arg] = max(needs[arg], span)
+        return needs
+
+    def evaluate(self, columns: Dict[str, np.ndarray]) -> np.ndarray:
+        """在 股票×K线（右对齐，最后一列为最新K线）的字段数组上计算，返回各股票是否匹配"""
+        first = next(iter(columns.values()))
+        n, width = first.shape
+        needs = self._widths(width)
+        values = []
+        with np.errstate(divide="ignore", invalid="ignore"):
+            for i, (op, args, params) in enumerate(self.nodes):
+                if op == "field":
+                    values.append(np.asarray(columns[params[0]][:, -needs[i]:], dtype=np.float64))
+                elif op == "const":
+                    values.append(params[0])
+                else:
+                    span = width if self.extras[i] is None else needs[i] + self.extras[i]
+                    inputs = [values[arg] if np.ndim(values[arg]) < 2 else values[arg][:, -span:] for arg in args]
+                    result = KERNELS[op](*inputs, *params)
+                    values.append(result[:, -needs[i]:] if np.ndim(result) == 2 else result)
+        mask = np.ones(n, dtype=bool)
+        for root in self.roots:
+            result = values[root]
+            if np.ndim(result) < 2:
+                # 只由常量组成的条件
+                result = np.full((n, 1), bool(result))
+            # 逐条原位合并，避免为每个条件分配新的掩码
+            np.logical_and(mask, result[:, -1], out=mask)
+        return mask
+
+
+class ExpressionCompiler:
+    """把表达式文本解析（Python 语法子集）并编译进 ScreeningProgram
+
+    支持：K线字段与特征名、数字常量、+ - * /、比较、and/or/not 及括号分组、FUNCTIONS 中的函数。
+    """
+
+    def __init__(self, program: ScreeningProgram):
+        self.program = program
+        self._features: Dict[str, int] = {}
+
+    def compile(self, text: str, kind: str) -> int:
+        # 兼容大写的 AND/OR/NOT
+        source = re.sub(r"\b(AND|OR|NOT)\b", lambda m: m.group(1).lower(), text.strip())
+        try:
+            tree = ast.parse(source, mode="eval")
+        except SyntaxError as e:
+            raise ValueError(f"表达式语法错误: {text}（{e.msg}）")
+        node = self._visit(tree.body)
+        self._expect(node, kind, text)
+        return node
+
+    def _expect(self, node: int, kind: str, text) -> None:
+        if self.program.kinds[node] != kind:
+            expected = "条件（比较、and/or、cross_above 等）" if kind == CONDITION else "数值"
+            raise ValueError(f"{text if isinstance(text, str) else ast.unparse(text)} 应为{expected}")
+
+    def _feature(self, name: str) -> int:
+        if name not in self._features:
+            self._features[name] = self.compile(FEATURE_EXPRESSIONS[name], VALUE)
+        return self._features[name]
+
+    def _visit(self, node: ast.AST) -> int:
+        program = self.program
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+            return program.add("const", params=(float(node.value),))
+        if isinstance(node, ast.Name):
+            if node.id in SERIES_FIELDS:
+                return program.add("field", params=(node.id,))
+            if node.id in FEATURE_EXPRESSIONS:
+                return self._feature(node.id)
+            raise ValueError(f"未知的指标: {node.id}，可选 {'、'.join(SERIES_FIELDS + tuple(FEATURE_EXPRESSIONS))}")
+        if isinstance(node, ast.BinOp) and type(node.op) in _AST_ARITHMETIC:
+            return program.add(_AST_ARITHMETIC[type(node.op)], (self._value(node.left), self._value(node.right)))
+        if isinstance(node, ast.UnaryOp):
+            if isinstance(node.op, ast.USub):
+                return program.add("neg", (self._value(node.operand),))
+            if isinstance(node.op, ast.UAdd):
+                return self._value(node.operand)
+            if isinstance(node.op, ast.Not):
+                return program.add("not", (self._condition(node.operand),), kind=CONDITION)
+        if isinstance(node, ast.BoolOp):
+            op = "and" if isinstance(node.op, ast.And) else "or"
+            result = self._condition(node.values[0])
+            for value in node.values[1:]:
+                result = program.add(op, (result, self._condition(value)), kind=CONDITION)
+            return result
+        if isinstance(node, ast.Compare) and all(type(op) in _AST_COMPARE for op in node.ops):
+            # 连续比较 a < b < c 等价于 a < b and b < c
+            operands = [self._value(operand) for operand in [node.left] + node.comparators]
+            result = None
+            for i, op in enumerate(node.ops):
+                compare = program.add(_AST_COMPARE[type(op)], (operands[i], operands[i + 1]), kind=CONDITION)
+                result = compare if result is None else program.add("and", (result, compare), kind=CONDITION)
+            return result
+        if isinstance(node, ast.Call):
+            return self._call(node)
+        raise ValueError(f"不支持的表达式: {ast.unparse(node)}")
+
+    def _value(self, node: ast.AST) -> int:
+        result = self._visit(node)
+        self._expect(result, VALUE, node)
+        return result
+
+    def _condition(self, node: ast.AST) -> int:
+        result = self._visit(node)
+        self._expect(result, CONDITION, node)
+        return result
+
+    def _call(self, node: ast.Call) -> int:
+        name = node.func.id if isinstance(node.func, ast.Name) else None
+        if node.keywords or (name not in FUNCTIONS and name != "ret"):
+            raise ValueError(f"不支持的函数: {ast.unparse(node.func)}，可选 ret、{'、'.join(FUNCTIONS)}")
+        if name == "ret":
+            # ret(n)：最近 n 根K线的涨跌幅（%），即 (close / ref(close, n) - 1) * 100
+            window = self._window(node, node.args[0] if len(node.args) == 1 else None, 1)
+            close = self.program.add("field", params=("close",))
+            ratio = self.program.add("div", (close, self.program.add("ref", (close,), (window,), extra=window)))
+            hundred = self.program.add("const", params=(100.0,))
+            return self.program.add("mul", (self.program.add("sub", (ratio, self.program.add("const", params=(1.0,)))), hundred))
+
+        arg_kinds, windowed, kind = FUNCTIONS[name]
+        if len(node.args) != len(arg_kinds) + windowed:
+            signature = ", ".join(["x", "y"][:len(arg_kinds)] + (["n"] if windowed else []))
+            raise ValueError(f"函数 {name} 的参数应为 {name}({signature})")
+        args = tuple(
+            self._condition(arg) if arg_kind == CONDITION else self._value(arg)
+            for arg, arg_kind in zip(node.args, arg_kinds)
+        )
+        if any(self.program.nodes[arg][0] == "const" for arg in args) and (windowed or all(
+                self.program.nodes[arg][0] == "const" for arg in args)):
+            raise ValueError(f"函数 {name} 需要作用于K线序列: {ast.unparse(node)}")
+        if not windowed:
+            # 上穿/下穿需要上一根K线
+            return self.program.add(name, args, kind=kind, extra=1 if name.startswith("cross") else 0)
+        window = self._window(node, node.args[-1], 1)
+        # ref 需要往前 n 根，滚动窗口需要包括当前在内的 n 根
+        return self.program.add(name, args, (window,), kind=kind, extra=window if name == "ref" else window - 1)
+
+    @staticmethod
+    def _window(node: ast.Call, arg: Optional[ast.AST], minimum: int) -> int:
+        if not (isinstance(arg, ast.Constant) and isinstance(arg.value, int) and not isinstance(arg.value, bool)
+                and arg.value >= minimum):
+            raise ValueError(f"{ast.unparse(node)} 的窗口应为不小于 {minimum} 的整数")
+        return arg.value
+
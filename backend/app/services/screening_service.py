@@ -1,5 +1,14 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Callable
+from concurrent.futures import ThreadPoolExecutor
+import time
+import numpy as np
+from app.core.config import settings
 from app.services.stock_data_service import StockDataService
+from app.services.market_snapshot import market_snapshot_cache
+from app.services.screening_engine import ScreeningTable, compile_rules
+from app.services.universe_panel import universe_panels
+from app.services.stock_metadata import metadata_key
+from app.services.trading_calendar import latest_trading_day
 from app.services.ai_analysis_service import AIAnalysisService
 from app.schemas.screening import RuleScreeningRequest, AIScreeningRequest
 
@@ -7,97 +16,141 @@ class ScreeningService:
     def __init__(self):
         self.stock_data_service = StockDataService()
         self.ai_analysis_service = AIAnalysisService()
+        self.market_snapshot_cache = market_snapshot_cache
+        self.universe_panels = universe_panels
     
     def rule_based_screening(self, request: RuleScreeningRequest):
-        """基于规则的股票筛选"""
-        # 获取股票列表
+        """基于规则的股票筛选
+        
+        规则与条件表达式编译为一个筛选程序（公共子表达式只计算一次），在整个股票池的 股票×K线 数组上
+        一次性向量化计算，返回全部匹配的股票。数据来源：只用到最新K线且截止日期不早于最近交易日时使用
+        全市场行情快照；面板覆盖所需区间时使用全市场面板；否则逐只读取历史数据。
+        """
+        started = time.perf_counter()
         market = getattr(request, 'market', 'cn')
         exchange = getattr(request, 'exchange', None)
-        symbols = request.symbols or self.stock_data_service.get_stock_symbols(market=market, exchange=exchange)
-        
-        # 筛选结果
-        matched_stocks = []
+        rules = [rule if isinstance(rule, dict) else rule.model_dump() for rule in request.rules]
+        program = compile_rules(rules, getattr(request, 'expression', None))
+        fields, window = program.fields, program.lookback
         
-        # 遍历股票进行筛选
-        for symbol in symbols[:50]:  # 限制处理50只股票，避免请求过多
+        table, mode, requested = None, "history", None
+        if window == 1 and self._can_use_snapshot(request.end_date, market):
             try:
-                # 获取股票历史数据
-                stock_history = self.stock_data_service.get_stock_history(
-                    symbol=symbol,
-                    start_date=request.start_date,
-                    end_date=request.end_date
-                )
-                
-                # 获取股票基本信息
-                stock_basic = self.stock_data_service.get_stock_basic(symbol=symbol)
-                
-                # 应用筛选规则
-                if self._match_rules(stock_history, request.rules):
-                    matched_stocks.append({
-                        "symbol": symbol,
-                        "name": stock_basic["name"],
-                        "industry": stock_basic["industry"],
-                        "market": stock_basic["market"]
-                    })
+                table, mode = self._snapshot_table(market, fields), "snapshot"
             except Exception as e:
-                print(f"处理股票 {symbol} 时出错: {e}")
-                continue
+                print(f"获取行情快照失败，改用面板或历史数据: {e}")
+        if table is None:
+            panel = self._covering_panel(market, request.start_date, request.end_date, window)
+            if panel is not None:
+                table, mode = ScreeningTable.from_panel(panel, request.start_date, request.end_date, fields, window), "panel"
+        
+        if table is None:
+            symbols = request.symbols or self.stock_data_service.get_stock_symbols(market=market, exchange=exchange)
+            table = self._history_table(symbols, request, fields, window)
+        elif request.symbols:
+            # 指定了股票列表时只保留这些股票，列数据中没有的股票（如指数）改为读取历史数据
+            requested = {metadata_key(symbol): symbol for symbol in request.symbols}
+            keys = np.array([metadata_key(symbol) for symbol in table.symbols], dtype=object)
+            table = table.take(np.isin(keys, list(requested)))
+            found = {metadata_key(symbol) for symbol in table.symbols}
+            missing = [symbol for key, symbol in requested.items() if key not in found]
+            if missing:
+                table = ScreeningTable.concat([table, self._history_table(missing, request, fields, window)])
+        elif exchange:
+            table = table.take(np.isin(table.symbols, self.stock_data_service.get_stock_symbols(market=market, exchange=exchange)))
+        loaded = time.perf_counter()
+        
+        mask = program.evaluate(table.columns)
+        evaluated = time.perf_counter()
+        
+        matched_stocks = []
+        for symbol in table.symbols[mask]:
+            if requested:
+                symbol = requested.get(metadata_key(symbol), symbol)
+            stock_basic = self.stock_data_service.get_stock_basic(symbol=symbol)
+            matched_stocks.append({
+                "symbol": symbol,
+                "name": stock_basic["name"],
+                "industry": stock_basic["industry"],
+                "market": stock_basic["market"]
+            })
         
         return {
             "total": len(matched_stocks),
             "stocks": matched_stocks,
-            "request": request.dict()
+            "request": request.dict(),
+            "mode": mode,
+            "stats": {
+                "universe_size": len(table),
+                "matched": int(mask.sum()),
+                "bars": table.width,
+                "expression_nodes": len(program),
+                "load_ms": round((loaded - started) * 1000, 2),
+                "evaluate_ms": round((evaluated - loaded) * 1000, 3),
+                "total_ms": round((time.perf_counter() - started) * 1000, 2),
+            }
         }
     
-    def _match_rules(self, stock_history: Dict[str, Any], rules: List[Dict[str, Any]]) -> bool:
-        """匹配筛选规则"""
-        data = stock_history["data"]
-        if not data:
-            return False
-        
-        # 获取最新数据
-        latest_data = data[-1]
-        
-        # 遍历所有规则
-        for rule in rules:
-            indicator = rule["indicator"]
-            operator = rule["operator"]
-            value = rule["value"]
-            
-            # 获取指标值
-            if indicator == "close":
-                indicator_value = latest_data["close"]
-            elif indicator == "volume":
-                indicator_value = latest_data["volume"]
-            elif indicator == "turnover":
-                indicator_value = latest_data["turnover"]
-            elif indicator == "high":
-                indicator_value = latest_data["high"]
-            elif indicator == "low":
-                indicator_value = latest_data["low"]
-            elif indicator == "open":
-                indicator_value = latest_data["open"]
-            else:
-                continue
-            
-            # 应用操作符
-            if operator == ">":
-                if not (indicator_value > value):
-                    return False
-            elif operator == "<":
-                if not (indicator_value < value):
-                    return False
-            elif operator == ">=":
-                if not (indicator_value >= value):
-                    return False
-            elif operator == "<=":
-                if not (indicator_value <= value):
-                    return False
-            elif operator == "==":
-                if not (indicator_value == value):
-                    return False
-        
-        return True
+    def _can_use_snapshot(self, end_date: str, market: str) -> bool:
+        """截止日期不早于该市场最近一个交易日时，行情快照即为截止日期的最新K线"""
+        return not end_date or end_date >= latest_trading_day(market)
+    
+    def _covering_panel(self, market: str, start_date: str, end_date: str, window):
+        """覆盖所需区间的全市场面板：截止日期在面板范围内（或面板已包含最近收盘的交易日），
+        且开始日期在面板内或面板中截止日期前的K线数足够计算（window 为 None 时需要区间内全部K线）"""
+        panel = self.universe_panels.get(market)
+        if panel is None or not len(panel.dates):
+            return None
+        info = panel.info()
+        if end_date and end_date < info["start_date"]:
+            return None
+        if start_date < info["start_date"] and (window is None or window > panel.columns_until(end_date)):
+            return None
+        if end_date and end_date <= info["end_date"]:
+            return panel
+        return None if self.universe_panels.is_stale(market) else panel
+    
+    def _snapshot_table(self, market: str, fields: List[str]) -> ScreeningTable:
+        snapshot = self.market_snapshot_cache.get(market)
+        return ScreeningTable.from_latest(snapshot.symbols, snapshot.columns, fields)
+    
+    def _history_table(self, symbols: List[str], request: RuleScreeningRequest, fields: List[str], window) -> ScreeningTable:
+        """并行读取各股票的历史数据，取区间内最近 window 根K线（None 为全部）组成数组
+
+        股票数超过 SCREENING_HISTORY_MAX_SYMBOLS 时抛出 ValueError，避免在一次请求内逐只抓取全市场。
+        """
+        if len(symbols) > settings.SCREENING_HISTORY_MAX_SYMBOLS:
+            raise ValueError(
+                f"需要逐只读取 {len(symbols)} 只股票的历史数据，超过上限 {settings.SCREENING_HISTORY_MAX_SYMBOLS}；"
+                "请指定股票列表，或先通过 POST /api/v1/market/panel/build 构建覆盖该区间的全市场面板"
+            )
+        def load(symbol):
+            series, _ = self.stock_data_service.get_stock_ohlcv(
+                symbol=symbol,
+                start_date=request.start_date,
+                end_date=request.end_date
+            )
+            return series
+        
+        return ScreeningTable.from_series(symbols, self._map_symbols(load, symbols), fields, window)
+    
+    def _map_symbols(self, func: Callable[[str], Any], symbols: List[str]) -> List[Any]:
+        """并行对每只股票执行 func，结果与 symbols 顺序一致；单只股票出错时结果为None，不影响其他股票
+        
+        并发数由 SCREENING_FETCH_CONCURRENCY 限制，各数据源的并发与限流由抓取层控制。
+        """
+        if not symbols:
+            return []
+        
+        def run(symbol):
+            try:
+                return func(symbol)
+            except Exception as e:
+                print(f"处理股票 {symbol} 时出错: {e}")
+                return None
+        
+        with ThreadPoolExecutor(max_workers=min(settings.SCREENING_FETCH_CONCURRENCY, len(symbols))) as pool:
+            return list(pool.map(run, symbols))
     
     def ai_based_screening(self, request: AIScreeningRequest):
         """基于自然语言的AI股票筛选，使用通用分析思考框架"""
@@ -106,34 +159,30 @@ class ScreeningService:
         exchange = getattr(request, 'exchange', None)
         symbols = request.symbols or self.stock_data_service.get_stock_symbols(market=market, exchange=exchange)
         
-        # 2. 获取每只股票的历史数据和特征
-        stocks_with_features = []
-        for symbol in symbols[:30]:  # 限制处理30只股票，避免请求过多
-            try:
-                # 获取股票历史数据（包含特征）
-                stock_history = self.stock_data_service.get_stock_history(
-                    symbol=symbol,
-                    start_date=request.start_date,
-                    end_date=request.end_date
-                )
-                
-                # 获取股票基本信息
-                stock_basic = self.stock_data_service.get_stock_basic(symbol=symbol)
-                
-                # 构建包含特征的股票数据
-                stock_with_features = {
-                    "symbol": symbol,
-                    "name": stock_basic["name"],
-                    "industry": stock_basic["industry"],
-                    "market": stock_basic["market"],
-                    "features": stock_history["features"],
-                    "history_data": stock_history["data"]
-                }
-                
-                stocks_with_features.append(stock_with_features)
-            except Exception as e:
-                print(f"处理股票 {symbol} 时出错: {e}")
-                continue
+        # 2. 并行获取每只股票的历史数据和特征（结果保持股票列表顺序，出错的股票跳过）
+        def load(symbol):
+            # 获取股票历史数据及特征
+            series, _ = self.stock_data_service.get_stock_ohlcv(
+                symbol=symbol,
+                start_date=request.start_date,
+                end_date=request.end_date
+            )
+            
+            # 获取股票基本信息
+            stock_basic = self.stock_data_service.get_stock_basic(symbol=symbol)
+            
+            # 构建包含特征的股票数据
+            return {
+                "symbol": symbol,
+                "name": stock_basic["name"],
+                "industry": stock_basic["industry"],
+                "market": stock_basic["market"],
+                "features": self.stock_data_service.get_latest_features(symbol, series),
+                "history_data": series
+            }
+        
+        # 限制处理30只股票，避免请求过多
+        stocks_with_features = [stock for stock in self._map_symbols(load, symbols[:30]) if stock is not None]
         
         # 获取AI配置
         ai_config = getattr(request, 'ai_config', None)
@@ -1,13 +1,44 @@
 import akshare as ak
 import pandas as pd
 import random
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
 from app.core.config import settings
+from app.services.history_store import HistoryStore, history_store, normalize_history_frame
+from app.services.history_cache import history_cache
+from app.services.symbol_resolver import symbol_resolver
+from app.services.symbol_universe import symbol_universe
+from app.services.trading_calendar import trading_calendars
+from app.services.stock_metadata import stock_metadata
+from app.services.fetch_executor import CancelToken, FetchCancelled, fetch_executor
+from app.services.provider_health import ProviderUnavailable, provider_registry
+from app.services.offline_provider import data_provider
+from app.services.feature_engine import compute_feature_frame, describe_features, feature_series_payload, latest_feature_values
+from app.services.feature_state import feature_state_store
+from app.services.history_downsample import downsample_history
+from app.services.history_formats import columnar_payload, history_columns
+from app.services.ohlcv import OHLCVSeries, ordinals_to_strings
+from app.services.adjustment import ADJUST_TYPES, PREV_CLOSE_COLUMN, normalize_adjust
 
 class StockDataService:
     def __init__(self):
-        # 初始化AkShare
-        pass
+        # 本地K线存储与进程内缓存（全局共享）
+        self.history_store = history_store
+        self.history_cache = history_cache
+        # 代码解析表（全局共享）
+        self.symbol_resolver = symbol_resolver
+        self.symbol_universe = symbol_universe
+        # 各市场交易日历（全局共享）
+        self.trading_calendars = trading_calendars
+        self.stock_metadata = stock_metadata
+        # 上游抓取执行器（全局共享）
+        self.fetch_executor = fetch_executor
+        self.provider_registry = provider_registry
+        # 数据源层：真实上游或录制/回放/模拟数据（全局共享）
+        self.data_provider = data_provider
+        # 增量滚动特征状态（全局共享）
+        self.feature_state_store = feature_state_store
     
     def _get_data_source(self, symbol: str) -> str:
         """根据股票代码判断数据源"""
@@ -28,8 +59,12 @@ class StockDataService:
         else:
             return "akshare"
     
-    def get_stock_history(self, symbol: str, start_date: str = None, end_date: str = None, adjust: str = "qfq") -> dict:
-        """获取股票历史K线数据，根据股票代码自动选择数据源"""
+    def get_stock_history(self, symbol: str, start_date: str = None, end_date: str = None, adjust: str = "qfq", include_feature_series: bool = False, data_format: str = "records",
+                          max_points: int = None, resolution: str = "auto") -> dict:
+        """获取股票历史K线数据，优先使用本地存储，只向上游补齐缺失区间
+        
+        max_points/resolution 用于图表降采样，见 downsample_history。
+        """
         # 如果没有提供日期，使用当前日期
         if not end_date:
             end_date = datetime.now().strftime("%Y-%m-%d")
@@ -42,157 +77,332 @@ class StockDataService:
         
         print(f"获取股票数据: {symbol}, 开始日期: {start_date}, 结束日期: {end_date}")
         
-        # 先判断股票代码是否已经有市场前缀
-        original_symbol = symbol
-        has_prefix = symbol.startswith("sh") or symbol.startswith("sz") or symbol.startswith("hk")
-        
-        # 设置获取数据的超时时间为15秒
-        import threading
-        result = None
-        exception = None
+        series, stale = self._load_history_series(symbol, start_date, end_date, adjust)
+        features = self.get_latest_features(symbol, series, adjust)
         
-        def fetch_data():
-            nonlocal result, exception
-            try:
-                # 尝试不同的数据源
-                # 1. 尝试efinance库获取A股数据
-                print(f"尝试使用efinance获取A股数据")
-                if has_prefix:
-                    # 如果有前缀，直接使用
-                    result = self._get_efinance_data(symbol, start_date, end_date, adjust)
-                    print(f"使用efinance成功获取数据")
-                    return
-                else:
-                    # 尝试添加深交所前缀
-                    sz_symbol = f"sz{symbol}"
-                    print(f"尝试使用efinance，深交所代码: {sz_symbol}")
-                    result = self._get_efinance_data(sz_symbol, start_date, end_date, adjust)
-                    print(f"使用efinance深交所代码成功获取数据")
-                    return
-            except Exception as e1:
-                print(f"efinance获取失败: {e1}")
-                
+        result = self._process_stock_data(
+            series, symbol, start_date, end_date, adjust, include_feature_series, features, data_format,
+            max_points=max_points, resolution=resolution
+        )
+        # stale 为 True 表示上游未能及时返回，数据来自本地缓存且正在后台刷新
+        result["stale"] = stale
+        return result
+    
+    def get_stock_ohlcv(self, symbol: str, start_date: str = None, end_date: str = None, adjust: str = "qfq"):
+        """获取紧凑的K线序列（OHLCVSeries），返回 (K线序列, 是否为过期数据)，供筛选、AI分析等服务直接使用"""
+        end_date = end_date or datetime.now().strftime("%Y-%m-%d")
+        start_date = start_date or "1990-01-01"
+        return self._load_history_series(symbol, start_date, end_date, adjust)
+    
+    def get_latest_features(self, symbol: str, series: OHLCVSeries, adjust: str = "qfq") -> dict:
+        """最近一个交易日的特征：序列覆盖最新K线时直接使用增量维护的滚动特征，否则重新计算"""
+        feature_state = self.feature_state_store.get(self._normalize_symbol(symbol), normalize_adjust(adjust))
+        if feature_state is not None and feature_state.covers(series):
+            return describe_features(feature_state.features())
+        return self.calculate_features(series)
+    
+    def iter_stock_history_batch(self, symbols: list, start_date: str = None, end_date: str = None, adjust: str = "qfq"):
+        """并行获取多只股票的历史数据，按完成顺序逐只产出 (股票代码, 结果, 异常)"""
+        symbols = list(dict.fromkeys(symbols))
+        if not symbols:
+            return
+        pool = ThreadPoolExecutor(max_workers=min(settings.HISTORY_BATCH_CONCURRENCY, len(symbols)))
+        try:
+            futures = {
+                pool.submit(self.get_stock_history, symbol, start_date, end_date, adjust): symbol
+                for symbol in symbols
+            }
+            for future in as_completed(futures):
+                symbol = futures[future]
                 try:
-                    # 2. 尝试上交所前缀
-                    sh_symbol = f"sh{symbol}"
-                    print(f"尝试使用efinance，上交所代码: {sh_symbol}")
-                    result = self._get_efinance_data(sh_symbol, start_date, end_date, adjust)
-                    print(f"使用efinance上交所代码成功获取数据")
-                    return
-                except Exception as e2:
-                    print(f"efinance上交所代码也失败: {e2}")
-                    
-                    # 3. 尝试akshare库
-                    print(f"尝试使用akshare获取数据")
-                    try:
-                        if has_prefix:
-                            result = self._get_akshare_data(symbol, start_date, end_date, adjust)
-                            print(f"使用akshare成功获取数据")
-                            return
-                        else:
-                            # 尝试添加深交所前缀
-                            sz_symbol = f"sz{symbol}"
-                            print(f"尝试使用akshare，深交所代码: {sz_symbol}")
-                            result = self._get_akshare_data(sz_symbol, start_date, end_date, adjust)
-                            print(f"使用akshare深交所代码成功获取数据")
-                            return
-                    except Exception as e3:
-                        print(f"akshare深交所代码失败: {e3}")
-                        
-                        try:
-                            # 尝试上交所前缀
-                            sh_symbol = f"sh{symbol}"
-                            print(f"尝试使用akshare，上交所代码: {sh_symbol}")
-                            result = self._get_akshare_data(sh_symbol, start_date, end_date, adjust)
-                            print(f"使用akshare上交所代码成功获取数据")
-                            return
-                        except Exception as e4:
-                            print(f"akshare上交所代码也失败: {e4}")
-                            
-                            # 4. 尝试美股数据
-                            if symbol.isalpha():
-                                print(f"尝试使用yfinance获取美股数据")
-                                try:
-                                    result = self._get_yfinance_data(symbol, start_date, end_date, adjust)
-                                    print(f"使用yfinance成功获取数据")
-                                    return
-                                except Exception as e5:
-                                    print(f"yfinance获取失败: {e5}")
-                            
-                            # 5. 尝试使用原始代码，不加前缀
-                            try:
-                                print(f"尝试使用原始代码，不加前缀: {symbol}")
-                                result = self._get_akshare_data(symbol, start_date, end_date, adjust)
-                                print(f"使用原始代码成功获取数据")
-                                return
-                            except Exception as e6:
-                                print(f"使用原始代码也失败: {e6}")
-                                
-                                # 所有尝试都失败，返回友好的错误信息
-                                exception = ValueError(f"无法获取股票 {symbol} 的数据。请检查股票代码是否正确，或者尝试添加正确的市场前缀（如 sz000937 或 sh600000）。")
-                                return
-        
-        # 创建线程并启动
-        thread = threading.Thread(target=fetch_data)
-        thread.daemon = True
-        thread.start()
-        
-        # 等待线程完成，最多等待15秒
-        thread.join(15)
-        
-        # 检查结果
-        if result:
-            return result
-        elif exception:
-            raise exception
+                    yield symbol, future.result(), None
+                except Exception as e:
+                    print(f"批量获取股票 {symbol} 失败: {e}")
+                    yield symbol, None, e
+        finally:
+            # 客户端提前断开时丢弃尚未开始的任务
+            pool.shutdown(wait=False, cancel_futures=True)
+    
+    def _normalize_symbol(self, symbol: str) -> str:
+        """规范化股票代码，作为本地存储的键"""
+        return symbol.strip().lower()
+    
+    def _get_cached_entry(self, key: str):
+        """依次读取内存缓存与本地存储（不复权数据，各复权类型共用）"""
+        entry = self.history_cache.get(key, "")
+        if entry is None:
+            entry = self.history_store.load(key, "")
+            if entry is not None:
+                self.history_cache.put(key, "", entry)
+        return entry
+    
+    def _load_history_series(self, symbol: str, start_date: str, end_date: str, adjust: str):
+        """读取缓存的K线并向上游补齐首尾缺口，返回 (请求区间的数据, 是否为过期数据)
+        
+        本地只保存不复权K线，复权价格按除权除息事件表在返回前计算。
+        上游在截止时间内未返回时：有缓存则立即返回缓存数据并标记为过期，抓取任务继续在后台完成并写回；
+        没有缓存则取消任务并抛出 TimeoutError。
+        """
+        adjust = normalize_adjust(adjust)
+        key = self._normalize_symbol(symbol)
+        entry = self._get_cached_entry(key)
+        calendar = self.trading_calendars.get(self._get_market(symbol))
+        gaps = HistoryStore.missing_ranges(entry, start_date, end_date, calendar)
+        if not gaps:
+            return entry.factors.apply(entry.series.slice(start_date, end_date), adjust), False
+        
+        # 有缓存时允许抓取任务在后台运行更久，用于刷新缓存
+        has_cache = entry is not None
+        task_timeout = settings.HISTORY_REFRESH_TIMEOUT if has_cache else settings.HISTORY_FETCH_TIMEOUT
+        tasks = []
+        for gap_start, gap_end in gaps:
+            print(f"本地数据缺少区间 {gap_start} ~ {gap_end}，从数据源获取")
+            # 相同股票和区间的并发请求（不论复权类型）合并为一次上游抓取
+            tasks.append(self.fetch_executor.submit_shared(
+                (key, gap_start, gap_end),
+                self._refresh_range, task_timeout, symbol, gap_start, gap_end
+            ))
+        
+        deadline = time.monotonic() + settings.HISTORY_FETCH_TIMEOUT
+        stale = False
+        for task in tasks:
+            try:
+                entry = self.fetch_executor.wait(
+                    task, max(0.0, deadline - time.monotonic()), cancel_on_timeout=not has_cache
+                )
+            except (TimeoutError, FetchCancelled):
+                if not has_cache:
+                    raise TimeoutError(f"获取股票 {symbol} 的数据超时，请稍后重试")
+                print("补齐区间超时，返回本地缓存数据并在后台刷新")
+                stale = True
+            except Exception as e:
+                if not has_cache:
+                    raise
+                print(f"补齐区间失败，返回本地缓存数据: {e}")
+                stale = True
+        
+        # 首尾缺口的任务并发合并写回，各自返回的结果可能不含另一个任务的区间；
+        # 超时的后台任务也可能已经写回了部分区间，统一读取最新合并结果
+        entry = self._get_cached_entry(key) or entry
+        return entry.factors.apply(entry.series.slice(start_date, end_date), adjust), stale
+    
+    def _refresh_range(self, token: CancelToken, symbol: str, start_date: str, end_date: str):
+        """抓取任务：获取一个日期区间的不复权K线，识别除权除息并合并写回本地存储与缓存，返回合并后的数据"""
+        calendar = self.trading_calendars.get(self._get_market(symbol))
+        fetched_df = normalize_history_frame(self._fetch_from_candidates(token, symbol, start_date, end_date, ""), calendar)
+        fetched = OHLCVSeries.from_frame(fetched_df)
+        prev_close = fetched_df[PREV_CLOSE_COLUMN].to_numpy() if PREV_CLOSE_COLUMN in fetched_df.columns else None
+        key = self._normalize_symbol(symbol)
+        with self.history_store.lock(key, ""):
+            old = self._get_cached_entry(key)
+            entry = HistoryStore.merge(old, fetched, start_date, end_date, prev_close)
+            if old is not None and len(entry.factors) != len(old.factors):
+                print(f"股票 {symbol} 出现新的除权除息，复权价格将按新的事件表计算")
+            self.history_store.save(key, "", entry)
+            self.history_cache.put(key, "", entry)
+            # 新K线增量更新各复权类型的滚动特征（只复权尾部），出现新的除权除息（前复权历史价格变化）时才全量重建
+            for adjust in ADJUST_TYPES:
+                self.feature_state_store.update(key, adjust, entry.series, entry.factors)
+        return entry
+    
+    def get_history_gaps(self, symbol: str, start_date: str = None, end_date: str = None) -> dict:
+        """检查本地数据：最后一根K线是否为最近交易日，以及已覆盖区间内缺少K线的交易日（如停牌）"""
+        key = self._normalize_symbol(symbol)
+        entry = self._get_cached_entry(key)
+        if entry is None or not len(entry.series):
+            raise ValueError(f"本地没有股票 {symbol} 的数据")
+        calendar = self.trading_calendars.get(self._get_market(symbol))
+        latest = calendar.last_session()
+        start = max(start_date or entry.covered_start, entry.covered_start)
+        end = min(end_date or latest, entry.covered_end, latest)
+        missing = calendar.missing_sessions(entry.series.dates, start, end)
+        return {
+            "symbol": symbol,
+            "calendar": calendar.source,
+            "covered_start": entry.covered_start,
+            "covered_end": entry.covered_end,
+            "last_bar_date": entry.series.last_date,
+            "latest_trading_day": latest,
+            "up_to_date": entry.series.last_date >= latest and
+                          entry.fetched_at >= calendar.session_close(entry.series.last_date),
+            "missing_dates": ordinals_to_strings(missing).tolist(),
+        }
+    
+    def get_cache_stats(self) -> dict:
+        """获取K线缓存统计信息"""
+        return {"history_cache": self.history_cache.stats()}
+    
+    def get_fetch_stats(self) -> dict:
+        """获取上游抓取执行器的队列与并发统计"""
+        return {"fetch_executor": self.fetch_executor.stats()}
+    
+    def get_provider_health(self) -> dict:
+        """获取各数据源的延迟、错误率与熔断状态"""
+        return {"providers": self.provider_registry.stats()}
+    
+    def _get_market(self, symbol: str) -> str:
+        """根据股票代码判断市场：cn（A股）、hk（港股）、us（美股）、other"""
+        if (len(symbol) == 6 and symbol.isdigit()) or symbol.startswith("sh") or symbol.startswith("sz"):
+            return "cn"
+        if symbol.isalpha():
+            return "us"
+        if (len(symbol) == 5 and symbol.isdigit()) or symbol.startswith("hk"):
+            return "hk"
+        return "other"
+    
+    def _candidate_sources(self, symbol: str) -> list:
+        """列出可尝试的 (数据源, 代码) 组合，默认顺序：efinance → akshare → yfinance → 原始代码"""
+        has_prefix = symbol.startswith("sh") or symbol.startswith("sz") or symbol.startswith("hk")
+        if has_prefix:
+            candidates = [("efinance", symbol), ("akshare", symbol)]
         else:
-            # 如果超时，返回模拟数据
-            print(f"获取股票数据超时，返回模拟数据")
-            
-            # 生成过去一年的日期
-            dates = pd.date_range(end=datetime.now(), periods=252, freq='B')
-            
-            # 生成模拟数据
-            base_price = 100.0
-            data = []
-            
-            for date in dates:
-                # 随机生成价格变化
-                change = random.uniform(-2.0, 2.0)
-                open_price = base_price
-                close_price = base_price + change
-                high_price = max(open_price, close_price) + random.uniform(0.0, 1.0)
-                low_price = min(open_price, close_price) - random.uniform(0.0, 1.0)
-                volume = random.randint(1000000, 10000000)
-                turnover = random.uniform(0.5, 5.0)
-                
-                data.append({
-                    "日期": date.strftime("%Y-%m-%d"),
-                    "开盘": open_price,
-                    "收盘": close_price,
-                    "最高": high_price,
-                    "最低": low_price,
-                    "成交量": volume,
-                    "换手率": turnover
-                })
-                
-                # 更新基准价格
-                base_price = close_price
-            
-            stock_data_df = pd.DataFrame(data)
-            print(f"生成模拟数据成功，数据条数: {len(stock_data_df)}")
+            # 先尝试深交所前缀，再尝试上交所前缀
+            candidates = [
+                ("efinance", f"sz{symbol}"),
+                ("efinance", f"sh{symbol}"),
+                ("akshare", f"sz{symbol}"),
+                ("akshare", f"sh{symbol}"),
+            ]
+        if symbol.isalpha():
+            candidates.append(("yfinance", symbol))
+        candidates.append(("akshare", symbol))
+        
+        # 去重并保持顺序
+        return list(dict.fromkeys(candidates))
+    
+    def _call_provider(self, provider: str, code: str, start_date: str, end_date: str, adjust: str) -> pd.DataFrame:
+        """调用指定数据源获取K线（经过数据源层，可录制、回放或生成模拟数据）"""
+        return self.data_provider.fetch(
+            provider, code, start_date, end_date, adjust,
+            lambda: self._call_live_provider(provider, code, start_date, end_date, adjust),
+        )
+    
+    def _call_live_provider(self, provider: str, code: str, start_date: str, end_date: str, adjust: str) -> pd.DataFrame:
+        """请求真实的上游数据源"""
+        if provider == "efinance":
+            return self._get_efinance_data(code, start_date, end_date, adjust)
+        elif provider == "yfinance":
+            return self._get_yfinance_data(code, start_date, end_date, adjust)
+        return self._get_akshare_data(code, start_date, end_date, adjust)
+    
+    def _fetch_candidate(self, token: CancelToken, provider: str, code: str, start_date: str, end_date: str, adjust: str, market: str = None):
+        """在数据源限流与并发名额内请求单个 (数据源, 代码)，返回 (数据源, 代码, K线)
+
+        先取得限流令牌再占用并发名额，等待令牌时不占用名额，避免阻塞同一数据源的其他请求。
+        """
+        self.provider_registry.acquire(provider, token.remaining())
+        called = False
+        try:
+            with self.fetch_executor.source_slot(provider, token):
+                called = True
+                print(f"尝试使用{provider}获取数据，代码: {code}")
+                started = time.monotonic()
+                try:
+                    stock_data_df = self._call_provider(provider, code, start_date, end_date, adjust)
+                except ValueError:
+                    # 数据源正常返回但没有该股票的数据，不计为数据源故障
+                    self.provider_registry.record(provider, time.monotonic() - started, market=market, empty=True)
+                    raise
+                except Exception as e:
+                    self.provider_registry.record(provider, time.monotonic() - started, e, market=market)
+                    raise
+                self.provider_registry.record(provider, time.monotonic() - started, market=market)
+        finally:
+            if not called:
+                # 等待并发名额时超时或被取消，请求未发出：释放熔断器的试探名额
+                self.provider_registry.release(provider)
+        # 超时后返回的结果已无人等待，直接丢弃
+        token.raise_if_cancelled()
+        return provider, code, stock_data_df
+    
+    def _hedge_pair(self, symbol: str, candidates: list):
+        """A股对冲请求的主、备 (数据源, 代码)：备用为第一个与主数据源不同的候选"""
+        if not settings.HISTORY_HEDGE_ENABLED or self._get_data_source(symbol) != "efinance":
+            return None
+        primary = candidates[0]
+        for candidate in candidates[1:]:
+            if candidate[0] != primary[0]:
+                return primary, candidate
+        return None
+    
+    def _fetch_from_candidates(self, token: CancelToken, symbol: str, start_date: str, end_date: str, adjust: str) -> pd.DataFrame:
+        """按动态排序的回退顺序尝试各数据源，已解析的代码在其数据源内优先；每次请求上游前检查取消令牌"""
+        key = self._normalize_symbol(symbol)
+        market = self._get_market(symbol)
+        resolved = self.symbol_resolver.get(key)
+        candidates = self._candidate_sources(symbol)
+        if resolved:
+            # 已解析的代码只作为同一数据源内的首选（其他数据源也优先尝试该代码），延迟相同时已解析的数据源在前
+            others = [c for c in candidates if c != resolved]
+            candidates = [resolved] + sorted(others, key=lambda c: c[1] != resolved[1])
+        # 数据源之间按各自在该市场上最近的延迟与成功率排序（稳定排序，同一数据源内保持上面的顺序）
+        candidates = self.provider_registry.rank(market, candidates)
+        # 跳过熔断中的数据源
+        available = [c for c in candidates if self.provider_registry.available(c[0])]
+        skipped = len(available) < len(candidates)
+        if skipped:
+            print(f"跳过熔断中的数据源: {sorted({c[0] for c in candidates if c not in available})}")
+        candidates = available
+        
+        # A股可选对冲：主数据源慢时同时请求备用数据源，先成功者胜出
+        hedge_pair = self._hedge_pair(symbol, candidates)
+        if hedge_pair:
+            primary, secondary = hedge_pair
+            try:
+                provider, code, stock_data_df = self.fetch_executor.hedge(
+                    token,
+                    lambda t: self._fetch_candidate(t, *primary, start_date, end_date, adjust, market),
+                    lambda t: self._fetch_candidate(t, *secondary, start_date, end_date, adjust, market),
+                    # 主数据源超过其近期p95延迟仍未返回时发出对冲请求
+                    self.provider_registry.hedge_delay(primary[0], market, settings.HISTORY_HEDGE_DELAY),
+                )
+                print(f"对冲请求成功，使用{provider}，代码: {code}")
+                self.symbol_resolver.record(key, provider, code)
+                return stock_data_df
+            except FetchCancelled:
+                raise
+            except Exception as e:
+                print(f"对冲请求均失败（{primary} / {secondary}）: {e}")
+                if isinstance(e, ProviderUnavailable):
+                    skipped = True
+                elif resolved in hedge_pair:
+                    self.symbol_resolver.invalidate(key)
+            candidates = [c for c in candidates if c not in hedge_pair]
+        
+        for provider, code in candidates:
+            try:
+                _, _, stock_data_df = self._fetch_candidate(token, provider, code, start_date, end_date, adjust, market)
+            except FetchCancelled:
+                raise
+            except ProviderUnavailable as e:
+                print(e)
+                skipped = True
+                continue
+            except Exception as e:
+                print(f"{provider}获取失败（{code}）: {e}")
+                if (provider, code) == resolved:
+                    self.symbol_resolver.invalidate(key)
+                continue
             
-            return self._process_stock_data(stock_data_df, symbol, start_date, end_date, adjust)
+            print(f"使用{provider}成功获取数据，代码: {code}")
+            self.symbol_resolver.record(key, provider, code)
+            return stock_data_df
+        
+        if skipped:
+            raise ProviderUnavailable(f"获取股票 {symbol} 的数据失败：部分数据源熔断或限流中，请稍后重试")
+        # 所有尝试都失败，返回友好的错误信息
+        raise ValueError(f"无法获取股票 {symbol} 的数据。请检查股票代码是否正确，或者尝试添加正确的市场前缀（如 sz000937 或 sh600000）。")
     
-    def _get_efinance_data(self, symbol: str, start_date: str, end_date: str, adjust: str = "qfq") -> dict:
+    def _get_efinance_data(self, symbol: str, start_date: str, end_date: str, adjust: str = "qfq") -> pd.DataFrame:
         """使用efinance获取A股数据"""
         import efinance as ef
         
         # efinance需要的日期格式为YYYY-MM-DD
         stock_code = symbol[2:] if symbol.startswith("sh") or symbol.startswith("sz") else symbol
         
-        # 获取K线数据，如果start_date为None，使用efinance的默认值
-        stock_data_df = ef.stock.get_quote_history(stock_code, beg=start_date, end=end_date)
+        # 获取K线数据，如果start_date为None，使用efinance的默认值；fqt: 0 不复权、1 前复权、2 后复权
+        fqt = {"qfq": 1, "hfq": 2}.get(adjust, 0)
+        stock_data_df = ef.stock.get_quote_history(stock_code, beg=start_date, end=end_date, fqt=fqt)
         
         if stock_data_df.empty:
             raise ValueError(f"股票 {symbol} 在指定日期范围内没有数据")
@@ -202,15 +412,16 @@ class StockDataService:
         if not all(col in stock_data_df.columns for col in required_columns):
             raise ValueError(f"股票 {symbol} 数据缺少必要的列")
         
-        return self._process_stock_data(stock_data_df, symbol, start_date, end_date, adjust)
+        return stock_data_df
     
-    def _get_yfinance_data(self, symbol: str, start_date: str, end_date: str, adjust: str = "qfq") -> dict:
+    def _get_yfinance_data(self, symbol: str, start_date: str, end_date: str, adjust: str = "qfq") -> pd.DataFrame:
         """使用yfinance获取美股数据"""
         import yfinance as yf
         
         # 获取K线数据
         stock = yf.Ticker(symbol)
-        stock_data_df = stock.history(start=start_date, end=end_date)
+        # 不复权时保留分红列，用于计算除息日的前收盘参考价
+        stock_data_df = stock.history(start=start_date, end=end_date, auto_adjust=adjust in ("qfq", "hfq"))
         
         if stock_data_df.empty:
             raise ValueError(f"股票 {symbol} 在指定日期范围内没有数据")
@@ -225,15 +436,18 @@ class StockDataService:
         stock_data_df["成交量"] = stock_data_df["Volume"]
         # 美股数据没有换手率，使用模拟值
         stock_data_df["换手率"] = random.uniform(0.5, 5.0)
+        if "Dividends" in stock_data_df.columns:
+            stock_data_df["前收盘"] = stock_data_df["Close"].shift(1) - stock_data_df["Dividends"]
         
-        return self._process_stock_data(stock_data_df, symbol, start_date, end_date, adjust)
+        return stock_data_df
     
-    def _get_akshare_data(self, symbol: str, start_date: str, end_date: str, adjust: str = "qfq") -> dict:
+    def _get_akshare_data(self, symbol: str, start_date: str, end_date: str, adjust: str = "qfq") -> pd.DataFrame:
         """使用akshare获取其他市场数据"""
         print(f"akshare获取数据: symbol={symbol}, start_date={start_date}, end_date={end_date}, adjust={adjust}")
         
-        # 获取K线数据
+        # 获取K线数据；各次上游调用的异常，用于区分“请求失败”与“正常返回空数据”
         stock_data_df = pd.DataFrame()
+        errors = []
         
         # 处理A股数据
         if symbol.startswith("sh") or symbol.startswith("sz"):
@@ -259,6 +473,7 @@ class StockDataService:
                     print(f"前5行数据: {stock_data_df.head().to_dict('records')}")
             except Exception as e:
                 print(f"stock_zh_a_hist获取失败: {e}")
+                errors.append(e)
             
             # 2. 如果第一次尝试失败，尝试使用不同的日期格式
             if stock_data_df.empty:
@@ -274,6 +489,7 @@ class StockDataService:
                     print(f"stock_zh_a_hist获取成功，数据条数: {len(stock_data_df)}")
                 except Exception as e:
                     print(f"stock_zh_a_hist获取失败: {e}")
+                    errors.append(e)
             
             # 3. 尝试使用旧版的 stock_zh_a_daily 函数
             if stock_data_df.empty:
@@ -322,6 +538,7 @@ class StockDataService:
                                     print(f"映射列名失败: {e}")
                 except Exception as e:
                     print(f"stock_zh_a_daily获取失败: {e}")
+                    errors.append(e)
             
             # 4. 尝试使用 stock_zh_index_daily 函数（可能适用于某些股票）
             if stock_data_df.empty:
@@ -346,6 +563,7 @@ class StockDataService:
                             stock_data_df['换手率'] = 0.0
                 except Exception as e:
                     print(f"stock_zh_index_daily获取失败: {e}")
+                    errors.append(e)
         
         # 处理港股数据
         elif symbol.startswith("hk"):
@@ -361,6 +579,7 @@ class StockDataService:
                 print(f"stock_hk_hist获取成功，数据条数: {len(stock_data_df)}")
             except Exception as e:
                 print(f"stock_hk_hist获取失败: {e}")
+                errors.append(e)
         
         # 处理其他市场数据
         else:
@@ -376,85 +595,45 @@ class StockDataService:
                 print(f"stock_zh_a_hist获取成功，数据条数: {len(stock_data_df)}")
             except Exception as e:
                 print(f"stock_zh_a_hist获取失败: {e}")
+                errors.append(e)
         
         # 检查是否获取到数据
         print(f"最终获取到的数据: 空={stock_data_df.empty}, 数据条数={len(stock_data_df)}")
         
-        # 如果没有获取到数据，尝试生成模拟数据
+        # 上游调用出错（限流、封禁、网络故障等）而没有取到数据时按数据源故障抛出，计入熔断
+        if stock_data_df.empty and errors:
+            raise RuntimeError(f"akshare获取股票 {symbol} 的数据失败: {errors[-1]}") from errors[-1]
+        # 正常返回但没有数据时报错，由调用方尝试下一个数据源，不再生成模拟数据
         if stock_data_df.empty:
-            print(f"没有获取到数据，生成模拟数据")
-            
-            # 生成过去一年的日期
-            dates = pd.date_range(end=datetime.now(), periods=252, freq='B')
-            
-            # 生成模拟数据
-            base_price = 100.0
-            data = []
-            
-            for date in dates:
-                # 随机生成价格变化
-                change = random.uniform(-2.0, 2.0)
-                open_price = base_price
-                close_price = base_price + change
-                high_price = max(open_price, close_price) + random.uniform(0.0, 1.0)
-                low_price = min(open_price, close_price) - random.uniform(0.0, 1.0)
-                volume = random.randint(1000000, 10000000)
-                turnover = random.uniform(0.5, 5.0)
-                
-                data.append({
-                    "日期": date.strftime("%Y-%m-%d"),
-                    "开盘": open_price,
-                    "收盘": close_price,
-                    "最高": high_price,
-                    "最低": low_price,
-                    "成交量": volume,
-                    "换手率": turnover
-                })
-                
-                # 更新基准价格
-                base_price = close_price
-            
-            stock_data_df = pd.DataFrame(data)
-            print(f"生成模拟数据成功，数据条数: {len(stock_data_df)}")
+            raise ValueError(f"股票 {symbol} 在指定日期范围内没有数据")
         
-        # 确保数据包含所有必要的列
+        # 换手率缺失（如指数数据）时补0，其余必要列缺失视为数据无效
+        if "换手率" not in stock_data_df.columns:
+            stock_data_df["换手率"] = 0.0
         required_columns = ["日期", "开盘", "收盘", "最高", "最低", "成交量", "换手率"]
-        for col in required_columns:
-            if col not in stock_data_df.columns:
-                print(f"添加缺失的列: {col}")
-                if col == "日期":
-                    stock_data_df[col] = pd.date_range(end=datetime.now(), periods=len(stock_data_df), freq='B').strftime("%Y-%m-%d")
-                elif col in ["开盘", "收盘", "最高", "最低"]:
-                    stock_data_df[col] = 100.0
-                elif col == "成交量":
-                    stock_data_df[col] = 1000000
-                elif col == "换手率":
-                    stock_data_df[col] = 1.0
-        
-        # 返回处理后的数据
-        return self._process_stock_data(stock_data_df, symbol, start_date, end_date, adjust)
+        if not all(col in stock_data_df.columns for col in required_columns):
+            raise ValueError(f"股票 {symbol} 数据缺少必要的列")
+        
+        return stock_data_df
     
-    def _process_stock_data(self, df, symbol, start_date, end_date, adjust):
-        """处理股票数据"""
-        # 处理数据格式
-        df["date"] = df["日期"].astype(str)
-        df["open"] = df["开盘"].astype(float)
-        df["close"] = df["收盘"].astype(float)
-        df["high"] = df["最高"].astype(float)
-        df["low"] = df["最低"].astype(float)
-        df["volume"] = df["成交量"].astype(int)
-        df["turnover"] = df["换手率"].astype(float)
-        
-        # 计算成交量与换手率的乘积，作为流动性指标
-        df["volume_turnover_product"] = df["volume"] * df["turnover"]
-        
-        # 过滤非交易日（周六和周日）
-        df["datetime"] = pd.to_datetime(df["date"])
-        df = df[df["datetime"].dt.weekday < 5]  # 只保留周一到周五的数据
-        df = df.drop(columns=["datetime"])
-        
-        # 计算特征
-        features = self.calculate_features(df)
+    def _process_stock_data(self, series, symbol, start_date, end_date, adjust, include_feature_series=False, features=None,
+                            data_format="records", max_points=None, resolution="auto"):
+        """处理股票数据
+        
+        data_format: records（每根K线一个字典）、columnar（每个字段一个数组）、frame（DataFrame，供二进制编码使用）
+        特征始终基于日K线计算，降采样只作用于返回的K线及特征序列。
+        """
+        # 计算特征（调用方已有增量滚动特征时直接使用）
+        if features is None:
+            features = self.calculate_features(series)
+        
+        frame, positions, resolution = downsample_history(history_columns(series), max_points, resolution)
+        if data_format == "frame":
+            data = frame
+        elif data_format == "columnar":
+            data = columnar_payload(frame)
+        else:
+            data = frame.to_dict("records")
         
         # 提取需要的数据
         result = {
@@ -462,134 +641,32 @@ class StockDataService:
             "start_date": start_date,
             "end_date": end_date,
             "adjust": adjust,
-            "data": df[["date", "open", "close", "high", "low", "volume", "turnover", "volume_turnover_product"]].to_dict("records"),
+            "resolution": resolution,
+            "data": data,
             "features": features
         }
         
+        # 按需返回完整的特征时间序列
+        if include_feature_series:
+            df = series.to_frame()
+            result["feature_series"] = feature_series_payload(df.iloc[positions], compute_feature_frame(df).iloc[positions])
+        
         return result
     
-    def calculate_features(self, df):
-        """计算股票特征"""
-        # 确保数据按日期排序
-        df = df.sort_values(by="日期")
-        
-        # 短期与中期量能比较（5日/20日）
-        df["avg_volume_short"] = df["成交量"].rolling(window=5).mean()
-        df["avg_volume_long"] = df["成交量"].rolling(window=20).mean()
-        
-        # 平均换手率
-        df["turnover_mean"] = df["换手率"].rolling(window=10).mean()
-        
-        # 价格振幅、波动性
-        df["price_range"] = (df["最高"] - df["最低"]) / df["开盘"] * 100
-        df["volatility_trend"] = df["price_range"].rolling(window=5).mean()
-        
-        # 上影线/下影线比例
-        df["upper_shadow"] = df["最高"] - df[["open", "close"]].max(axis=1)
-        df["lower_shadow"] = df[["open", "close"]].min(axis=1) - df["最低"]
-        df["kline_shadow_ratio"] = df["upper_shadow"] / (df["lower_shadow"] + 0.01)  # 避免除以零
-        
-        # 横盘整理天数
-        # 计算价格是否在一个窄幅区间内波动
-        price_std_10d = df["收盘"].rolling(window=10).std()
-        price_mean_10d = df["收盘"].rolling(window=10).mean()
-        df["is_consolidating"] = (price_std_10d / price_mean_10d * 100) < 3  # 3%以内视为横盘
-        
-        # 计算连续横盘天数
-        df["consolidation_days"] = 0
-        consecutive_days = 0
-        for i in range(len(df)):
-            if df.iloc[i]["is_consolidating"]:
-                consecutive_days += 1
-            else:
-                consecutive_days = 0
-            df.at[i, "consolidation_days"] = consecutive_days
-        
-        # 返回最近一个交易日的特征
-        latest_features = df.iloc[-1][[
-            "avg_volume_short", "avg_volume_long", "turnover_mean", 
-            "price_range", "kline_shadow_ratio", "consolidation_days", "volatility_trend"
-        ]].to_dict()
-        
-        # 添加特征描述
-        features_with_desc = {
-            "avg_volume_short": {
-                "value": float(latest_features["avg_volume_short"]),
-                "description": "短期(5日)平均成交量"
-            },
-            "avg_volume_long": {
-                "value": float(latest_features["avg_volume_long"]),
-                "description": "中期(20日)平均成交量"
-            },
-            "volume_ratio": {
-                "value": float(latest_features["avg_volume_short"] / (latest_features["avg_volume_long"] + 0.01)),
-                "description": "短期与中期量能比值"
-            },
-            "turnover_mean": {
-                "value": float(latest_features["turnover_mean"]),
-                "description": "平均换手率"
-            },
-            "price_range": {
-                "value": float(latest_features["price_range"]),
-                "description": "价格振幅、波动性"
-            },
-            "kline_shadow_ratio": {
-                "value": float(latest_features["kline_shadow_ratio"]),
-                "description": "上影线/下影线比例"
-            },
-            "consolidation_days": {
-                "value": int(latest_features["consolidation_days"]),
-                "description": "横盘整理天数"
-            },
-            "volatility_trend": {
-                "value": float(latest_features["volatility_trend"]),
-                "description": "波动趋势"
-            }
-        }
-        
-        return features_with_desc
+    def calculate_features(self, series: OHLCVSeries):
+        """计算股票最近一个交易日的特征（只计算末尾所需的K线）"""
+        return describe_features(latest_feature_values(series.to_frame()))
     
     def get_stock_basic(self, symbol):
-        """获取股票基本信息"""
-        # 获取股票基本信息
-        stock_info_df = ak.stock_individual_info_em(symbol=symbol)
-        
-        # 提取需要的数据
-        basic_info = {
-            "symbol": symbol,
-            "name": stock_info_df.iloc[0]["股票名称"] if not stock_info_df.empty else "",
-            "industry": stock_info_df.iloc[0]["行业"] if not stock_info_df.empty else "",
-            "area": stock_info_df.iloc[0]["地区"] if not stock_info_df.empty else "",
-            "market": "A股" if symbol.startswith("sh") or symbol.startswith("sz") else "其他"
-        }
-        
-        return basic_info
+        """获取股票基本信息（读取本地基本信息表，不请求上游）"""
+        return self.stock_metadata.get_basic(symbol)
     
     def get_stock_symbols(self, market="cn", exchange=None):
-        """获取股票代码列表"""
-        if market == "cn":
-            # 获取A股股票列表
-            stock_zh_a_spot_df = ak.stock_zh_a_spot_em()
-            
-            # 根据交易所筛选
-            if exchange:
-                if exchange.lower() == "shanghai" or exchange.lower() == "sh":
-                    # 上海交易所股票代码以6开头
-                    stock_zh_a_spot_df = stock_zh_a_spot_df[stock_zh_a_spot_df["代码"].str.startswith("6")]
-                elif exchange.lower() == "shenzhen" or exchange.lower() == "sz":
-                    # 深圳交易所股票代码以0或3开头
-                    stock_zh_a_spot_df = stock_zh_a_spot_df[stock_zh_a_spot_df["代码"].str.startswith(("0", "3"))]
-            
-            symbols = stock_zh_a_spot_df["代码"].tolist()
-        elif market == "hk":
-            # 获取港股股票列表
-            stock_hk_spot_df = ak.stock_hk_spot_em()
-            symbols = [f"hk{code}" for code in stock_hk_spot_df["代码"].tolist()]
-        elif market == "us":
-            # 获取美股股票列表
-            stock_us_spot_df = ak.stock_us_spot_em()
-            symbols = [code for code in stock_us_spot_df["代码"].tolist()]
-        else:
-            symbols = []
-        
-        return symbols[:200]  # 返回前200个股票代码
+        """获取股票代码列表（来自每个交易日刷新一次的本地索引）"""
+        return self.symbol_universe.symbols(market=market, exchange=exchange)
+    
+    def query_stock_symbols(self, market="cn", exchange=None, board=None, industry=None, keyword=None, offset=0, limit=None):
+        """按交易所、板块、行业、关键字过滤并分页查询股票列表"""
+        return self.symbol_universe.query(
+            market=market, exchange=exchange, board=board, industry=industry, keyword=keyword, offset=offset, limit=limit
+        )
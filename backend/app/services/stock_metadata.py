@@ -0,0 +1,148 @@
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from app.core.config import settings
+from app.services.symbol_universe import symbol_universe
+
+# 市场类型对应的显示名称
+MARKET_NAMES = {"cn": "A股", "hk": "港股", "us": "美股"}
+
+
+def metadata_key(symbol: str) -> str:
+    """元数据表的查找键：A股去掉 sh/sz/bj 前缀，港股统一为 hk+5位代码（00700、700.HK → hk00700），
+    美股去掉东方财富的市场编号（如 105.AAPL → aapl）"""
+    key = symbol.strip().lower()
+    if key[:2] in ("sh", "sz", "bj") and key[2:].isdigit():
+        return key[2:]
+    if key[:2] == "hk" and key[2:].isdigit():
+        return f"hk{key[2:].zfill(5)}"
+    if key.endswith(".hk") and key[:-3].isdigit():
+        return f"hk{key[:-3].zfill(5)}"
+    if len(key) == 5 and key.isdigit():
+        return f"hk{key}"
+    if "." in key and key.split(".", 1)[0].isdigit():
+        return key.split(".", 1)[1]
+    return key
+
+
+def _market_of(symbol: str) -> str:
+    """无元数据时按代码格式推断市场"""
+    key = metadata_key(symbol)
+    if key.startswith("hk"):
+        return "港股"
+    if key.isdigit():
+        return "A股"
+    return "其他"
+
+
+class StockMetadataTable:
+    """本地持久化的股票基本信息表（名称、行业、地区、市场）
+
+    由股票列表索引批量生成并定时刷新，按代码查找为一次字典访问，不再逐只请求上游。
+    """
+
+    def __init__(self, path: str, refresh_seconds: int, markets: List[str]):
+        self.path = path
+        self.refresh_seconds = refresh_seconds
+        self.markets = markets
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._table = {}
+        self._refreshed_at = 0.0
+        self._scheduler = None
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self._table = data["records"]
+            self._refreshed_at = data["refreshed_at"]
+        except Exception as e:
+            print(f"读取股票基本信息表失败，重新建立: {e}")
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"refreshed_at": self._refreshed_at, "records": self._table}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def refresh(self):
+        """按市场批量重建基本信息表；单个市场失败时保留该市场的旧记录"""
+        with self._refresh_lock:
+            self._rebuild()
+
+    def _rebuild(self):
+        with self._lock:
+            table = dict(self._table)
+        for market in self.markets:
+            try:
+                records = symbol_universe.get(market, wait_refresh=True).records
+            except Exception as e:
+                print(f"获取 {market} 股票列表失败，保留旧的基本信息: {e}")
+                continue
+            for record in records:
+                key = metadata_key(record["symbol"])
+                # 批量数据源不提供地区，保留已有记录中的地区
+                area = table.get(key, {}).get("area", "")
+                table[key] = {
+                    "name": record["name"],
+                    "industry": record.get("industry", ""),
+                    "area": area,
+                    "market": MARKET_NAMES.get(market, "其他"),
+                }
+        with self._lock:
+            self._table = table
+            self._refreshed_at = time.time()
+            self._save()
+        print(f"股票基本信息表已刷新，共 {len(table)} 条")
+
+    def start_scheduler(self):
+        """启动后台定时刷新（过期时立即刷新一次）"""
+        with self._lock:
+            if self._scheduler is not None:
+                return
+            self._scheduler = threading.Thread(target=self._run_scheduler, name="stock-metadata", daemon=True)
+        self._scheduler.start()
+
+    def _run_scheduler(self):
+        while True:
+            wait = self._refreshed_at + self.refresh_seconds - time.time()
+            if wait > 0:
+                time.sleep(wait)
+                continue
+            try:
+                with self._refresh_lock:
+                    if time.time() - self._refreshed_at >= self.refresh_seconds:
+                        self._rebuild()
+            except Exception as e:
+                print(f"定时刷新股票基本信息表失败: {e}")
+                time.sleep(min(self.refresh_seconds, 600))
+
+    def lookup(self, symbol: str) -> Optional[Dict[str, Any]]:
+        """按代码查找基本信息；从未建立过时在后台建立，建立完成前返回None（按未知代码处理）"""
+        if not self._refreshed_at:
+            self.start_scheduler()
+        with self._lock:
+            return self._table.get(metadata_key(symbol))
+
+    def get_basic(self, symbol: str) -> Dict[str, Any]:
+        """股票基本信息，表中没有的代码返回空名称并按代码格式推断市场"""
+        item = self.lookup(symbol)
+        if item is None:
+            return {"symbol": symbol, "name": "", "industry": "", "area": "", "market": _market_of(symbol)}
+        return {"symbol": symbol, **item}
+
+
+# 全局共享股票基本信息表
+stock_metadata = StockMetadataTable(
+    os.path.join(settings.DATA_DIR, "stock_metadata.json"),
+    settings.STOCK_METADATA_REFRESH_SECONDS,
+    settings.STOCK_METADATA_MARKETS,
+)
@@ -0,0 +1,69 @@
+import json
+import os
+import threading
+import time
+from typing import Optional, Tuple
+
+from app.core.config import settings
+
+
+class SymbolResolver:
+    """股票代码解析表：记录每个用户输入代码最近一次获取成功的 (数据源, 规范代码)
+
+    解析结果持久化到本地 JSON 文件，命中时直接使用对应数据源，
+    只有在该数据源失败或记录超过有效期时才重新遍历回退链。
+    """
+
+    def __init__(self, path: str, ttl_seconds: int):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._table = self._load()
+
+    def _load(self) -> dict:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"读取代码解析表失败，重新建立: {e}")
+            return {}
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._table, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def get(self, symbol: str) -> Optional[Tuple[str, str]]:
+        """返回已解析的 (数据源, 规范代码)，未解析或已过期时返回None"""
+        with self._lock:
+            item = self._table.get(symbol)
+        if item is None or time.time() - item["resolved_at"] > self.ttl_seconds:
+            return None
+        return item["provider"], item["code"]
+
+    def record(self, symbol: str, provider: str, code: str):
+        """记录获取成功的数据源和代码"""
+        with self._lock:
+            item = self._table.get(symbol)
+            if item and item["provider"] == provider and item["code"] == code \
+                    and time.time() - item["resolved_at"] <= self.ttl_seconds:
+                return
+            self._table[symbol] = {"provider": provider, "code": code, "resolved_at": time.time()}
+            self._save()
+
+    def invalidate(self, symbol: str):
+        """数据源失败时移除解析记录"""
+        with self._lock:
+            if self._table.pop(symbol, None) is not None:
+                self._save()
+
+
+# 全局共享解析表
+symbol_resolver = SymbolResolver(
+    os.path.join(settings.DATA_DIR, "symbol_resolution.json"),
+    settings.SYMBOL_RESOLUTION_TTL_SECONDS,
+)
@@ -0,0 +1,222 @@
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import akshare as ak
+import numpy as np
+
+from app.core.config import settings
+from app.services.offline_provider import data_provider, synthetic_universe
+from app.services.trading_calendar import latest_trading_day
+
+# 支持的市场：cn（A股）、hk（港股）、us（美股）
+MARKETS = ("cn", "hk", "us")
+# 建立二级索引的字段
+INDEX_FIELDS = ("exchange", "board", "industry")
+# 交易所参数的别名
+EXCHANGE_ALIASES = {"shanghai": "sh", "sse": "sh", "shenzhen": "sz", "szse": "sz", "beijing": "bj", "bse": "bj"}
+
+
+def classify_a_share(code: str) -> Tuple[str, str]:
+    """根据A股代码前缀判断 (交易所, 板块)：sh/sz/bj，main（主板）、star（科创板）、chinext（创业板）、bse（北交所）"""
+    if code.startswith("68"):
+        return "sh", "star"
+    if code.startswith("6"):
+        return "sh", "main"
+    if code.startswith("30"):
+        return "sz", "chinext"
+    if code.startswith(("0", "2")):
+        return "sz", "main"
+    return "bj", "bse"
+
+
+def _load_a_share_industries() -> Dict[str, str]:
+    """按行业板块成分股建立 代码→行业 映射，失败时返回已获取的部分"""
+    industries = {}
+    try:
+        boards = ak.stock_board_industry_name_em()
+    except Exception as e:
+        print(f"获取行业板块列表失败: {e}")
+        return industries
+    for board_name in boards["板块名称"].tolist():
+        try:
+            members = ak.stock_board_industry_cons_em(symbol=board_name)
+        except Exception as e:
+            print(f"获取行业 {board_name} 成分股失败: {e}")
+            continue
+        for code in members["代码"].tolist():
+            industries[str(code)] = board_name
+    return industries
+
+
+def _download_market(market: str) -> List[Dict[str, Any]]:
+    """从行情快照下载某个市场的完整股票列表"""
+    if data_provider.mode == "synthetic":
+        return synthetic_universe(market, settings.SYNTHETIC_UNIVERSE_SIZE, settings.PROVIDER_SEED)
+    if market == "cn":
+        spot_df = ak.stock_zh_a_spot_em()
+        industries = _load_a_share_industries() if settings.SYMBOL_UNIVERSE_INDUSTRY_ENABLED else {}
+        records = []
+        for code, name in zip(spot_df["代码"].astype(str), spot_df["名称"].astype(str)):
+            exchange, board = classify_a_share(code)
+            records.append({
+                "symbol": code, "name": name, "market": "cn", "exchange": exchange,
+                "board": board, "industry": industries.get(code, ""),
+            })
+        return records
+    if market == "hk":
+        spot_df = ak.stock_hk_spot_em()
+        return [
+            {"symbol": f"hk{code}", "name": name, "market": "hk", "exchange": "hk", "board": "main", "industry": ""}
+            for code, name in zip(spot_df["代码"].astype(str), spot_df["名称"].astype(str))
+        ]
+    if market == "us":
+        spot_df = ak.stock_us_spot_em()
+        return [
+            {"symbol": code, "name": name, "market": "us", "exchange": "us", "board": "main", "industry": ""}
+            for code, name in zip(spot_df["代码"].astype(str), spot_df["名称"].astype(str))
+        ]
+    raise ValueError(f"不支持的市场类型: {market}")
+
+
+class MarketIndex:
+    """单个市场的股票列表及按交易所、板块、行业建立的二级索引（值→记录位置数组）"""
+
+    def __init__(self, records: List[Dict[str, Any]], refreshed_on: str):
+        self.records = records
+        self.refreshed_on = refreshed_on
+        self.indexes = {}
+        for field in INDEX_FIELDS:
+            positions = {}
+            for i, record in enumerate(records):
+                positions.setdefault(record.get(field, ""), []).append(i)
+            self.indexes[field] = {value: np.array(items, dtype=np.int64) for value, items in positions.items()}
+
+    def positions(self, filters: Dict[str, Optional[str]]) -> np.ndarray:
+        """按过滤条件求记录位置的交集"""
+        result = None
+        for field, value in filters.items():
+            if not value:
+                continue
+            matched = self.indexes[field].get(value, np.array([], dtype=np.int64))
+            result = matched if result is None else np.intersect1d(result, matched, assume_unique=True)
+        return np.arange(len(self.records)) if result is None else result
+
+
+class SymbolUniverse:
+    """本地持久化的股票全集索引，每个交易日从上游刷新一次
+
+    请求只读取内存中的索引；索引过期时在后台刷新，只有首次（本地无数据）时同步下载。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        # 首次同步下载时避免并发请求重复下载
+        self._download_lock = threading.Lock()
+        self._refreshing = set()
+        self._markets = {}
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            for market, item in data.items():
+                self._markets[market] = MarketIndex(item["records"], item["refreshed_on"])
+        except Exception as e:
+            print(f"读取股票列表索引失败，重新建立: {e}")
+            self._markets = {}
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        data = {
+            market: {"refreshed_on": index.refreshed_on, "records": index.records}
+            for market, index in self._markets.items()
+        }
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def refresh(self, market: str) -> MarketIndex:
+        """从上游重新下载某个市场的股票列表并写入本地"""
+        records = _download_market(market)
+        index = MarketIndex(records, latest_trading_day(market))
+        with self._lock:
+            self._markets[market] = index
+            self._save()
+        print(f"股票列表索引已刷新: {market}，共 {len(records)} 只")
+        return index
+
+    def _refresh_in_background(self, market: str):
+        with self._lock:
+            if market in self._refreshing:
+                return
+            self._refreshing.add(market)
+
+        def run():
+            try:
+                self.refresh(market)
+            except Exception as e:
+                print(f"后台刷新股票列表索引失败，继续使用旧索引: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(market)
+
+        threading.Thread(target=run, name=f"universe-{market}", daemon=True).start()
+
+    def get(self, market: str, wait_refresh: bool = False) -> MarketIndex:
+        """获取某个市场的索引，本地无数据时同步下载，过期时返回旧索引并在后台刷新
+
+        wait_refresh 为 True 时过期索引同步刷新（用于本身已在后台运行的任务）。
+        """
+        with self._lock:
+            index = self._markets.get(market)
+        if index is None:
+            with self._download_lock:
+                index = self._markets.get(market)
+                if index is None:
+                    return self.refresh(market)
+        if index.refreshed_on < latest_trading_day(market):
+            if wait_refresh:
+                return self.refresh(market)
+            self._refresh_in_background(market)
+        return index
+
+    @staticmethod
+    def _exchange_filter(market: str, index: MarketIndex, exchange: Optional[str]) -> Optional[str]:
+        """交易所过滤值：港股、美股列表不区分交易所（如 hkex、nasdaq）时忽略；A股不认识的交易所也忽略，不返回空列表"""
+        if not exchange or market != "cn":
+            return None
+        exchange = EXCHANGE_ALIASES.get(exchange.lower(), exchange.lower())
+        if exchange not in index.indexes["exchange"]:
+            print(f"未知的交易所 {exchange}，按全部 {market} 股票处理")
+            return None
+        return exchange
+
+    def query(self, market: str = "cn", exchange: str = None, board: str = None, industry: str = None,
+              keyword: str = None, offset: int = 0, limit: int = None) -> Dict[str, Any]:
+        """按条件过滤并分页，返回 {total, items, refreshed_on}"""
+        index = self.get(market)
+        exchange = self._exchange_filter(market, index, exchange)
+        positions = index.positions({"exchange": exchange, "board": board, "industry": industry})
+        records = [index.records[i] for i in positions]
+        if keyword:
+            keyword = keyword.lower()
+            records = [r for r in records if keyword in r["symbol"].lower() or keyword in r["name"].lower()]
+        end = None if limit is None else offset + limit
+        return {"total": len(records), "items": records[offset:end], "refreshed_on": index.refreshed_on}
+
+    def symbols(self, market: str = "cn", exchange: str = None) -> List[str]:
+        """某个市场（可按交易所过滤）的全部股票代码"""
+        if market not in MARKETS:
+            return []
+        return [item["symbol"] for item in self.query(market, exchange=exchange)["items"]]
+
+
+# 全局共享股票列表索引
+symbol_universe = SymbolUniverse(os.path.join(settings.DATA_DIR, "symbol_universe.json"))
@@ -0,0 +1,203 @@
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Dict
+from zoneinfo import ZoneInfo
+
+import akshare as ak
+import numpy as np
+
+from app.core.config import settings
+from app.services.offline_provider import data_provider
+from app.services.ohlcv import date_to_ordinal, ordinals_to_strings
+
+# 港股、美股交易日历在 exchange_calendars 中的交易所代码（可选依赖）
+EXCHANGE_CODES = {"hk": "XHKG", "us": "XNYS"}
+# 各市场交易所所在时区，用于换算收盘时刻
+MARKET_TIMEZONES = {"cn": "Asia/Shanghai", "hk": "Asia/Hong_Kong", "us": "America/New_York"}
+
+
+def _today() -> str:
+    return datetime.now().strftime("%Y-%m-%d")
+
+
+def _busdays(start: int, end: int) -> np.ndarray:
+    """[start, end] 内的工作日（天数）"""
+    if end < start:
+        return np.array([], dtype=np.int32)
+    days = np.arange(start, end + 1, dtype=np.int64)
+    return days[np.is_busday(days.astype("datetime64[D]"))].astype(np.int32)
+
+
+class TradingCalendar:
+    """某个市场的交易日索引：覆盖区间 [valid_from, valid_until] 内使用交易所日历，区间外按工作日推断
+
+    日期均为自1970-01-01起的天数，查询都是对有序数组的二分查找或集合运算。
+    """
+    __slots__ = ("market", "sessions", "valid_from", "valid_until", "source", "refreshed_on")
+
+    def __init__(self, market: str, sessions, valid_from: int, valid_until: int, source: str, refreshed_on: str):
+        self.market = market
+        self.sessions = np.asarray(sessions, dtype=np.int32)
+        self.valid_from = valid_from
+        self.valid_until = valid_until
+        self.source = source
+        self.refreshed_on = refreshed_on
+
+    @classmethod
+    def weekdays(cls, market: str) -> "TradingCalendar":
+        """没有交易所日历时的退化日历：所有工作日都视为交易日"""
+        return cls(market, [], 0, -1, "weekday", _today())
+
+    def sessions_between(self, start: int, end: int) -> np.ndarray:
+        """[start, end] 内的交易日"""
+        lo = int(np.searchsorted(self.sessions, start, side="left"))
+        hi = int(np.searchsorted(self.sessions, end, side="right"))
+        parts = [self.sessions[lo:hi]]
+        if start < self.valid_from:
+            parts.insert(0, _busdays(start, min(end, self.valid_from - 1)))
+        if end > self.valid_until:
+            parts.append(_busdays(max(start, self.valid_until + 1), end))
+        return np.concatenate(parts)
+
+    def is_session(self, dates: np.ndarray) -> np.ndarray:
+        """逐个判断是否为交易日"""
+        dates = np.asarray(dates, dtype=np.int32)
+        inside = (dates >= self.valid_from) & (dates <= self.valid_until)
+        positions = np.minimum(np.searchsorted(self.sessions, dates), max(len(self.sessions) - 1, 0))
+        known = self.sessions[positions] == dates if len(self.sessions) else np.zeros(len(dates), dtype=bool)
+        return np.where(inside, known, np.is_busday(dates.astype("datetime64[D]")))
+
+    def has_sessions(self, start_date: str, end_date: str) -> bool:
+        """日期区间（含首尾）内是否有交易日"""
+        if end_date < start_date:
+            return False
+        return len(self.sessions_between(date_to_ordinal(start_date), date_to_ordinal(end_date))) > 0
+
+    def last_session(self, on: str = None) -> str:
+        """不晚于 on（默认今天）的最近一个交易日"""
+        end = date_to_ordinal(on or _today())
+        start = end - 30
+        sessions = self.sessions_between(start, end)
+        while not len(sessions):
+            start, end = start - 365, start - 1
+            sessions = self.sessions_between(start, end)
+        return str(ordinals_to_strings(sessions[-1:])[0])
+
+    def session_close(self, date: str) -> float:
+        """该交易日收盘并结算完成的时刻（时间戳），未配置收盘时间的市场按当天结束计"""
+        close = settings.MARKET_CLOSE_TIMES.get(self.market, "23:59")
+        at = datetime.strptime(f"{date} {close}", "%Y-%m-%d %H:%M")
+        at = at.replace(tzinfo=ZoneInfo(MARKET_TIMEZONES.get(self.market, "Asia/Shanghai")))
+        return at.timestamp() + settings.MARKET_CLOSE_SETTLE_SECONDS
+
+    def missing_sessions(self, dates: np.ndarray, start_date: str, end_date: str) -> np.ndarray:
+        """区间内缺少K线的交易日：交易日集合与已有日期的差集"""
+        sessions = self.sessions_between(date_to_ordinal(start_date), date_to_ordinal(end_date))
+        return np.setdiff1d(sessions, dates, assume_unique=True)
+
+    def to_dict(self) -> Dict:
+        return {
+            "sessions": self.sessions.tolist(),
+            "valid_from": self.valid_from,
+            "valid_until": self.valid_until,
+            "source": self.source,
+            "refreshed_on": self.refreshed_on,
+        }
+
+
+def _download_calendar(market: str) -> TradingCalendar:
+    """下载交易所日历：A股使用新浪交易日历，港股/美股使用可选依赖 exchange_calendars"""
+    if market == "cn":
+        dates = ak.tool_trade_date_hist_sina()["trade_date"].astype(str)
+        sessions = np.unique(np.array([date_to_ordinal(date) for date in dates], dtype=np.int32))
+        return TradingCalendar(market, sessions, int(sessions[0]), int(sessions[-1]), "sina", _today())
+    if market in EXCHANGE_CODES:
+        try:
+            import exchange_calendars
+        except ImportError:
+            raise RuntimeError(f"获取 {market} 交易日历需要安装可选依赖 exchange_calendars")
+        calendar = exchange_calendars.get_calendar(EXCHANGE_CODES[market])
+        sessions = calendar.sessions.values.astype("datetime64[D]").astype(np.int32)
+        return TradingCalendar(market, sessions, int(sessions[0]), int(sessions[-1]), "exchange_calendars", _today())
+    raise ValueError(f"不支持的市场类型: {market}")
+
+
+class TradingCalendarIndex:
+    """本地持久化的各市场交易日历，按 TRADING_CALENDAR_REFRESH_DAYS 定期更新
+
+    获取失败时当天退化为工作日日历（不写入本地），次日再尝试。
+    """
+
+    def __init__(self, path: str, refresh_days: int):
+        self.path = path
+        self.refresh_days = refresh_days
+        self._lock = threading.Lock()
+        self._calendars = {}
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            for market, item in data.items():
+                self._calendars[market] = TradingCalendar(
+                    market, item["sessions"], item["valid_from"], item["valid_until"], item["source"], item["refreshed_on"]
+                )
+        except Exception as e:
+            print(f"读取交易日历失败，重新获取: {e}")
+            self._calendars = {}
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        data = {market: calendar.to_dict() for market, calendar in self._calendars.items() if calendar.source != "weekday"}
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+
+    def _expired(self, calendar: TradingCalendar) -> bool:
+        # 当天已更新或尝试过
+        if calendar.refreshed_on >= _today():
+            return False
+        if calendar.source == "weekday" or date_to_ordinal(_today()) > calendar.valid_until:
+            return True
+        refreshed = datetime.strptime(calendar.refreshed_on, "%Y-%m-%d")
+        return datetime.now() - refreshed > timedelta(days=self.refresh_days)
+
+    def get(self, market: str) -> TradingCalendar:
+        """获取某个市场的交易日历，本地没有或已过期时同步更新"""
+        if data_provider.mode == "synthetic" or market not in ("cn",) + tuple(EXCHANGE_CODES):
+            # 模拟数据按工作日生成；其他市场没有可用的交易所日历
+            return TradingCalendar.weekdays(market)
+        with self._lock:
+            calendar = self._calendars.get(market)
+            if calendar is not None and not self._expired(calendar):
+                return calendar
+            try:
+                calendar = _download_calendar(market)
+                print(f"交易日历已更新: {market}，共 {len(calendar.sessions)} 个交易日")
+            except Exception as e:
+                print(f"获取 {market} 交易日历失败，按工作日推断: {e}")
+                if calendar is None or calendar.source == "weekday":
+                    calendar = TradingCalendar.weekdays(market)
+                else:
+                    # 保留旧日历，当天不再重试
+                    calendar.refreshed_on = _today()
+            self._calendars[market] = calendar
+            self._save()
+            return calendar
+
+
+def latest_trading_day(market: str = "cn") -> str:
+    """某个市场最近一个交易日（含今天）"""
+    return trading_calendars.get(market).last_session()
+
+
+# 全局共享交易日历
+trading_calendars = TradingCalendarIndex(
+    os.path.join(settings.DATA_DIR, "trading_calendar.json"), settings.TRADING_CALENDAR_REFRESH_DAYS
+)
@@ -0,0 +1,264 @@
+import json
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.ohlcv import date_to_ordinal, ordinals_to_strings
+from app.services.symbol_universe import symbol_universe
+from app.services.trading_calendar import trading_calendars
+
+# 面板包含的字段（与 OHLCVSeries 属性同名），均为 float64，缺失（停牌、未上市）为 NaN
+PANEL_FIELDS = ("open", "high", "low", "close", "volume", "turnover")
+# 指向当前版本的文件名；构建完成后原子替换，各进程据此切换到新版本
+CURRENT_FILE = "current.json"
+LOCK_FILE = "build.lock"
+
+
+class UniversePanel:
+    """某个市场的 股票×交易日 面板，每个字段一个二维数组（行对应 symbols，列对应 dates）
+
+    从磁盘以只读内存映射方式打开，多个进程共享同一份页缓存，不复制数据。
+    """
+    __slots__ = ("market", "symbols", "dates", "fields", "built_at", "version", "_positions")
+
+    def __init__(self, market: str, symbols: np.ndarray, dates: np.ndarray, fields: Dict[str, np.ndarray],
+                 built_at: float, version: str):
+        self.market = market
+        self.symbols = symbols
+        self.dates = dates
+        self.fields = fields
+        self.built_at = built_at
+        self.version = version
+        self._positions = None
+
+    @classmethod
+    def open(cls, market: str, directory: str, meta: Dict[str, Any]) -> "UniversePanel":
+        fields = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r") for name in PANEL_FIELDS}
+        return cls(
+            market,
+            np.load(os.path.join(directory, "symbols.npy")),
+            np.load(os.path.join(directory, "dates.npy")),
+            fields,
+            meta["built_at"],
+            meta["version"],
+        )
+
+    @property
+    def shape(self):
+        return len(self.symbols), len(self.dates)
+
+    def __getitem__(self, field: str) -> np.ndarray:
+        return self.fields[field]
+
+    def date_strings(self) -> np.ndarray:
+        return ordinals_to_strings(self.dates)
+
+    def rows(self, symbols: List[str]) -> np.ndarray:
+        """股票代码对应的行号，面板中没有的代码为 -1"""
+        if self._positions is None:
+            self._positions = {symbol: i for i, symbol in enumerate(self.symbols.tolist())}
+        return np.array([self._positions.get(symbol, -1) for symbol in symbols], dtype=np.int64)
+
+    def columns_until(self, end_date: Optional[str]) -> int:
+        """截止到 end_date（含）的列数"""
+        if not end_date:
+            return len(self.dates)
+        return int(np.searchsorted(self.dates, date_to_ordinal(end_date), side="right"))
+
+    def info(self) -> Dict[str, Any]:
+        dates = self.date_strings()
+        return {
+            "market": self.market,
+            "version": self.version,
+            "symbols": len(self.symbols),
+            "dates": len(self.dates),
+            "start_date": str(dates[0]) if len(dates) else None,
+            "end_date": str(dates[-1]) if len(dates) else None,
+            "built_at": self.built_at,
+            "fields": list(PANEL_FIELDS),
+        }
+
+
+class UniversePanelStore:
+    """按市场保存的面板：每天由本地历史数据（前复权）构建一次，写入 DATA_DIR/panel/<市场>/<版本>/
+
+    构建使用跨进程的锁文件，多个 uvicorn 进程中只有一个执行构建；读取时检查 current.json，
+    其他进程构建出新版本后自动切换映射。
+    """
+
+    def __init__(self, base_dir: str, lookback_days: int, build_after: str):
+        self.base_dir = base_dir
+        self.lookback_days = lookback_days
+        self.build_after = build_after
+        self._panels = {}
+        self._lock = threading.Lock()
+        self._building = set()
+        self._scheduler = None
+
+    def _market_dir(self, market: str) -> str:
+        return os.path.join(self.base_dir, market)
+
+    def _read_current(self, market: str) -> Optional[Dict[str, Any]]:
+        path = os.path.join(self._market_dir(market), CURRENT_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def get(self, market: str) -> Optional[UniversePanel]:
+        """当前版本的面板，尚未构建时返回None"""
+        meta = self._read_current(market)
+        if meta is None:
+            return None
+        with self._lock:
+            panel = self._panels.get(market)
+            if panel is None or panel.version != meta["version"]:
+                panel = UniversePanel.open(market, os.path.join(self._market_dir(market), meta["version"]), meta)
+                self._panels[market] = panel
+            return panel
+
+    def target_date(self, market: str) -> str:
+        """应当包含的最后一个交易日：当天收盘后（build_after 之后）才包含当天"""
+        calendar = trading_calendars.get(market)
+        latest = calendar.last_session()
+        now = datetime.now()
+        if latest == now.strftime("%Y-%m-%d") and now.strftime("%H:%M") < self.build_after:
+            latest = calendar.last_session(str(np.datetime64(latest) - np.timedelta64(1, "D")))
+        return latest
+
+    def is_stale(self, market: str) -> bool:
+        meta = self._read_current(market)
+        return meta is None or meta["end_date"] < self.target_date(market)
+
+    def _acquire_build_lock(self, market: str) -> bool:
+        """跨进程构建锁：锁文件存在且未超时时说明其他进程正在构建"""
+        os.makedirs(self._market_dir(market), exist_ok=True)
+        path = os.path.join(self._market_dir(market), LOCK_FILE)
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            if time.time() - os.path.getmtime(path) < settings.PANEL_BUILD_TIMEOUT_SECONDS:
+                return False
+            # 上次构建的进程异常退出，接管锁
+            os.remove(path)
+            return self._acquire_build_lock(market)
+        with os.fdopen(fd, "w") as f:
+            f.write(str(os.getpid()))
+        return True
+
+    def build(self, market: str, load_series) -> Optional[UniversePanel]:
+        """构建一个新版本；load_series(symbol, start_date, end_date) 返回该股票的前复权K线（OHLCVSeries）
+
+        其他进程正在构建时直接返回None。
+        """
+        if not self._acquire_build_lock(market):
+            print(f"面板 {market} 正由其他进程构建，跳过")
+            return None
+        try:
+            return self._build(market, load_series)
+        finally:
+            os.remove(os.path.join(self._market_dir(market), LOCK_FILE))
+
+    def _build(self, market: str, load_series) -> UniversePanel:
+        started = time.time()
+        calendar = trading_calendars.get(market)
+        end_date = self.target_date(market)
+        end = date_to_ordinal(end_date)
+        # 交易日约占自然日的七成，多取一些自然日再截取
+        dates = calendar.sessions_between(end - self.lookback_days * 2 - 30, end)[-self.lookback_days:]
+        start_date = str(ordinals_to_strings(dates[:1])[0])
+        symbols = symbol_universe.symbols(market)
+        arrays = {name: np.full((len(symbols), len(dates)), np.nan) for name in PANEL_FIELDS}
+
+        def fill(row: int):
+            try:
+                series = load_series(symbols[row], start_date, end_date)
+            except Exception as e:
+                print(f"面板 {market} 获取 {symbols[row]} 失败，该行留空: {e}")
+                return False
+            positions = np.searchsorted(dates, series.dates)
+            valid = positions < len(dates)
+            valid[valid] &= dates[positions[valid]] == series.dates[valid]
+            for name in PANEL_FIELDS:
+                arrays[name][row, positions[valid]] = getattr(series, name)[valid]
+            return True
+
+        with ThreadPoolExecutor(max_workers=settings.HISTORY_BATCH_CONCURRENCY) as pool:
+            loaded = sum(pool.map(fill, range(len(symbols))))
+
+        version = datetime.now().strftime("%Y%m%d%H%M%S")
+        directory = os.path.join(self._market_dir(market), version)
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, "symbols.npy"), np.array(symbols, dtype=str))
+        np.save(os.path.join(directory, "dates.npy"), dates)
+        for name, array in arrays.items():
+            np.save(os.path.join(directory, f"{name}.npy"), array)
+        meta = {"version": version, "built_at": time.time(), "start_date": start_date, "end_date": end_date}
+        current = os.path.join(self._market_dir(market), CURRENT_FILE)
+        with open(f"{current}.tmp", "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        previous = self._read_current(market)
+        os.replace(f"{current}.tmp", current)
+        # 保留上一个版本：其他进程可能刚读到旧的 current.json，尚未完成映射
+        keep = (version, previous["version"]) if previous else (version,)
+        self._remove_old_versions(market, keep=keep)
+        print(f"面板 {market} 已构建：{loaded}/{len(symbols)} 只股票 × {len(dates)} 个交易日，耗时 {time.time() - started:.1f} 秒")
+        return self.get(market)
+
+    def _remove_old_versions(self, market: str, keep):
+        """删除 keep 以外的版本（其他进程已映射的文件在关闭前仍可读取）"""
+        market_dir = self._market_dir(market)
+        for name in os.listdir(market_dir):
+            path = os.path.join(market_dir, name)
+            if os.path.isdir(path) and name not in keep:
+                shutil.rmtree(path, ignore_errors=True)
+
+    def build_in_background(self, market: str, load_series) -> bool:
+        """在后台线程构建，本进程已在构建时返回False"""
+        with self._lock:
+            if market in self._building:
+                return False
+            self._building.add(market)
+
+        def run():
+            try:
+                self.build(market, load_series)
+            except Exception as e:
+                print(f"构建面板 {market} 失败: {e}")
+            finally:
+                with self._lock:
+                    self._building.discard(market)
+
+        threading.Thread(target=run, name=f"panel-{market}", daemon=True).start()
+        return True
+
+    def start_scheduler(self, markets: List[str], load_series):
+        """启动后台定时构建：每隔一段时间检查，面板未包含最近收盘的交易日时重新构建"""
+        if self._scheduler is not None:
+            return
+
+        def run():
+            while True:
+                for market in markets:
+                    try:
+                        if self.is_stale(market):
+                            self.build(market, load_series)
+                    except Exception as e:
+                        print(f"定时构建面板 {market} 失败: {e}")
+                time.sleep(settings.PANEL_CHECK_INTERVAL_SECONDS)
+
+        self._scheduler = threading.Thread(target=run, name="universe-panel", daemon=True)
+        self._scheduler.start()
+
+
+# 全局共享面板存储
+universe_panels = UniversePanelStore(
+    os.path.join(settings.DATA_DIR, "panel"), settings.PANEL_LOOKBACK_DAYS, settings.PANEL_BUILD_AFTER
+)
@@ -2,6 +2,8 @@ from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from app.api import router as api_router
 from app.core.config import settings
+from app.services.stock_metadata import stock_metadata
+from app.services.market_analytics_service import MarketAnalyticsService
 from fastapi.exceptions import RequestValidationError
 from fastapi.responses import JSONResponse
 import logging
@@ -43,6 +45,14 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
 # 注册路由
 app.include_router(api_router, prefix=settings.API_V1_STR)
 
+@app.on_event("startup")
+def start_background_jobs():
+    # 定时刷新股票基本信息表
+    stock_metadata.start_scheduler()
+    # 每日构建全市场面板
+    if settings.PANEL_SCHEDULE_ENABLED:
+        MarketAnalyticsService().start_panel_scheduler()
+
 @app.get("/")
 def root():
     return {
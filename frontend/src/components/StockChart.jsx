@@ -19,7 +19,9 @@ const StockChart = ({ stock, onAnalysis, analysisResult }) => {
     setError(null)
     try {
       console.log('开始加载股票数据:', symbol)
-      const data = await fetchStockHistory(symbol)
+      // 按图表宽度请求K线数量（每根K线约3像素），全量历史由后端聚合为周线/月线
+      const chartWidth = chartContainerRef.current?.clientWidth || 900
+      const data = await fetchStockHistory(symbol, { max_points: Math.max(100, Math.floor(chartWidth / 3)) })
       console.log('获取到股票数据:', data)
       setStockData(data)
     } catch (err) {
@@ -49,6 +51,17 @@ const StockChart = ({ stock, onAnalysis, analysisResult }) => {
     return adjustMap[adjust] || adjust
   }
 
+  // 获取K线周期的中文名称
+  const resolutionNames = {
+    'day': '日K线图',
+    'lttb': '日K线图（抽样）',
+    'week': '周K线图',
+    'month': '月K线图',
+    'quarter': '季K线图',
+    'year': '年K线图'
+  }
+  const isDaily = () => !stockData?.resolution || stockData.resolution === 'day'
+
   // 生成图表配置
   const generateChartOption = () => {
     if (!stockData || !stockData.data || stockData.data.length === 0) {
@@ -79,6 +92,8 @@ const StockChart = ({ stock, onAnalysis, analysisResult }) => {
 
     // 准备日期数据
     const dates = stockData.data.map(item => item.date)
+    // 日K线默认显示最近一年，聚合后的周/月线默认显示全部
+    const zoomStart = isDaily() ? Math.max(0, 100 - (365 / (stockData.data.length || 1)) * 100) : 0
 
     // 准备成交量数据
     const volumeData = stockData.data.map(item => {
@@ -307,7 +322,7 @@ const StockChart = ({ stock, onAnalysis, analysisResult }) => {
         {
           type: 'inside',
           xAxisIndex: [0, 1, 2],
-          start: Math.max(0, 100 - (365 / (stockData.data.length || 1)) * 100),
+          start: zoomStart,
           end: 100
         },
         {
@@ -315,7 +330,7 @@ const StockChart = ({ stock, onAnalysis, analysisResult }) => {
           xAxisIndex: [0, 1, 2],
           type: 'slider',
           bottom: '5%',
-          start: Math.max(0, 100 - (365 / (stockData.data.length || 1)) * 100),
+          start: zoomStart,
           end: 100,
           backgroundColor: 'rgba(255, 255, 255, 0.1)',
           borderColor: 'rgba(255, 255, 255, 0.2)',
@@ -501,7 +516,7 @@ const StockChart = ({ stock, onAnalysis, analysisResult }) => {
         <h3>{stock?.name} ({stock?.symbol}) - K线图</h3>
         <div className="chart-meta">
           <span className="meta-item">复权类型: {getAdjustName()}</span>
-          <span className="meta-item">日K线图</span>
+          <span className="meta-item">{resolutionNames[stockData?.resolution] || '日K线图'}</span>
         </div>
       </div>
       <div className="chart-wrapper">
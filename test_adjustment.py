@@ -0,0 +1,92 @@
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+# 直接测试后端的除权除息事件表，不需要启动服务；本地数据写到临时目录
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+os.environ.setdefault("DATA_DIR", tempfile.mkdtemp())
+
+from app.services.history_store import HistoryStore  # noqa: E402
+from app.services.ohlcv import OHLCVSeries, date_to_ordinal, ordinals_to_strings  # noqa: E402
+
+START = date_to_ordinal("2024-01-01")
+# 每天一根K线，收盘价依次为 10.0, 10.1, ...；DIVIDEND_DAY 当天除息，前收盘参考价为上一日收盘价的 0.95
+RATIO = 0.95
+
+
+def make_bars(first: int, last: int):
+    """第 first~last 天的不复权K线及其前收盘参考价（均无除权除息）"""
+    days = np.arange(first, last + 1)
+    close = 10.0 + days * 0.1
+    series = OHLCVSeries(START + days, close, close, close, close, np.full(len(days), 1000.0), np.ones(len(days)))
+    prev_close = 10.0 + (days - 1) * 0.1
+    return series, prev_close
+
+
+def with_dividend(series, prev_close, day: int):
+    """在第 day 天加入一次除息：当天前收盘参考价变为上一日收盘价的 RATIO 倍"""
+    prev_close = prev_close.copy()
+    prev_close[np.searchsorted(series.dates, START + day)] = (10.0 + (day - 1) * 0.1) * RATIO
+    return prev_close
+
+
+def date(day: int) -> str:
+    return str(ordinals_to_strings(np.array([START + day]))[0])
+
+
+def fill(entry, series, prev_close, start: str, end: str):
+    """模拟向上游补齐 [start, end]：只合并该区间内的K线"""
+    window = series.slice(start, end)
+    lo = int(np.searchsorted(series.dates, window.dates[0]))
+    return HistoryStore.merge(entry, window, start, end, prev_close[lo:lo + len(window)])
+
+
+def check_event(entry, day: int):
+    assert entry.factors.dates.tolist() == [START + day], entry.factors.dates
+    assert np.isclose(entry.factors.ratios[0], RATIO)
+    # 前复权：除息日之前的价格乘以比例，之后不变；后复权：除息日及之后的价格除以比例
+    qfq = entry.factors.apply(entry.series, "qfq")
+    hfq = entry.factors.apply(entry.series, "hfq")
+    before = entry.series.dates < START + day
+    assert np.allclose(qfq.close[before], np.round(entry.series.close[before] * RATIO, 4))
+    assert np.allclose(qfq.close[~before], entry.series.close[~before])
+    assert np.allclose(hfq.close[~before], np.round(entry.series.close[~before] / RATIO, 4))
+
+
+def test_dividend_at_head_boundary():
+    """向前补齐头部时，原第一根K线当天的除息也能识别"""
+    series, prev_close = make_bars(0, 30)
+    prev_close = with_dividend(series, prev_close, 15)
+    entry = fill(None, series, prev_close, date(15), date(30))
+    assert len(entry.factors) == 0
+
+    ranges = HistoryStore.missing_ranges(entry, date(0), date(30))
+    assert ranges == [(date(0), date(15))], ranges
+    entry = fill(entry, series, prev_close, *ranges[0])
+    check_event(entry, 15)
+
+
+def test_dividend_in_middle():
+    series, prev_close = make_bars(0, 30)
+    entry = fill(None, series, prev_close, date(0), date(30))
+    assert len(entry.factors) == 0
+    entry = fill(None, series, with_dividend(series, prev_close, 12), date(0), date(30))
+    check_event(entry, 12)
+
+
+def test_dividend_at_tail():
+    """尾部新K线的除息相对已保存的最后一根K线识别"""
+    series, prev_close = make_bars(0, 30)
+    prev_close = with_dividend(series, prev_close, 21)
+    entry = fill(None, series, prev_close, date(0), date(20))
+    entry = fill(entry, series, prev_close, date(20), date(30))
+    check_event(entry, 21)
+
+
+if __name__ == "__main__":
+    test_dividend_at_head_boundary()
+    test_dividend_in_middle()
+    test_dividend_at_tail()
+    print("除权除息事件表测试通过")